@@ -1,27 +1,216 @@
 # inventory/admin.py
 
 from django.contrib import admin
-from .models import Phone, Platform, Listing, Brand, Query
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.core.paginator import Paginator
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .forms import BulkStockForm
+from .models import (
+    Phone, Platform, PlatformConditionMapping, Listing, Brand, Query, Order, Review, Cart, CartItem, HomePageImage,
+    BulkJob, Job,
+)
+from . import bulkjobs, database, images, jobs, search
+
+# Filtered changelists are counted up to this many rows; pages past it aren't linked.
+COUNT_LIMIT = 10000
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts an unfiltered changelist from the table's size (database.estimated_count) and a
+    filtered one only up to COUNT_LIMIT rows, instead of a COUNT(*) over millions of rows on
+    every page.
+    """
+    @cached_property
+    def count(self):
+        estimate = database.estimated_count(self.object_list)
+        if estimate is not None:
+            return estimate
+        return self.object_list.order_by()[:COUNT_LIMIT].count()
+
+class RangeListFilter(admin.SimpleListFilter):
+    """
+    Filters field by fixed ranges, (parameter value, label, minimum, maximum) with the
+    maximum excluded and None for no bound, rather than one choice per distinct value.
+    """
+    field = None
+    ranges = ()
+
+    def lookups(self, request, model_admin):
+        return [(value, label) for value, label, _, _ in self.ranges]
+
+    def queryset(self, request, queryset):
+        for value, _, minimum, maximum in self.ranges:
+            if self.value() == value:
+                if minimum is not None:
+                    queryset = queryset.filter(**{f'{self.field}__gte': minimum})
+                if maximum is not None:
+                    queryset = queryset.filter(**{f'{self.field}__lt': maximum})
+        return queryset
+
+class StockRangeFilter(RangeListFilter):
+    title = 'stock'
+    parameter_name = 'stock_range'
+    field = 'stock'
+    ranges = (
+        ('out', 'Out of stock', None, 1),
+        ('1-5', '1 to 5', 1, 6),
+        ('6-20', '6 to 20', 6, 21),
+        ('21+', 'More than 20', 21, None),
+    )
+
+class PriceRangeFilter(RangeListFilter):
+    title = 'price'
+    parameter_name = 'price_range'
+    field = 'base_price'
+    ranges = (
+        ('0-100', 'Under $100', None, 100),
+        ('100-300', '$100 to $300', 100, 300),
+        ('300-600', '$300 to $600', 300, 600),
+        ('600+', '$600 and over', 600, None),
+    )
+
+class PlatformPriceRangeFilter(PriceRangeFilter):
+    field = 'platform_price'
+
+class ConditionCategoryFilter(admin.SimpleListFilter):
+    # The categories come from the condition mappings rather than a DISTINCT over every listing.
+    title = 'platform condition category'
+    parameter_name = 'platform_condition_category'
+
+    def lookups(self, request, model_admin):
+        categories = (
+            PlatformConditionMapping.objects.order_by('platform_category')
+            .values_list('platform_category', flat=True).distinct()
+        )
+        return [(category, category) for category in categories]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(platform_condition_category=self.value())
+        return queryset
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Admin for tables with millions of rows: no full COUNT(*) per page, and bulk actions
+    queued as background jobs (inventory/bulkjobs.py) instead of run in the request.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('delete_in_background',)
+
+    def get_actions(self, request):
+        # delete_selected loads every selected row and its related rows into the request.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def queue_job(self, request, queryset, action, description, params=None):
+        changelist = None
+        if request.POST.get('select_across') == '1':
+            description += ' (all matching)'
+            changelist = request.GET.urlencode()
+        else:
+            description += f" ({len(request.POST.getlist(ACTION_CHECKBOX_NAME))} selected)"
+        job = bulkjobs.queue(queryset, action, description, params, user=request.user, changelist=changelist)
+        self.message_user(request, format_html(
+            'Queued "{}"; <a href="{}">follow its progress</a>.',
+            description, reverse('admin:inventory_bulkjob_change', args=[job.pk]),
+        ))
+
+    @admin.action(description='Delete selected %(verbose_name_plural)s in the background', permissions=('delete',))
+    def delete_in_background(self, request, queryset):
+        self.queue_job(request, queryset, 'delete', f'Delete {self.opts.verbose_name_plural}')
 
 @admin.register(Phone)
-class PhoneAdmin(admin.ModelAdmin):
-    list_display = ('name', 'base_price', 'condition', 'stock')
-    search_fields = ('name', 'condition')
-    list_filter = ('condition', 'stock')
+class PhoneAdmin(LargeTableAdmin):
+    list_display = ('name', 'brand', 'base_price', 'condition', 'stock')
+    search_fields = ('name', 'brand__name', 'color', 'camera_quality')
+    list_filter = ('condition', StockRangeFilter, PriceRangeFilter)
+    list_select_related = ('brand',)
+    autocomplete_fields = ('brand',)
     ordering = ('name',)
+    actions = ('set_stock', 'relist', 'delete_in_background')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Served from the FTS5 index (inventory/search.py) instead of LIKE '%term%' scans
+        if not search_term:
+            return queryset, False
+        return search.filter_queryset(queryset, search_term), False
+
+    @admin.action(description='Set stock of selected phones in the background', permissions=('change',))
+    def set_stock(self, request, queryset):
+        form = BulkStockForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            stock = form.cleaned_data['stock']
+            self.queue_job(request, queryset, 'set_stock', f'Set stock of phones to {stock}', {'stock': stock})
+            return None
+        return TemplateResponse(request, 'admin/inventory/phone/set_stock.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Set stock',
+            'opts': self.opts,
+            'form': form,
+            'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+        })
+
+    @admin.action(description='Relist selected phones on every platform in the background', permissions=('change',))
+    def relist(self, request, queryset):
+        self.queue_job(request, queryset, 'relist', 'Relist phones')
+
+class PlatformConditionMappingInline(admin.TabularInline):
+    model = PlatformConditionMapping
+    extra = 0
 
 @admin.register(Platform)
 class PlatformAdmin(admin.ModelAdmin):
     list_display = ('name', 'fee_percentage', 'fixed_fee')
+    inlines = (PlatformConditionMappingInline,)
     search_fields = ('name',)
     ordering = ('name',)
+    actions = ('reprice_listings', 'list_all_phones')
+
+    def queue_job(self, request, task, args, description):
+        job = jobs.enqueue(task, args, user=request.user)
+        self.message_user(request, format_html(
+            '{}: queued; <a href="{}">follow its progress</a>.',
+            description, reverse('admin:inventory_job_change', args=[job.pk]),
+        ))
+
+    @admin.action(description='Reprice existing listings in the background')
+    def reprice_listings(self, request, queryset):
+        for platform in queryset:
+            self.queue_job(request, 'reprice_platform', {'platform': platform.pk}, f'Repricing {platform.name}')
+
+    @admin.action(description='List every phone in the background')
+    def list_all_phones(self, request, queryset):
+        platforms = list(queryset)
+        self.queue_job(
+            request, 'list_phones', {'platforms': [platform.pk for platform in platforms]},
+            f"Listing every phone on {', '.join(platform.name for platform in platforms)}",
+        )
+
+@admin.register(PlatformConditionMapping)
+class PlatformConditionMappingAdmin(admin.ModelAdmin):
+    list_display = ('platform', 'general_condition', 'platform_category')
+    list_editable = ('platform_category',)
+    list_filter = ('platform', 'general_condition')
+    list_select_related = ('platform',)
 
 @admin.register(Listing)
-class ListingAdmin(admin.ModelAdmin):
+class ListingAdmin(LargeTableAdmin):
     list_display = ('phone', 'platform', 'platform_price', 'platform_condition_category', 'is_listed')
-    list_filter = ('platform', 'is_listed', 'platform_condition_category')
+    list_filter = ('platform', 'is_listed', ConditionCategoryFilter, PlatformPriceRangeFilter)
+    list_select_related = ('phone', 'platform')
     search_fields = ('phone__name', 'platform__name')
-    raw_id_fields = ('phone', 'platform') # Use raw_id_fields for ForeignKey to improve performance with many items
+    autocomplete_fields = ('phone', 'platform')
+    actions = ('relist', 'delete_in_background')
+
+    @admin.action(description='Reprice and list selected listings in the background', permissions=('change',))
+    def relist(self, request, queryset):
+        self.queue_job(request, queryset, 'relist', 'Reprice and list listings')
 
 @admin.register(Brand)
 class BrandAdmin(admin.ModelAdmin):
@@ -29,8 +218,100 @@ class BrandAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 @admin.register(Query)
-class QueryAdmin(admin.ModelAdmin):
+class QueryAdmin(LargeTableAdmin):
     list_display = ('name', 'email', 'created_at')
     search_fields = ('name', 'email')
     list_filter = ('created_at',)
     ordering = ('-created_at',)
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'phone', 'order_type', 'quantity', 'total_price', 'status', 'created_at')
+    list_filter = ('order_type', 'status', 'created_at')
+    list_select_related = ('phone',)
+    autocomplete_fields = ('phone',)
+    ordering = ('-created_at',)
+
+@admin.register(Review)
+class ReviewAdmin(LargeTableAdmin):
+    list_display = ('phone', 'user', 'rating', 'created_at')
+    list_filter = ('rating',)
+    list_select_related = ('phone', 'user')
+    autocomplete_fields = ('phone',)
+    raw_id_fields = ('user',)
+
+class CartItemInline(admin.TabularInline):
+    # Read only: cart contents hold reserved stock (inventory/stock.py), changed only through the cart.
+    model = CartItem
+    fields = ('phone', 'quantity')
+    readonly_fields = ('phone', 'quantity')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('phone')
+
+@admin.register(Cart)
+class CartAdmin(LargeTableAdmin):
+    list_display = ('user', 'created_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    inlines = (CartItemInline,)
+
+@admin.register(HomePageImage)
+class HomePageImageAdmin(admin.ModelAdmin):
+    list_display = ('title', 'is_active')
+    list_filter = ('is_active',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            images.schedule(obj, 'image')
+
+@admin.register(BulkJob)
+class BulkJobAdmin(admin.ModelAdmin):
+    list_display = ('description', 'status', 'progress', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'action')
+    list_select_related = ('created_by',)
+    exclude = ('query',)
+    ordering = ('-created_at',)
+    actions = None
+
+    @admin.display(description='progress')
+    def progress(self, obj):
+        if obj.total:
+            return f'{obj.processed} of {obj.total} ({min(100, obj.processed * 100 // obj.total)}%)'
+        return f'{obj.processed}'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        '__str__', 'status', 'progress_display', 'attempts', 'message', 'worker', 'created_at', 'finished_at',
+    )
+    list_filter = ('status', 'task')
+    list_select_related = ('created_by',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+    actions = None
+
+    @admin.display(description='progress')
+    def progress_display(self, obj):
+        if obj.total:
+            return f'{obj.progress} of {obj.total} ({min(100, obj.progress * 100 // obj.total)}%)'
+        return f'{obj.progress}' if obj.progress else ''
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,276 @@
+# inventory/analytics.py
+
+"""
+Order analytics over materialized rollups.
+
+OrderRollup holds the number of completed orders, units and money in them at three grains:
+
+- day: one row per day, brand, condition and order type;
+- month: the same per calendar month;
+- day_total: one row per day and order type, over all brands and conditions.
+
+A report never reads Order rows. The daily series of a year is ~730 day_total rows; a
+breakdown by brand or condition over a range reads the month rows of the whole months in
+it plus the day rows of the partial months at either end, so a year is at most a few
+thousand rows whatever the number of orders. Each is one range scan of the (period, day,
+...) unique index and one GROUP BY.
+
+Rollups are kept current incrementally: Order signals add a completed order's totals to
+its three cells (and take them back out when the order is edited, cancelled or deleted),
+and stock.checkout(), whose bulk_create sends no signals, calls record() itself. Writes
+that bypass both (datagen, raw SQL) are followed by rebuild(), also available as the
+rebuild_order_rollups command. Cells use the phone's brand and condition at the time of
+the order; edits or deletions of an order after its phone changed brand or condition are
+taken out of the phone's current cell, which rebuild() corrects.
+
+BUY orders are sales to customers (units sold, revenue); SELL orders are phones bought back
+from customers (buy-back units and spend). Sell-through is units sold / (units sold +
+units in stock now), so it is only given per brand and condition and for the whole range.
+Orders don't record the platform a phone was sold through, so there is no platform view.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Brand, Order, OrderRollup, Phone
+
+COUNTED_STATUS = 'COMPLETED'
+GROUPINGS = {
+    'day': 'day',
+    'brand': 'brand_id',
+    'condition': 'condition',
+}
+DEFAULT_DAYS = 30
+MAX_DAYS = 366 * 5
+# Days a report may cover. Near date.min and date.max, the default start and the month
+# arithmetic of covering_rollups() would step outside the calendar.
+FIRST_DAY = date(1900, 1, 1)
+LAST_DAY = date(9998, 12, 31)
+DAY_FIELDS = ('day', 'brand_id', 'condition', 'order_type')
+MONEY = ('revenue', 'buyback_spend')
+CENT = Decimal('0.01')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def cell_key(order):
+    """
+    The day cell of an order as a dict of DAY_FIELDS, or None if it doesn't count (not completed).
+    """
+    if order.status != COUNTED_STATUS:
+        return None
+    return {
+        'day': timezone.localdate(order.created_at),
+        'brand_id': order.phone.brand_id,
+        'condition': order.phone.condition,
+        'order_type': order.order_type,
+    }
+
+
+def rollup_keys(day, brand_id, condition, order_type):
+    """
+    The three cells a day cell's totals count towards, as hashable tuples of lookups.
+    """
+    return [
+        (('period', OrderRollup.DAY), ('day', day), ('brand_id', brand_id), ('condition', condition),
+         ('order_type', order_type)),
+        (('period', OrderRollup.MONTH), ('day', month_start(day)), ('brand_id', brand_id), ('condition', condition),
+         ('order_type', order_type)),
+        (('period', OrderRollup.DAY_TOTAL), ('day', day), ('brand_id', None), ('condition', ''),
+         ('order_type', order_type)),
+    ]
+
+
+def _cells():
+    return defaultdict(lambda: [0, 0, Decimal(0)])
+
+
+def _add(cells, day_cell, orders, units, revenue):
+    for key in rollup_keys(**day_cell):
+        totals = cells[key]
+        totals[0] += orders
+        totals[1] += units
+        totals[2] += revenue
+
+
+def adjust(changes):
+    """
+    Applies {rollup key: [orders, units, revenue]} deltas, creating cells as needed.
+    """
+    with transaction.atomic():
+        for key, (orders, units, revenue) in changes.items():
+            key = dict(key)
+            updated = OrderRollup.objects.filter(**key).update(
+                orders=F('orders') + orders, units=F('units') + units, revenue=F('revenue') + revenue,
+            )
+            if not updated:
+                OrderRollup.objects.create(orders=orders, units=units, revenue=revenue, **key)
+
+
+def record(orders, sign=1):
+    """
+    Adds (sign=1) or removes (sign=-1) the totals of orders, one UPDATE per distinct cell.
+    """
+    changes = _cells()
+    for order in orders:
+        key = cell_key(order)
+        if key is not None:
+            _add(changes, key, sign, sign * order.quantity, sign * Decimal(order.total_price))
+    if changes:
+        adjust(changes)
+
+
+def rebuild(start=None, end=None):
+    """
+    Recomputes the rollups of the months from start to end (inclusive; open-ended if None)
+    from the Order table. Returns the number of rollup rows written.
+    """
+    orders = Order.objects.filter(status=COUNTED_STATUS)
+    rollups = OrderRollup.objects.all()
+    # Month cells are only correct when rebuilt whole, so the range is widened to whole months.
+    if start is not None:
+        start = month_start(start)
+        orders = orders.filter(created_at__gte=day_start(start))
+        rollups = rollups.filter(day__gte=start)
+    if end is not None:
+        end = next_month(end)
+        orders = orders.filter(created_at__lt=day_start(end))
+        rollups = rollups.filter(day__lt=end)
+    days = (
+        orders.annotate(day=TruncDate('created_at'), brand_id=F('phone__brand_id'), condition=F('phone__condition'))
+        .values(*DAY_FIELDS)
+        .annotate(count=Count('id'), quantity=Sum('quantity'), money=Sum('total_price'))
+        .order_by()
+    )
+    cells = _cells()
+    for row in days.iterator():
+        _add(cells, {field: row[field] for field in DAY_FIELDS}, row['count'], row['quantity'], row['money'])
+    rows = [
+        OrderRollup(orders=orders, units=units, revenue=revenue, **dict(key))
+        for key, (orders, units, revenue) in cells.items()
+    ]
+    with transaction.atomic():
+        rollups.delete()
+        OrderRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def parse_range(params, today=None):
+    """
+    Reads start and end (YYYY-MM-DD) from params; the default is the last DEFAULT_DAYS days.
+    Raises ValueError for malformed, reversed or overlong ranges, and for days outside
+    FIRST_DAY to LAST_DAY.
+    """
+    today = today or timezone.localdate()
+    end = date.fromisoformat(params['end']) if params.get('end') else today
+    if not FIRST_DAY <= end <= LAST_DAY:
+        raise ValueError(f'Dates must be between {FIRST_DAY} and {LAST_DAY}.')
+    start = date.fromisoformat(params['start']) if params.get('start') else end - timedelta(days=DEFAULT_DAYS - 1)
+    if not FIRST_DAY <= start <= LAST_DAY:
+        raise ValueError(f'Dates must be between {FIRST_DAY} and {LAST_DAY}.')
+    if start > end:
+        raise ValueError('start is after end.')
+    if (end - start).days >= MAX_DAYS:
+        raise ValueError(f'Ranges are limited to {MAX_DAYS} days.')
+    return start, end
+
+
+def covering_rollups(start, end, group_by):
+    """
+    The fewest rollup rows adding up to the days from start to end for a report grouped by group_by.
+    """
+    if group_by == 'day':
+        return OrderRollup.objects.filter(period=OrderRollup.DAY_TOTAL, day__range=(start, end))
+    first_month = start if start.day == 1 else next_month(start)
+    after_months = month_start(end + timedelta(days=1))
+    if first_month >= after_months:
+        return OrderRollup.objects.filter(period=OrderRollup.DAY, day__range=(start, end))
+    return OrderRollup.objects.filter(
+        Q(period=OrderRollup.MONTH, day__gte=first_month, day__lt=after_months)
+        | Q(period=OrderRollup.DAY, day__gte=start, day__lt=first_month)
+        | Q(period=OrderRollup.DAY, day__gte=after_months, day__lte=end)
+    )
+
+
+def _aggregates():
+    sold, bought = Q(order_type='BUY'), Q(order_type='SELL')
+    # Prefixed: an annotation can't have the name of the field it sums.
+    return {
+        'sum_orders': Sum('orders', filter=sold),
+        'sum_units': Sum('units', filter=sold),
+        'sum_revenue': Sum('revenue', filter=sold),
+        'sum_buyback_units': Sum('units', filter=bought),
+        'sum_buyback_spend': Sum('revenue', filter=bought),
+    }
+
+
+def _empty():
+    return {'orders': 0, 'units': 0, 'revenue': Decimal('0.00'), 'buyback_units': 0, 'buyback_spend': Decimal('0.00')}
+
+
+def sell_through(units, stock):
+    return round(units / (units + stock), 4) if units + stock else None
+
+
+def report(start, end, group_by='day'):
+    """
+    Sales and buy-backs from start to end (inclusive) grouped by day, brand or condition:
+
+        {'start', 'end', 'group_by', 'totals': {...}, 'rows': [{'key', 'label', ...}, ...]}
+
+    Each row and the totals carry orders, units and revenue (sales), buyback_units and
+    buyback_spend, and sell_through (None per day). Daily rows include days without orders.
+    """
+    column = GROUPINGS[group_by]
+    empty = _empty()
+    rows = {}
+    for row in covering_rollups(start, end, group_by).values(column).annotate(**_aggregates()).order_by(column):
+        # Sums over no rows (e.g. no buy-backs in a group) are NULL.
+        values = {name: empty[name] if row[f'sum_{name}'] is None else row[f'sum_{name}'] for name in empty}
+        for name in MONEY:
+            values[name] = values[name].quantize(CENT)
+        rows[row[column]] = values
+
+    if group_by == 'day':
+        keys = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        labels = {day: day.isoformat() for day in keys}
+        stock = {}
+    elif group_by == 'brand':
+        keys = list(rows)
+        names = dict(Brand.objects.filter(pk__in=[key for key in keys if key is not None]).values_list('pk', 'name'))
+        labels = {key: names.get(key, 'No brand') for key in keys}
+        stock = dict(Phone.objects.values_list('brand_id').annotate(Sum('stock')).order_by())
+    else:
+        keys = list(rows)
+        labels = {key: key for key in keys}
+        stock = dict(Phone.objects.values_list('condition').annotate(Sum('stock')).order_by())
+
+    totals = _empty()
+    result = []
+    for key in keys:
+        row = rows.get(key) or _empty()
+        for name in totals:
+            totals[name] += row[name]
+        row['sell_through'] = sell_through(row['units'], stock.get(key) or 0) if group_by != 'day' else None
+        result.append({'key': key, 'label': labels[key], **row})
+    if group_by != 'day':
+        result.sort(key=lambda row: row['revenue'], reverse=True)
+    total_stock = Phone.objects.aggregate(stock=Sum('stock'))['stock'] or 0
+    totals['sell_through'] = sell_through(totals['units'], total_stock)
+    return {'start': start, 'end': end, 'group_by': group_by, 'totals': totals, 'rows': result}
@@ -0,0 +1,25 @@
+# inventory/asgi.py
+
+"""
+ASGI entry point that serves the storefront with its async views.
+
+StorefrontASGIHandler resolves every request against settings.ASGI_URLCONF, which maps
+the read-heavy pages and the chatbot/sell forms to the async views in views.py. All the
+project's middleware is async-capable, so a request stays on the event loop until it
+reaches the database: the async ORM runs each query in a thread and the view awaits it.
+"""
+
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+
+
+class StorefrontASGIHandler(ASGIHandler):
+    async def get_response_async(self, request):
+        request.urlconf = getattr(settings, 'ASGI_URLCONF', settings.ROOT_URLCONF)
+        return await super().get_response_async(request)
+
+
+def get_asgi_application():
+    django.setup(set_prefix=False)
+    return StorefrontASGIHandler()
@@ -0,0 +1,155 @@
+# inventory/benchmarks.py
+
+"""
+Shared helpers for the bench_* management commands.
+
+Benchmarks never touch the project database: they run against a throwaway test database
+created the same way the test runner does it.
+"""
+
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils.module_loading import import_string
+
+from .models import Brand, Phone
+
+BRAND_NAMES = ["Apple", "Samsung", "Google", "Oneplus", "Xiaomi", "Huawei", "Sony", "Lg", "Motorola", "Nokia", "Realme", "Oppo"]
+CONDITIONS = ['New', 'Good', 'Usable', 'Scrap']
+MEMORY_SIZES = [64, 128, 256, 512]
+CAMERA_QUALITIES = ['12MP', '24MP', '48MP', '108MP']
+COLORS = ['Black', 'White', 'Silver', 'Gold', 'Blue', 'Red']
+
+
+def scratch_caches(directory):
+    """
+    settings.CACHES with the same backends, but with file caches under directory and every
+    key prefixed, so a benchmark neither reads nor pollutes the site's cache.
+    """
+    def isolate(config, name):
+        config = dict(config)
+        if issubclass(import_string(config['BACKEND']), FileBasedCache):
+            config['LOCATION'] = os.path.join(directory, name)
+        config['KEY_PREFIX'] = 'scratch'
+        options = dict(config.get('OPTIONS', {}))
+        for tier in ('LOCAL', 'SHARED'):
+            if tier in options:
+                options[tier] = isolate(options[tier], f'{name}-{tier.lower()}')
+        if options:
+            config['OPTIONS'] = options
+        return config
+
+    return {alias: isolate(config, alias) for alias, config in settings.CACHES.items()}
+
+
+@contextmanager
+def scratch_database(db_file=None):
+    """
+    Creates a disposable copy of the schema, an empty cache and query spool, for the duration of a benchmark.
+
+    SQLite test databases live in shared memory by default; pass db_file to benchmark
+    against an on-disk file instead (needed for anything that measures locking or WAL).
+    """
+    old_name = connection.settings_dict['NAME']
+    # Other aliases for the same database (the read replica) follow it to the scratch copy.
+    followers = [
+        connections[alias] for alias in connections
+        if alias != connection.alias and connections[alias].settings_dict['NAME'] == old_name
+    ]
+    if db_file:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = db_file
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    for follower in followers:
+        follower.close()
+        follower.settings_dict['NAME'] = connection.settings_dict['NAME']
+    scratch_dir = tempfile.TemporaryDirectory()
+    scratch_settings = override_settings(
+        CACHES=scratch_caches(scratch_dir.name),
+        QUERY_BUFFER_SPOOL=os.path.join(scratch_dir.name, 'query_spool'),
+    )
+    scratch_settings.enable()
+    try:
+        yield connection
+    finally:
+        # Also writes out the scratch query buffer while its database still exists.
+        scratch_settings.disable()
+        scratch_dir.cleanup()
+        for follower in followers:
+            follower.close()
+            follower.settings_dict['NAME'] = old_name
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """
+    Formats latency samples (in seconds) as p50/p95/p99 milliseconds.
+    """
+    return 'p50={:.2f}ms p95={:.2f}ms p99={:.2f}ms (n={})'.format(
+        percentile(samples, 50) * 1000,
+        percentile(samples, 95) * 1000,
+        percentile(samples, 99) * 1000,
+        len(samples),
+    )
+
+
+def measure(func, iterations):
+    """
+    Calls func() repeatedly and returns the wall-clock duration of each call.
+    """
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def seed_brands():
+    Brand.objects.bulk_create([Brand(name=name) for name in BRAND_NAMES], ignore_conflicts=True)
+    return list(Brand.objects.values_list('id', flat=True))
+
+
+def seed_phones(count, brand_ids, batch_size=5000, rng=None, start=0):
+    """
+    Bulk-inserts count random phones spread across brand_ids.
+    """
+    rng = rng or random.Random(0)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        Phone.objects.bulk_create([
+            Phone(
+                brand_id=rng.choice(brand_ids),
+                name=f'Model {start + created + i}',
+                base_price=Decimal(rng.randint(10000, 100000)) / 100,
+                condition=rng.choice(CONDITIONS),
+                stock=rng.randint(0, 100),
+                memory=rng.choice(MEMORY_SIZES),
+                camera_quality=rng.choice(CAMERA_QUALITIES),
+                color=rng.choice(COLORS),
+            )
+            for i in range(size)
+        ], batch_size=batch_size)
+        created += size
+    return created
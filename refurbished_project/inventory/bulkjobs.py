@@ -0,0 +1,176 @@
+# inventory/bulkjobs.py
+
+"""
+Admin bulk actions on any number of rows, done in the background a chunk at a time.
+
+A changelist action only queues a BulkJob, and the Job that runs it (jobs.py), and
+returns, where Django's own actions would update every selected row in the request, and
+delete_selected would load every row and everything related to it to build its
+confirmation page. The job keeps its selection as plain JSON: the primary keys of the
+ticked rows, or for "select all" the changelist's query string (filters and search),
+which the worker turns back into the rows through the model's ModelAdmin. So selecting
+all of a filtered changelist of millions of rows costs no more to queue than a page of
+ticked rows, and queued jobs don't depend on how Django or this code pickle a query.
+
+run_workers works through a job in primary-key order: each chunk is the next
+BULK_JOB_CHUNK_SIZE keys of the selection after the job's cursor, done in one transaction
+that also moves the cursor, so an attempt that stops part way (a failed chunk, a worker
+that died) is carried on after the last chunk done. Rows that join the selection once the
+cursor has gone past their key are left out.
+
+Actions (ACTIONS) get the chunk as a queryset and the job's params:
+
+    set_stock   Phone     sets stock to params['stock']
+    relist      Phone     prices and lists the phones on every platform
+    relist      Listing   reprices the listings and marks them listed
+    delete      any       deletes the rows with everything that cascades, sending signals
+"""
+
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+from . import jobs, listings, pagecache
+from .models import BulkJob, Listing, Phone, Platform
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def chunk_size():
+    return getattr(settings, 'BULK_JOB_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def set_stock(rows, params):
+    rows.update(stock=params['stock'])
+    # Queryset updates send no signals, so cached pages showing stock are invalidated here.
+    transaction.on_commit(lambda: pagecache.bump_tags('phone'))
+
+
+def relist(rows, params):
+    if rows.model is Phone:
+        listings.list_phones(phones=rows)
+        return
+    by_platform = defaultdict(list)
+    for phone_id, platform_id in rows.values_list('phone_id', 'platform_id'):
+        by_platform[platform_id].append(phone_id)
+    for platform in Platform.objects.filter(pk__in=by_platform):
+        listings.list_phones(platforms=[platform], phones=Phone.objects.filter(pk__in=by_platform[platform.pk]))
+
+
+def delete(rows, params):
+    rows.delete()
+
+
+ACTIONS = {
+    'set_stock': (set_stock, (Phone,)),
+    'relist': (relist, (Phone, Listing)),
+    'delete': (delete, None),
+}
+
+
+def queue(queryset, action, description, params=None, user=None, changelist=None):
+    """
+    Queues action on the rows of queryset, or, given changelist (the query string of an
+    admin changelist of queryset's model), on every row that changelist shows. Without
+    changelist the primary keys of queryset are stored, so it should be a page of rows;
+    with it nothing is read here, and the worker counts the rows when it starts on the job.
+    """
+    function, models = ACTIONS[action]
+    if models is not None and queryset.model not in models:
+        raise ValueError(f"{action} can't be applied to {queryset.model._meta.verbose_name_plural}.")
+    if changelist is not None:
+        changelist = QueryDict(changelist, mutable=True)
+        changelist.pop(PAGE_VAR, None)
+        rows = {'changelist': changelist.urlencode()}
+    else:
+        rows = {'pks': list(queryset.order_by('pk').values_list('pk', flat=True))}
+    with transaction.atomic():
+        bulk_job = BulkJob.objects.create(
+            action=action,
+            model=queryset.model._meta.label_lower,
+            selection=rows,
+            params=params or {},
+            description=description,
+            created_by=user,
+        )
+        jobs.enqueue('bulk_job', {'bulk_job': bulk_job.pk}, user=user)
+    return bulk_job
+
+
+def selection(job):
+    """
+    The job's rows as a queryset.
+    """
+    model = apps.get_model(job.model)
+    if 'pks' in job.selection:
+        return model._default_manager.filter(pk__in=job.selection['pks'])
+    if 'changelist' not in job.selection:
+        raise ValueError('The job has no selection; queue it again.')
+    # The changelist's own filters and search, as its ModelAdmin applies them for its creator.
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(job.selection['changelist'])
+    request.user = job.created_by or AnonymousUser()
+    model_admin = admin.site.get_model_admin(model)
+    return model_admin.get_changelist_instance(request).get_queryset(request)
+
+
+def run_chunk(job, rows=None):
+    """
+    Applies the job's action to its next chunk of rows (default: selection(job)); returns
+    False once there is none left.
+    """
+    if rows is None:
+        rows = selection(job)
+    with transaction.atomic():
+        keys = list(
+            rows.filter(pk__gt=job.cursor).order_by('pk').values_list('pk', flat=True)[:chunk_size()]
+        )
+        if keys:
+            function, _ = ACTIONS[job.action]
+            function(rows.model._default_manager.filter(pk__in=keys), job.params)
+            job.cursor = keys[-1]
+            job.processed += len(keys)
+            job.save(update_fields=['cursor', 'processed'])
+        else:
+            job.status = BulkJob.DONE
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'finished_at'])
+    return bool(keys)
+
+
+def run(job, progress=None):
+    """
+    Works through job from its cursor to the end, calling progress(processed, total) after
+    each chunk. A failing chunk marks the job failed, leaving its earlier chunks done, and
+    re-raises so the worker retries it; the retry carries on from the cursor.
+    """
+    try:
+        rows = selection(job)
+        if job.status == BulkJob.QUEUED:
+            job.status = BulkJob.RUNNING
+            job.started_at = timezone.now()
+            job.total = rows.order_by().count()
+            job.save(update_fields=['status', 'started_at', 'total'])
+        elif job.status == BulkJob.FAILED:
+            job.status = BulkJob.RUNNING
+            job.error = ''
+            job.finished_at = None
+            job.save(update_fields=['status', 'error', 'finished_at'])
+        while run_chunk(job, rows):
+            if progress is not None:
+                progress(job.processed, job.total)
+    except Exception as exc:
+        job.status = BulkJob.FAILED
+        job.error = f'{type(exc).__name__}: {exc}'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        raise
+    return job
@@ -0,0 +1,185 @@
+# inventory/cache_backends.py
+
+"""
+Two-tier cache backend: a small local-memory LRU in front of a shared cache.
+
+Reads try this process's LocMemCache first and fall back to the shared backend (file or
+database cache, visible to every process), copying hits into the local tier. Writes go to
+both. Local copies live at most LOCAL_TIMEOUT seconds, which bounds how stale one process
+can be after another process changed a key.
+
+Hits and misses are counted per key family (the part of the key before the first ':', or
+the fragment name for {% cache %} fragments); see stats().
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'inventory.cache_backends.TieredCache',
+            'OPTIONS': {
+                'LOCAL': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 5000}},
+                'SHARED': {'BACKEND': 'inventory.cache_backends.FileCache', 'LOCATION': '/var/tmp/cache'},
+                'LOCAL_TIMEOUT': 5,
+            },
+        },
+    }
+"""
+
+import itertools
+import threading
+from collections import Counter
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+DEFAULT_LOCAL_TIMEOUT = 5
+DEFAULT_CULL_EVERY = 100
+FRAGMENT_PREFIX = 'template.cache.'
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def key_family(key):
+    if key.startswith(FRAGMENT_PREFIX):
+        return 'fragment:' + key[len(FRAGMENT_PREFIX):].split('.', 1)[0]
+    return key.split(':', 1)[0]
+
+
+def record(key, outcome):
+    family = key_family(key)
+    with _stats_lock:
+        _stats.setdefault(family, Counter())[outcome] += 1
+    metrics.CACHE_LOOKUPS.inc(family, outcome)
+
+
+def stats():
+    """
+    Returns {family: {'local_hits', 'shared_hits', 'misses', 'hit_ratio'}} for this process.
+    """
+    with _stats_lock:
+        snapshot = {family: dict(counts) for family, counts in _stats.items()}
+    for counts in snapshot.values():
+        for outcome in ('local_hits', 'shared_hits', 'misses'):
+            counts.setdefault(outcome, 0)
+        lookups = counts['local_hits'] + counts['shared_hits'] + counts['misses']
+        counts['hit_ratio'] = round((counts['local_hits'] + counts['shared_hits']) / lookups, 3) if lookups else 0.0
+    return snapshot
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class FileCache(FileBasedCache):
+    """
+    FileBasedCache that checks whether it has to cull only every CULL_EVERY writes (an
+    OPTIONS entry, default 100). FileBasedCache lists the whole cache directory on every
+    set() to count its entries, which costs milliseconds per write once it holds thousands
+    of pages and fragments. The cache can overshoot MAX_ENTRIES by up to CULL_EVERY entries.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_every = params.get('OPTIONS', {}).get('CULL_EVERY', DEFAULT_CULL_EVERY)
+        self._writes = itertools.count()
+
+    def _cull(self):
+        if next(self._writes) % self._cull_every == 0:
+            super()._cull()
+
+
+def _build(alias, config):
+    config = dict(config)
+    backend = import_string(config.pop('BACKEND'))
+    return backend(config.pop('LOCATION', alias), config)
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.local_timeout = options.get('LOCAL_TIMEOUT', DEFAULT_LOCAL_TIMEOUT)
+        self.local = _build(f'tiered-local-{location}', options.get('LOCAL', {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }))
+        self.shared = _build(f'tiered-shared-{location}', options['SHARED'])
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def get(self, key, default=None, version=None):
+        sentinel = object()
+        value = self.local.get(key, sentinel, version=version)
+        if value is not sentinel:
+            record(key, 'local_hits')
+            return value
+        value = self.shared.get(key, sentinel, version=version)
+        if value is sentinel:
+            record(key, 'misses')
+            return default
+        record(key, 'shared_hits')
+        self.local.set(key, value, self.local_timeout, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = self.local.get_many(keys, version=version)
+        for key in found:
+            record(key, 'local_hits')
+        missing = [key for key in keys if key not in found]
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key in missing:
+                record(key, 'shared_hits' if key in shared else 'misses')
+            if shared:
+                self.local.set_many(shared, self.local_timeout, version=version)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self.local.set(key, value, self._local_timeout(timeout), version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        self.local.set_many(data, self._local_timeout(timeout), version=version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self.local.set(key, value, self._local_timeout(timeout), version=version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.touch(key, self._local_timeout(timeout), version=version)
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(key, version=version)
+        return self.shared.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version=version)
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self.local.delete_many(keys, version=version)
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.local.has_key(key, version=version) or self.shared.has_key(key, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.local.close(**kwargs)
+        self.shared.close(**kwargs)
@@ -0,0 +1,222 @@
+# inventory/cart.py
+
+"""
+Shopping carts for anonymous and logged-in visitors.
+
+A logged-in user's cart is the Cart row with its CartItems, and its units are held with
+StockReservations (see stock.py). A visitor who isn't logged in gets a cart in a signed
+cookie instead ("12:1,40:2", phone id and quantity), so browsing and filling a cart
+writes nothing to the database and needs no session row; it holds no stock. On login,
+the cookie cart is merged into the user's Cart (quantities added with F() increments,
+stock reserved as for add to cart) and the cookie is deleted.
+
+The header badge shows the number of units in the cart without a query: anonymous carts
+are counted from the cookie, and a user's count is kept in their session, which
+AuthenticationMiddleware loads anyway. Views that change a cart call forget_count() and
+the next page recomputes it with one aggregate query. Anonymous pages in the page cache
+store the badge as a placeholder, filled in for each visitor like the CSRF token (see
+pagecache.py).
+"""
+
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import F, Sum
+
+from . import stock
+from .models import Cart, CartItem, Phone
+
+COOKIE_NAME = 'cart'
+COOKIE_SALT = 'inventory.cart'
+DEFAULT_COOKIE_AGE = 30 * 24 * 60 * 60
+# Keeps the cookie well below the 4 KB browsers allow.
+MAX_LINES = 50
+SESSION_KEY = 'cart_count'
+BADGE_PLACEHOLDER = b'__cart_count__'
+BADGE = re.compile(rb'(<span[^>]* data-cart-count[^>]*>)\d+(</span>)')
+
+
+class CartFull(Exception):
+    """
+    Raised when an anonymous cart already has MAX_LINES different phones.
+    """
+
+
+class CookieCart:
+    """
+    The cart of a visitor who isn't logged in: {phone id: quantity}.
+    """
+
+    def __init__(self, quantities=None):
+        self.quantities = dict(quantities or {})
+        self.modified = False
+
+    @classmethod
+    def load(cls, value):
+        """
+        Parses a cookie value; anything malformed gives an empty cart.
+        """
+        quantities = {}
+        for line in (value or '').split(','):
+            phone_id, _, quantity = line.partition(':')
+            if phone_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+                quantities[int(phone_id)] = int(quantity)
+        return cls(dict(list(quantities.items())[:MAX_LINES]))
+
+    def dump(self):
+        return ','.join(f'{phone_id}:{quantity}' for phone_id, quantity in self.quantities.items())
+
+    @property
+    def count(self):
+        return sum(self.quantities.values())
+
+    def add(self, phone_id, quantity=1):
+        if phone_id not in self.quantities and len(self.quantities) >= MAX_LINES:
+            raise CartFull(phone_id)
+        self.quantities[phone_id] = self.quantities.get(phone_id, 0) + quantity
+        self.modified = True
+
+    def remove(self, phone_id):
+        if self.quantities.pop(phone_id, None) is not None:
+            self.modified = True
+
+    def clear(self):
+        if self.quantities:
+            self.quantities = {}
+            self.modified = True
+
+    def items(self):
+        """
+        Unsaved CartItems for the cart's phones that still exist, with one query.
+        """
+        phones = Phone.objects.select_related('brand').in_bulk(list(self.quantities))
+        return [
+            CartItem(phone=phones[phone_id], quantity=quantity)
+            for phone_id, quantity in self.quantities.items() if phone_id in phones
+        ]
+
+
+def cookie_cart(request):
+    """
+    The request's cookie cart, parsed once per request.
+    """
+    if not hasattr(request, '_cookie_cart'):
+        value = request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT)
+        request._cookie_cart = CookieCart.load(value)
+    return request._cookie_cart
+
+
+def save_cookie(request, response):
+    """
+    Writes the request's cookie cart to response if it changed.
+    """
+    cart = getattr(request, '_cookie_cart', None)
+    if cart is None or not cart.modified:
+        return
+    if cart.quantities:
+        response.set_signed_cookie(
+            COOKIE_NAME, cart.dump(), salt=COOKIE_SALT, httponly=True, samesite='Lax',
+            max_age=getattr(settings, 'CART_COOKIE_AGE', DEFAULT_COOKIE_AGE),
+        )
+    else:
+        response.delete_cookie(COOKIE_NAME, samesite='Lax')
+
+
+def forget_count(request):
+    """
+    Drops the user's cached badge count after their cart changed.
+    """
+    request.session.pop(SESSION_KEY, None)
+
+
+def badge_count(request):
+    """
+    The number of units in the visitor's cart. Makes a query only for a logged-in user
+    whose count isn't in the session yet.
+    """
+    if not request.user.is_authenticated:
+        return cookie_cart(request).count
+    count = request.session.get(SESSION_KEY)
+    if count is None:
+        count = CartItem.objects.filter(cart__user=request.user).aggregate(count=Sum('quantity'))['count'] or 0
+        request.session[SESSION_KEY] = count
+    return count
+
+
+def cart_count(request):
+    """
+    Context processor: {{ cart_count }}, evaluated only by templates that show it.
+    """
+    return {'cart_count': lambda: badge_count(request)}
+
+
+@stock.retry_on_lock
+@transaction.atomic
+def add(cart, phone, quantity=1):
+    """
+    Reserves quantity more units of phone for a saved cart and adds them to it.
+    Raises stock.OutOfStock if there aren't enough.
+    """
+    stock.reserve(cart, phone, quantity)
+    updated = CartItem.objects.filter(cart=cart, phone=phone).update(quantity=F('quantity') + quantity)
+    if not updated:
+        CartItem.objects.create(cart=cart, phone=phone, quantity=quantity)
+
+
+def merge(request, user):
+    """
+    Moves the request's cookie cart into user's Cart. Phones that are gone or out of stock are dropped.
+    """
+    anonymous = cookie_cart(request)
+    if not anonymous.quantities:
+        return
+    cart, created = Cart.objects.get_or_create(user=user)
+    for item in anonymous.items():
+        try:
+            add(cart, item.phone, item.quantity)
+        except stock.OutOfStock:
+            messages.warning(
+                request, f"{item.phone.name} is out of stock and was taken out of your cart.", fail_silently=True,
+            )
+    anonymous.clear()
+    forget_count(request)
+
+
+def fill_badge(content, request):
+    """
+    Puts the visitor's cart count into a page cached with BADGE_PLACEHOLDER.
+    """
+    return content.replace(BADGE_PLACEHOLDER, str(badge_count(request)).encode())
+
+
+def strip_badge(content):
+    return BADGE.sub(rb'\1' + BADGE_PLACEHOLDER + rb'\2', content)
+
+
+class CartCookieMiddleware:
+    """
+    Saves changes to the cookie cart on the response. Works in both sync and async stacks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        save_cookie(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        save_cookie(request, response)
+        return response
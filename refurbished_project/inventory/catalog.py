@@ -0,0 +1,272 @@
+# inventory/catalog.py
+
+import base64
+import binascii
+import json
+import math
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from . import search
+from .models import Phone
+
+# Columns needed to render a product card on phone_list.html. Everything else stays deferred.
+LIST_FIELDS = (
+    'id', 'brand_id', 'name', 'base_price', 'condition', 'stock', 'memory', 'color', 'image', 'image_variants',
+    'rating_average', 'rating_count',
+)
+
+# sort key -> (label, model field, descending). Every option is tie-broken by id so that
+# the (field, id) pair is unique and can be used as a keyset cursor.
+SORT_OPTIONS = {
+    'price_asc': ('Price: Low to High', 'base_price', False),
+    'price_desc': ('Price: High to Low', 'base_price', True),
+    'newest': ('Newest', 'id', True),
+    'name': ('Name', 'name', False),
+    'rating': ('Top Rated', 'rating_average', True),
+}
+DEFAULT_SORT = 'price_asc'
+
+# Bounds of the numeric filters; values outside them are ignored like malformed ones.
+MIN_INT, MAX_INT = -2 ** 63, 2 ** 63 - 1
+_price = Phone._meta.get_field('base_price')
+MAX_DECIMAL = Decimal(10) ** (_price.max_digits - _price.decimal_places)
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a pagination cursor cannot be decoded.
+    """
+
+
+def encode_cursor(values):
+    """
+    Encodes the sort key values of the last row on a page into an opaque URL-safe token.
+    """
+    raw = json.dumps([str(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Reverses encode_cursor(), raising InvalidCursor for anything that was not produced by it.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(token)
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        raise InvalidCursor(token)
+    return values
+
+
+def _parse_int(value):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    # SQLite's INTEGER is signed 64-bit; binding anything larger raises OverflowError.
+    return number if MIN_INT <= number <= MAX_INT else None
+
+
+def _parse_float(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _parse_decimal(value):
+    try:
+        number = Decimal(value)
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+    # NaN and Infinity fail the DecimalField lookup, and so does a value with more digits
+    # before the point than the price columns hold.
+    if not number.is_finite() or abs(number) >= MAX_DECIMAL:
+        return None
+    return number
+
+
+def _cursor_value(field_name, value, token):
+    """
+    Converts one cursor value to the Python type of the Phone field, raising InvalidCursor
+    for values a tampered cursor could carry (non-numbers for numeric fields, NaN, ...).
+    """
+    field = Phone._meta.get_field(field_name)
+    try:
+        converted = field.to_python(value)
+    except (ValidationError, TypeError, ValueError):
+        raise InvalidCursor(token)
+    if converted is None:
+        raise InvalidCursor(token)
+    if isinstance(converted, Decimal) and not converted.is_finite():
+        raise InvalidCursor(token)
+    if isinstance(converted, float) and not math.isfinite(converted):
+        raise InvalidCursor(token)
+    return converted
+
+
+class CatalogPage:
+    """
+    One page of catalog results plus the cursor needed to fetch the next one.
+    """
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class CatalogQuery:
+    """
+    Builds filtered, sorted and keyset-paginated Phone querysets from PhoneListView GET parameters.
+
+    Keyset pagination seeks straight to the next page with "WHERE (sort_key, id) > cursor"
+    instead of OFFSET, so page N costs the same as page 1 as long as a matching index exists
+    (see the indexes declared on Phone.Meta).
+    """
+
+    def __init__(self, params, page_size=DEFAULT_PAGE_SIZE):
+        self.params = params
+        sort = params.get('sort')
+        self.sort = sort if sort in SORT_OPTIONS else DEFAULT_SORT
+        self.page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    @property
+    def sort_field(self):
+        return SORT_OPTIONS[self.sort][1]
+
+    @property
+    def descending(self):
+        return SORT_OPTIONS[self.sort][2]
+
+    def filter(self, queryset=None):
+        """
+        Applies the catalog filters. Malformed values are ignored rather than raising.
+        """
+        if queryset is None:
+            queryset = Phone.objects.all()
+        params = self.params
+
+        q = params.get('q')
+        if q:
+            queryset = search.filter_queryset(queryset, q)
+
+        brand = _parse_int(params.get('brand'))
+        if brand is not None:
+            queryset = queryset.filter(brand_id=brand)
+
+        memory = _parse_int(params.get('memory'))
+        if memory is not None:
+            queryset = queryset.filter(memory=memory)
+
+        min_price = _parse_decimal(params.get('min_price'))
+        if min_price is not None:
+            queryset = queryset.filter(base_price__gte=min_price)
+
+        max_price = _parse_decimal(params.get('max_price'))
+        if max_price is not None:
+            queryset = queryset.filter(base_price__lte=max_price)
+
+        condition = params.get('condition')
+        if condition:
+            queryset = queryset.filter(condition=condition)
+
+        color = params.get('color')
+        if color:
+            queryset = queryset.filter(color__icontains=color)
+
+        camera_quality = params.get('camera_quality')
+        if camera_quality:
+            queryset = queryset.filter(camera_quality=camera_quality)
+
+        min_rating = _parse_float(params.get('min_rating'))
+        if min_rating is not None:
+            queryset = queryset.filter(rating_average__gte=min_rating)
+
+        return queryset
+
+    def order(self, queryset):
+        prefix = '-' if self.descending else ''
+        if self.sort_field == 'id':
+            return queryset.order_by(f'{prefix}id')
+        return queryset.order_by(f'{prefix}{self.sort_field}', f'{prefix}id')
+
+    def seek(self, queryset, cursor):
+        """
+        Restricts the queryset to rows strictly after the cursor in the current sort order.
+        """
+        values = decode_cursor(cursor)
+        lookup = 'lt' if self.descending else 'gt'
+        if self.sort_field == 'id':
+            if len(values) != 1:
+                raise InvalidCursor(cursor)
+            return queryset.filter(**{f'id__{lookup}': _cursor_value('id', values[0], cursor)})
+
+        if len(values) != 2:
+            raise InvalidCursor(cursor)
+        field = self.sort_field
+        key = _cursor_value(field, values[0], cursor)
+        pk = _cursor_value('id', values[1], cursor)
+        # The redundant inclusive bound gives SQLite a starting point for the index range scan;
+        # with only the OR it falls back to walking the index from the beginning.
+        return queryset.filter(**{f'{field}__{lookup}e': key}).filter(
+            Q(**{f'{field}__{lookup}': key}) | Q(**{f'id__{lookup}': pk})
+        )
+
+    def cursor_for(self, phone):
+        if self.sort_field == 'id':
+            return encode_cursor([phone.pk])
+        return encode_cursor([getattr(phone, self.sort_field), phone.pk])
+
+    def queryset(self, cursor=None, fields=LIST_FIELDS):
+        queryset = self.order(self.filter())
+        if fields:
+            queryset = queryset.only(*fields)
+        if cursor:
+            queryset = self.seek(queryset, cursor)
+        return queryset
+
+    def _page_queryset(self, cursor, fields):
+        try:
+            queryset = self.queryset(cursor, fields)
+        except InvalidCursor:
+            queryset = self.queryset(None, fields)
+        # Fetch one extra row to learn whether another page exists without a COUNT(*).
+        return queryset[:self.page_size + 1]
+
+    def page(self, cursor=None, fields=LIST_FIELDS):
+        """
+        Fetches one page with a single query. An invalid cursor falls back to the first page.
+        """
+        return self._paginate(list(self._page_queryset(cursor, fields)))
+
+    async def apage(self, cursor=None, fields=LIST_FIELDS):
+        """
+        Async version of page(), for async views.
+        """
+        return self._paginate([phone async for phone in self._page_queryset(cursor, fields)])
+
+    def _paginate(self, items):
+        next_cursor = None
+        if len(items) > self.page_size:
+            items = items[:self.page_size]
+            next_cursor = self.cursor_for(items[-1])
+        return CatalogPage(items, next_cursor)
@@ -0,0 +1,134 @@
+# inventory/conditions.py
+
+"""
+Platform condition categories, cached per process.
+
+All PlatformConditionMapping rows are loaded into one dict keyed by platform id on first
+use, so resolving a category is two dict lookups and no query. Saving or deleting a
+mapping clears this process's copy (see signals.py) and replaces a version token in the
+shared cache; other processes notice the new version within CHECK_INTERVAL seconds. It
+also invalidates the cached pages that show mapped categories (phone detail pages).
+"""
+
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from . import pagecache
+
+UNKNOWN = 'Unknown'
+VERSION_KEY = 'conditions:version'
+CHECK_INTERVAL = 1.0
+
+# Categories seeded for the original platforms, by platform name and general condition.
+DEFAULT_MAPPINGS = {
+    'X': {
+        'New': 'New',
+        'Good': 'Good',
+        'Usable': 'Scrap', # Assuming Usable maps to Scrap on X
+        'Scrap': 'Scrap',
+    },
+    'Y': {
+        'New': '3 stars (Excellent)',
+        'Good': '2 stars (Good)',
+        'Usable': '1 star (Usable)',
+        'Scrap': '1 star (Usable)', # Assuming Scrap maps to Usable on Y
+    },
+    'Z': {
+        'New': 'New',
+        'Good': 'As New', # Assuming Good maps to As New on Z
+        'Usable': 'Good', # Assuming Usable maps to Good on Z
+        'Scrap': 'Good', # Assuming Scrap maps to Good on Z
+    }
+}
+
+_lock = threading.Lock()
+_state = {'mappings': None, 'version': None, 'checked': 0.0}
+
+
+def current_version():
+    # A random token rather than a counter, so a cleared cache can't bring back an old version.
+    return cache.get_or_set(VERSION_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def invalidate():
+    """
+    Drops this process's mappings and tells other processes to drop theirs, along with
+    the cached pages showing the old categories.
+    """
+    with _lock:
+        _state['mappings'] = None
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    pagecache.bump_tags('listing')
+
+
+def _load():
+    from .models import PlatformConditionMapping
+
+    mappings = {}
+    rows = PlatformConditionMapping.objects.values_list('platform_id', 'general_condition', 'platform_category')
+    for platform_id, general_condition, category in rows:
+        mappings.setdefault(platform_id, {})[general_condition] = category
+    return mappings
+
+
+def mappings():
+    """
+    Returns {platform_id: {general_condition: platform_category}} for every platform.
+    """
+    now = time.monotonic()
+    state = _state
+    if state['mappings'] is not None and now - state['checked'] < CHECK_INTERVAL:
+        return state['mappings']
+    version = current_version()
+    with _lock:
+        if state['mappings'] is None or state['version'] != version:
+            state['mappings'] = _load()
+            state['version'] = version
+        state['checked'] = now
+        return state['mappings']
+
+
+def platform_category(platform_id, general_condition):
+    return mappings().get(platform_id, {}).get(general_condition, UNKNOWN)
+
+
+def map_conditions(pairs):
+    """
+    Resolves an iterable of (platform_id, general_condition) pairs to a list of categories.
+    """
+    table = mappings()
+    return [table.get(platform_id, {}).get(general_condition, UNKNOWN) for platform_id, general_condition in pairs]
+
+
+def map_listings(listings):
+    """
+    Sets platform_condition_category on each listing in place and returns the listings.
+    The phones must already be loaded (select_related('phone')); nothing else is queried.
+    """
+    listings = list(listings)
+    categories = map_conditions((listing.platform_id, listing.phone.condition) for listing in listings)
+    for listing, category in zip(listings, categories):
+        listing.platform_condition_category = category
+    return listings
+
+
+def seed_defaults(platform):
+    """
+    Creates the DEFAULT_MAPPINGS rows for platform if it is one of the original platforms.
+    """
+    from .models import PlatformConditionMapping
+
+    defaults = DEFAULT_MAPPINGS.get(platform.name)
+    if not defaults:
+        return
+    PlatformConditionMapping.objects.bulk_create(
+        [
+            PlatformConditionMapping(platform=platform, general_condition=condition, platform_category=category)
+            for condition, category in defaults.items()
+        ],
+        ignore_conflicts=True,
+    )
+    invalidate()
@@ -0,0 +1,199 @@
+# inventory/database.py
+
+"""
+Database connection tuning and read-replica routing.
+
+Every new SQLite connection runs the PRAGMAs in settings.SQLITE_PRAGMAS, plus those in its
+DATABASES entry's 'PRAGMAS' (see signals.py). The defaults switch the file to WAL, where
+readers never block the single writer and the writer never blocks readers, commit with
+synchronous=NORMAL (durable across a crash of the process, and consistent across a power
+loss, but a power loss can roll back the last commits), map the file into memory and wait
+for the write lock instead of failing at once. PRAGMAs are run on the raw connection, so
+they neither count against query budgets nor show up in connection.queries.
+
+ReadReplicaRouter sends the reads of ListView and DetailView requests (GET and HEAD only)
+to the REPLICA database alias when it is configured and no transaction is open on the
+primary; everything else, and every write, uses 'default'. ReadReplicaMiddleware marks those requests. For SQLite the replica is the
+same file opened by a second set of connections that are read-only (query_only=ON), so a
+stray write in a list or detail view fails instead of taking the writer lock; with a
+database server it would point at a streaming replica.
+
+retry_on_lock() retries writes that still find the database locked after busy_timeout.
+estimated_count() gives admin changelists a row count without a COUNT(*) over the whole table.
+"""
+
+import functools
+import logging
+import random
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.views.generic import DetailView, ListView
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+REPLICA_VIEWS = (ListView, DetailView)
+READ_METHODS = ('GET', 'HEAD')
+
+_routing = ContextVar('replica_routing', default=None)
+
+
+def pragmas_for(connection):
+    """
+    Returns the {name: value} PRAGMAs for a connection; None values are left at SQLite's default.
+    """
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    pragmas.update(connection.settings_dict.get('PRAGMAS', {}))
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def configure(connection):
+    """
+    Applies the configured PRAGMAs to a newly opened SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    raw = connection.connection
+    for name, value in pragmas_for(connection).items():
+        if name == 'journal_mode':
+            # Stored in the database file. Changing it needs every other connection closed,
+            # so it's only attempted when the file isn't in that mode yet.
+            current = raw.execute('PRAGMA journal_mode').fetchone()[0]
+            if current.lower() == str(value).lower():
+                continue
+            try:
+                raw.execute(f'PRAGMA journal_mode = {value}')
+            except sqlite3.OperationalError as exc:
+                logger.warning("Couldn't switch %s from journal_mode %s to %s: %s", connection.alias, current, value, exc)
+            continue
+        raw.execute(f'PRAGMA {name} = {value}')
+
+
+def pragma(connection, name):
+    """
+    Reads the current value of a PRAGMA, e.g. pragma(connection, 'journal_mode') -> 'wal'.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
+
+
+def retry_on_lock(func=None, attempts=8, base_delay=0.02, max_delay=1.0):
+    """
+    Retries func when SQLite reports "database is locked", sleeping with exponential backoff
+    and jitter between attempts. Wrap whole transactions: a transaction that hit the error
+    has already been rolled back, so retrying inside it would be meaningless.
+    """
+    if func is None:
+        return functools.partial(retry_on_lock, attempts=attempts, base_delay=base_delay, max_delay=max_delay)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(attempts):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if 'locked' not in str(exc) or attempt == attempts - 1:
+                    raise
+                delay = min(max_delay, base_delay * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+    return wrapper
+
+
+def estimated_count(queryset, exact_below=10000):
+    """
+    A cheap estimate of the number of rows in the queryset's table, for an unfiltered
+    queryset; exact when the estimate is below exact_below. PostgreSQL's planner statistics
+    give the estimate there; on SQLite it is the span of rowids, which counts deleted rows
+    until their ids are reused. Returns None for other databases and for filtered querysets.
+    """
+    if queryset.query.where or queryset.query.combinator:
+        return None
+    connection = connections[queryset.db]
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'SELECT MAX(rowid) - MIN(rowid) + 1 FROM {table}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    estimate = row[0] if row and row[0] is not None else 0
+    if estimate < exact_below:
+        return queryset.count()
+    return estimate
+
+
+class Routing:
+    def __init__(self):
+        self.use_replica = False
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or not routing.use_replica or REPLICA not in settings.DATABASES:
+            return None
+        # Reads inside a transaction on the primary must see its uncommitted writes (this is
+        # also what keeps TestCase, which runs every test in a transaction, on 'default').
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        # Also for objects that were read from the replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        databases = {DEFAULT_DB_ALIAS, REPLICA}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        return db != REPLICA
+
+
+class ReadReplicaMiddleware:
+    """
+    Routes the reads of GET and HEAD requests to ListView and DetailView views to the replica.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _routing.set(Routing())
+        try:
+            return self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+    async def __acall__(self, request):
+        token = _routing.set(Routing())
+        try:
+            return await self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        routing = _routing.get()
+        if routing is not None and request.method in READ_METHODS:
+            routing.use_replica = view_class is not None and issubclass(view_class, REPLICA_VIEWS)
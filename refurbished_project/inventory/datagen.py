@@ -0,0 +1,344 @@
+# inventory/datagen.py
+
+"""
+Deterministic synthetic data at scale, for capacity planning and load tests.
+
+Rows are written with executemany() straight into each model's table, one transaction per
+batch, which is what makes tens of millions of rows feasible: building model instances
+and going through bulk_create (999 SQL parameters per statement on SQLite) costs several
+times more per row. Columns a generator doesn't set get their model field defaults, so
+the rows are indistinguishable from ones the ORM would have written.
+
+Nothing existing is deleted or modified; generated names, SKUs and usernames carry a
+per-run number so repeated runs don't collide. Each table draws from its own random
+stream derived from the seed, so the same seed always produces the same data even when
+other cardinalities change. Bulk inserts bypass model signals, so the derived tables
+(facet counts, search index, rating aggregates, order rollups) are rebuilt once at the
+end.
+"""
+
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, models, transaction
+
+from . import analytics, conditions, facets, listings, pagecache, ratings, recommendations, search
+from .benchmarks import BRAND_NAMES, CAMERA_QUALITIES, COLORS, CONDITIONS, MEMORY_SIZES
+from .models import (
+    Brand, Cart, CartItem, Listing, Order, Phone, Platform, PlatformConditionMapping, Review,
+    platform_selling_price,
+)
+
+DEFAULT_BATCH_SIZE = 10000
+# Every generated user can log in with this password (used by the loadtest command).
+USER_PASSWORD = 'loadtest'
+USERNAME_PREFIX = 'loaduser'
+HISTORY_SECONDS = 365 * 24 * 3600
+COMMENTS = ['Great phone', 'Works as described', 'Battery could be better', 'Like new', 'Fast delivery', 'Okay for the price']
+# Skewed towards good ratings, as real reviews are.
+RATING_WEIGHTS = [1, 2, 5, 12, 20]
+# Cardinalities in dependency order, as accepted by Generator.run().
+ENTITIES = ('users', 'brands', 'platforms', 'phones', 'listings', 'orders', 'reviews', 'carts')
+
+
+def _concrete_fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if not isinstance(field, (models.AutoField, models.BigAutoField))
+    ]
+
+
+def insert_rows(model, fields, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Inserts tuples of values for fields (model field names) into model's table with
+    executemany(), batch_size rows per transaction. Other columns get their field defaults.
+    Returns the number of rows inserted.
+    """
+    by_name = {field.name: field for field in _concrete_fields(model)}
+    given = [by_name[name] for name in fields]
+    rest = [field for field in by_name.values() if field.name not in fields]
+    defaults = tuple(field.get_db_prep_save(field.get_default(), connection) for field in rest)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in given + rest)
+    placeholders = ', '.join(['%s'] * (len(given) + len(rest)))
+    sql = f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+
+    inserted = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append(tuple(row) + defaults)
+            if len(batch) >= batch_size:
+                with transaction.atomic():
+                    cursor.executemany(sql, batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                cursor.executemany(sql, batch)
+            inserted += len(batch)
+    return inserted
+
+
+def picker(rng):
+    """
+    Returns pick(sequence), a faster rng.choice(): Random.choice() costs several calls per
+    row, which dominates generating millions of rows.
+    """
+    random = rng.random
+
+    def pick(sequence):
+        return sequence[int(random() * len(sequence))]
+    return pick
+
+
+def money(cents):
+    # Decimal columns take their text form; formatting integer cents beats Decimal arithmetic per row.
+    return f'{cents // 100}.{cents % 100:02d}'
+
+
+@contextmanager
+def bulk_load():
+    """
+    On SQLite, skips the fsync at each commit and enlarges the page cache while loading.
+    A crash mid-load can lose the last batches, never corrupt the file. SQLite refuses
+    the change inside a transaction, where the defaults are kept.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA synchronous')
+        synchronous = cursor.fetchone()[0]
+        cursor.execute('PRAGMA cache_size')
+        cache_size = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous = OFF')
+        cursor.execute('PRAGMA cache_size = -262144')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+            cursor.execute(f'PRAGMA cache_size = {int(cache_size)}')
+
+
+def _max_pk(model):
+    return model.objects.aggregate(top=models.Max('pk'))['top'] or 0
+
+
+def _new_ids(model, before):
+    """
+    Ids inserted since max pk was before, ascending. Ids grow monotonically on SQLite, and
+    with a single writer they are contiguous, in which case a range saves holding them all.
+    Rows between the first and last id are all new, so pk__range selects exactly these.
+    """
+    after = _max_pk(model)
+    count = model.objects.filter(pk__gt=before).count()
+    if count == after - before:
+        return range(before + 1, after + 1)
+    return list(model.objects.filter(pk__gt=before).order_by('pk').values_list('pk', flat=True))
+
+
+class Generator:
+    def __init__(self, seed=0, batch_size=DEFAULT_BATCH_SIZE, log=None):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        # Timestamps are stored the way the SQLite backend stores aware datetimes: naive UTC.
+        self.now = datetime.now(dt_timezone.utc).replace(microsecond=0, tzinfo=None)
+        self.counts = {}
+        # Grows with every run that inserted anything, so names from different runs never clash.
+        self.run_number = sum(_max_pk(model) for model in (User, Brand, Platform, Phone)) + 1
+
+    def rng(self, entity):
+        return random.Random(f'{self.seed}:{entity}')
+
+    def timestamp(self, rng):
+        return str(self.now - timedelta(seconds=int(rng.random() * HISTORY_SECONDS)))
+
+    def insert(self, model, fields, rows):
+        started = time.perf_counter()
+        count = insert_rows(model, fields, rows, self.batch_size)
+        elapsed = time.perf_counter() - started
+        self.counts[model._meta.model_name] = self.counts.get(model._meta.model_name, 0) + count
+        self.log(f'{model._meta.verbose_name_plural}: {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/sec)')
+        return count
+
+    def users(self, count):
+        rng = self.rng('users')
+        password = make_password(USER_PASSWORD)
+        before = _max_pk(User)
+        self.insert(User, ['username', 'password', 'email', 'date_joined'], (
+            (f'{USERNAME_PREFIX}{self.run_number}_{i}', password, f'{USERNAME_PREFIX}{self.run_number}_{i}@example.com', self.timestamp(rng))
+            for i in range(count)
+        ))
+        return _new_ids(User, before)
+
+    def brands(self, count):
+        before = _max_pk(Brand)
+        self.insert(Brand, ['name'], (
+            (f'{BRAND_NAMES[i % len(BRAND_NAMES)]} {self.run_number}-{i}',) for i in range(count)
+        ))
+        return _new_ids(Brand, before)
+
+    def platforms(self, count):
+        rng = self.rng('platforms')
+        before = _max_pk(Platform)
+        self.insert(Platform, ['name', 'fee_percentage', 'fixed_fee'], (
+            (f'Platform {self.run_number}-{i}', money(rng.randint(200, 2000)), money(rng.randint(0, 500)))
+            for i in range(count)
+        ))
+        ids = _new_ids(Platform, before)
+        categories = ['Excellent', 'Very Good', 'Good', 'Fair']
+        self.insert(PlatformConditionMapping, ['platform', 'general_condition', 'platform_category'], (
+            (platform_id, condition, categories[min(len(categories) - 1, index + rng.randint(0, 1))])
+            for platform_id in ids
+            for index, condition in enumerate(CONDITIONS)
+        ))
+        return ids
+
+    def phones(self, count, brand_ids):
+        rng = self.rng('phones')
+        pick = picker(rng)
+        prices = range(5000, 150001)
+        stock_levels = range(0, 101)
+        before = _max_pk(Phone)
+        # Maintaining the search index row by row is the slowest part of a phone insert;
+        # it is rebuilt in one pass instead.
+        search.drop_triggers()
+        try:
+            self.insert(Phone, [
+                'brand', 'name', 'sku', 'base_price', 'condition', 'stock', 'memory', 'camera_quality', 'color',
+            ], (
+                (
+                    pick(brand_ids) if brand_ids else None,
+                    f'Model {i}',
+                    f'GEN{self.run_number}-{i}',
+                    money(pick(prices)),
+                    pick(CONDITIONS),
+                    pick(stock_levels),
+                    pick(MEMORY_SIZES),
+                    pick(CAMERA_QUALITIES),
+                    pick(COLORS),
+                )
+                for i in range(count)
+            ))
+        finally:
+            search.install()
+        return _new_ids(Phone, before)
+
+    def listings(self, count, phone_ids, platform_ids):
+        if not phone_ids or not platform_ids:
+            return
+        rng = self.rng('listings')
+        per_phone = min(len(platform_ids), max(1, -(-count // len(phone_ids))))
+        platforms = {
+            pk: (fee, fixed)
+            for pk, fee, fixed in Platform.objects.filter(pk__in=platform_ids).values_list('pk', 'fee_percentage', 'fixed_fee')
+        }
+        conditions.invalidate()
+        mappings = conditions.mappings()
+        platform_list = list(platforms)
+
+        def rows():
+            remaining = count
+            for phone_id, base_price, condition in (
+                Phone.objects.filter(pk__range=(phone_ids[0], phone_ids[-1])).order_by('pk').values_list('pk', 'base_price', 'condition').iterator(chunk_size=self.batch_size)
+            ):
+                for platform_id in rng.sample(platform_list, min(per_phone, remaining)):
+                    fee, fixed = platforms[platform_id]
+                    price = platform_selling_price(base_price, fee, fixed)
+                    category = mappings.get(platform_id, {}).get(condition, conditions.UNKNOWN)
+                    yield phone_id, platform_id, str(price), category, rng.random() < 0.7
+                    remaining -= 1
+                if remaining <= 0:
+                    return
+
+        self.insert(Listing, ['phone', 'platform', 'platform_price', 'platform_condition_category', 'is_listed'], rows())
+
+    def orders(self, count, phone_ids):
+        if not phone_ids:
+            return
+        rng = self.rng('orders')
+        pick = picker(rng)
+        order_types = ('BUY', 'BUY', 'BUY', 'SELL')
+        quantities = (1, 1, 1, 2, 3)
+        statuses = ('COMPLETED',) * 8 + ('PENDING', 'CANCELLED')
+        prices = range(5000, 150001)
+
+        def rows():
+            for _ in range(count):
+                quantity = pick(quantities)
+                yield (
+                    pick(phone_ids), pick(order_types), quantity,
+                    money(pick(prices) * quantity), pick(statuses), self.timestamp(rng),
+                )
+
+        self.insert(Order, ['phone', 'order_type', 'quantity', 'total_price', 'status', 'created_at'], rows())
+
+    def reviews(self, count, phone_ids, user_ids):
+        if not phone_ids or not user_ids:
+            return
+        rng = self.rng('reviews')
+        pick = picker(rng)
+        ratings_pool = [rating for rating, weight in enumerate(RATING_WEIGHTS, 1) for _ in range(weight)]
+        self.insert(Review, ['phone', 'user', 'rating', 'comment', 'created_at'], (
+            (pick(phone_ids), pick(user_ids), pick(ratings_pool), pick(COMMENTS), self.timestamp(rng))
+            for _ in range(count)
+        ))
+
+    def carts(self, count, user_ids, phone_ids):
+        if not phone_ids or not user_ids:
+            return
+        rng = self.rng('carts')
+        owners = user_ids[:count]
+        before = _max_pk(Cart)
+        self.insert(Cart, ['user', 'created_at'], ((user_id, self.timestamp(rng)) for user_id in owners))
+        cart_ids = _new_ids(Cart, before)
+        self.insert(CartItem, ['cart', 'phone', 'quantity'], (
+            (cart_id, phone_id, rng.randint(1, 2))
+            for cart_id in cart_ids
+            for phone_id in rng.sample(phone_ids, min(len(phone_ids), rng.randint(1, 3)))
+        ))
+
+    def run(self, users=0, brands=0, platforms=0, phones=0, listings=0, orders=0, reviews=0, carts=0):
+        """
+        Generates the requested number of rows of each kind and rebuilds derived data.
+        Dependent rows (listings, orders, ...) only point at rows generated by this run,
+        plus existing brands if none are generated. Returns {model name: rows inserted}.
+        """
+        started = time.perf_counter()
+        with bulk_load():
+            user_ids = self.users(users) if users else []
+            brand_ids = self.brands(brands) if brands else list(Brand.objects.values_list('pk', flat=True))
+            platform_ids = self.platforms(platforms) if platforms else []
+            phone_ids = self.phones(phones, brand_ids) if phones else []
+            self.listings(listings, phone_ids, platform_ids)
+            self.orders(orders, phone_ids)
+            self.reviews(reviews, phone_ids, user_ids)
+            self.carts(carts, user_ids, phone_ids)
+        self.rebuild_derived(
+            phones=bool(phone_ids), reviews=bool(reviews and phone_ids and user_ids), orders=bool(orders and phone_ids),
+        )
+        self.log(f'Generated {sum(self.counts.values())} rows in {time.perf_counter() - started:.1f}s')
+        return self.counts
+
+    def rebuild_derived(self, phones, reviews, orders):
+        if phones:
+            self.log('Rebuilding search index and facet counts...')
+            search.rebuild()
+            facets.rebuild()
+            # Computed by rebuild_recommendations, which rebuilds everything when this much is queued.
+            recommendations.queue_all()
+        if reviews:
+            self.log('Reconciling rating aggregates...')
+            ratings.reconcile(batch_size=self.batch_size)
+        if orders:
+            self.log('Rebuilding order rollups...')
+            analytics.rebuild()
+        conditions.invalidate()
+        listings.bump_platforms_version()
+        pagecache.bump_tags('brand', 'phone', 'review', 'listing')
@@ -0,0 +1,322 @@
+# inventory/facets.py
+
+"""
+Faceted navigation for the phone catalog.
+
+Every phone falls into exactly one "cell": a combination of brand, condition, memory,
+color, camera quality and price bucket. PhoneFacetCount stores how many phones each cell
+holds. There are only a few thousand cells, however large the catalog gets, so each
+facet's counts come from one GROUP BY over the cell table instead of one COUNT(*) per value.
+
+Counts are disjunctive: the counts for a facet apply every active filter except that
+facet's own, so picking "Good" still shows how many "New" phones match the other filters.
+
+Assembled facet lists are also cached per query string under a version number that every
+count change bumps, so repeated requests (paging, re-sorting) cost a single cache read.
+"""
+
+import hashlib
+
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+
+from .catalog import CatalogQuery, _parse_decimal, _parse_int
+from .models import Brand, Phone, PhoneFacetCount
+
+# (lower bound, upper bound) in dollars. Upper bounds are exclusive; None means unbounded.
+PRICE_BUCKETS = [
+    (0, 100),
+    (100, 200),
+    (200, 300),
+    (300, 500),
+    (500, 750),
+    (750, 1000),
+    (1000, None),
+]
+
+# facet name -> (label, column, GET parameters the facet owns)
+FACETS = {
+    'brand': ('Brand', 'brand_id', ('brand',)),
+    'condition': ('Condition', 'condition', ('condition',)),
+    'memory': ('Memory', 'memory', ('memory',)),
+    'color': ('Color', 'color', ('color',)),
+    'camera_quality': ('Camera Quality', 'camera_quality', ('camera_quality',)),
+    'price_bucket': ('Price', 'price_bucket', ('min_price', 'max_price')),
+}
+
+# Phone fields that decide which cell a phone belongs to.
+CELL_FIELDS = ('brand_id', 'condition', 'memory', 'color', 'camera_quality', 'base_price')
+
+CENT = Decimal('0.01')
+
+VERSION_KEY = 'facets:version'
+CACHE_TIMEOUT = 300
+
+
+def price_bucket(price):
+    price = Decimal(price)
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        if high is None or price < high:
+            return index
+    return len(PRICE_BUCKETS) - 1
+
+
+def bucket_label(index):
+    low, high = PRICE_BUCKETS[index]
+    return f'${low}+' if high is None else f'${low} - ${high}'
+
+
+def cell_key(values):
+    """
+    Maps a dict of CELL_FIELDS values to the PhoneFacetCount lookup for its cell.
+    """
+    return {
+        'brand_id': values['brand_id'],
+        'condition': values['condition'],
+        'memory': values['memory'],
+        'color': values['color'] or '',
+        'camera_quality': values['camera_quality'] or '',
+        'price_bucket': price_bucket(values['base_price']),
+    }
+
+
+def phone_cell_key(phone):
+    return cell_key({field: getattr(phone, field) for field in CELL_FIELDS})
+
+
+def current_version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def adjust(key, delta):
+    """
+    Adds delta to the count of one cell, creating the cell for a positive delta. A negative
+    delta the cell can't take (a missing cell, or a count that would go below zero) means the
+    counts are already out of step with Phone; it is dropped rather than stored, and
+    rebuild() puts the counts right.
+    """
+    with transaction.atomic():
+        cells = PhoneFacetCount.objects.filter(**key)
+        if delta < 0:
+            cells = cells.filter(count__gte=-delta)
+        updated = cells.update(count=F('count') + delta)
+        if not updated and delta > 0:
+            PhoneFacetCount.objects.create(count=delta, **key)
+    bump_version()
+
+
+def move(old_key, new_key):
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        adjust(old_key, -1)
+    if new_key is not None:
+        adjust(new_key, 1)
+
+
+def _bucket_expression():
+    whens = [
+        When(base_price__lt=high, then=Value(index))
+        for index, (low, high) in enumerate(PRICE_BUCKETS) if high is not None
+    ]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1), output_field=IntegerField())
+
+
+def rebuild():
+    """
+    Recomputes every cell from the Phone table with a single GROUP BY.
+    Needed after writes that bypass signals (bulk_create, QuerySet.update, Brand deletion).
+    """
+    rows = (
+        Phone.objects.annotate(price_bucket=_bucket_expression())
+        .values('brand_id', 'condition', 'memory', 'color', 'camera_quality', 'price_bucket')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    cells = [PhoneFacetCount(**row) for row in rows.iterator()]
+    with transaction.atomic():
+        PhoneFacetCount.objects.all().delete()
+        PhoneFacetCount.objects.bulk_create(cells, batch_size=1000)
+    bump_version()
+    return len(cells)
+
+
+class FacetEngine:
+    """
+    Answers a PhoneListView query with one page of results plus counts for every facet.
+
+    Uses a constant number of queries (one for the page, one per facet, one for brand names)
+    whatever the filters are. Filters the cell table can't express (see uses_cells) are
+    counted against Phone directly instead.
+    """
+
+    def __init__(self, params, catalog=None):
+        self.params = params
+        self.catalog = catalog or CatalogQuery(params)
+
+    def _price_bucket_range(self):
+        """
+        Returns (first, last) bucket indexes covered by the price filter, or None when
+        the filter doesn't fall on bucket boundaries.
+        """
+        lows = [Decimal(low) for low, high in PRICE_BUCKETS]
+        highs = [Decimal(high) - CENT if high is not None else None for low, high in PRICE_BUCKETS]
+        min_price = _parse_decimal(self.params.get('min_price'))
+        max_price = _parse_decimal(self.params.get('max_price'))
+
+        first, last = 0, len(PRICE_BUCKETS) - 1
+        if min_price is not None:
+            if min_price not in lows:
+                return None
+            first = lows.index(min_price)
+        if max_price is not None:
+            if max_price not in highs:
+                return None
+            last = highs.index(max_price)
+        return first, last
+
+    def uses_cells(self):
+        """
+        Whether the active filters can be answered from the cell table. Free-text search,
+        a minimum rating and price bounds between bucket boundaries need the Phone table itself.
+        """
+        if self.params.get('q') or self.params.get('min_rating'):
+            return False
+        return self._price_bucket_range() is not None
+
+    def _filter_cells(self, queryset, skip):
+        params = self.params
+        if 'brand' not in skip:
+            brand = _parse_int(params.get('brand'))
+            if brand is not None:
+                queryset = queryset.filter(brand_id=brand)
+        if 'memory' not in skip:
+            memory = _parse_int(params.get('memory'))
+            if memory is not None:
+                queryset = queryset.filter(memory=memory)
+        if 'condition' not in skip and params.get('condition'):
+            queryset = queryset.filter(condition=params['condition'])
+        if 'color' not in skip and params.get('color'):
+            queryset = queryset.filter(color__icontains=params['color'])
+        if 'camera_quality' not in skip and params.get('camera_quality'):
+            queryset = queryset.filter(camera_quality=params['camera_quality'])
+        if 'price_bucket' not in skip:
+            first, last = self._price_bucket_range()
+            if first > 0:
+                queryset = queryset.filter(price_bucket__gte=first)
+            if last < len(PRICE_BUCKETS) - 1:
+                queryset = queryset.filter(price_bucket__lte=last)
+        return queryset
+
+    def _params_without(self, facet):
+        params = self.params.copy()
+        for key in FACETS[facet][2]:
+            params.pop(key, None)
+        return params
+
+    def counts(self, facet):
+        """
+        Returns {value: count} for one facet under every other active filter.
+        """
+        column = FACETS[facet][1]
+        if self.uses_cells():
+            rows = (
+                self._filter_cells(PhoneFacetCount.objects.all(), skip={facet})
+                .values(column)
+                .annotate(n=Sum('count'))
+                .order_by()
+            )
+        else:
+            queryset = CatalogQuery(self._params_without(facet)).filter()
+            if facet == 'price_bucket':
+                queryset = queryset.annotate(price_bucket=_bucket_expression())
+            rows = queryset.values(column).annotate(n=Count('id')).order_by()
+        return {row[column]: row['n'] for row in rows if row['n'] > 0}
+
+    def _link(self, facet, value):
+        params = self._params_without(facet)
+        params.pop('cursor', None)
+        if facet == 'price_bucket':
+            low, high = PRICE_BUCKETS[value]
+            params['min_price'] = str(low)
+            if high is not None:
+                params['max_price'] = str(Decimal(high) - CENT)
+        else:
+            params[FACETS[facet][2][0]] = value
+        return params.urlencode()
+
+    def _selected(self, facet, value):
+        if facet == 'price_bucket':
+            bucket_range = self._price_bucket_range()
+            return bucket_range == (value, value) and bool(self.params.get('min_price'))
+        return str(self.params.get(FACETS[facet][2][0], '')) == str(value)
+
+    def cache_key(self):
+        params = self.params.copy()
+        params.pop('cursor', None)
+        digest = hashlib.md5(params.urlencode().encode()).hexdigest()
+        return f'facets:{current_version()}:{digest}'
+
+    def facets(self):
+        """
+        Returns the facet lists for the sidebar, from the cache when the counts haven't changed.
+        """
+        key = self.cache_key()
+        result = cache.get(key)
+        if result is None:
+            result = self.compute()
+            cache.set(key, result, CACHE_TIMEOUT)
+        return result
+
+    def compute(self):
+        brand_names = dict(Brand.objects.values_list('id', 'name'))
+        result = []
+        for facet, (label, column, keys) in FACETS.items():
+            counts = self.counts(facet)
+            values = []
+            for value in sorted(counts, key=lambda v: (v is None, v)):
+                if value is None or value == '':
+                    continue
+                if facet == 'brand':
+                    value_label = brand_names.get(value, value)
+                elif facet == 'memory':
+                    value_label = f'{value}GB'
+                elif facet == 'price_bucket':
+                    value_label = bucket_label(value)
+                else:
+                    value_label = value
+                values.append({
+                    'value': value,
+                    'label': value_label,
+                    'count': counts[value],
+                    'query': self._link(facet, value),
+                    'selected': self._selected(facet, value),
+                })
+            if facet == 'brand':
+                values.sort(key=lambda item: str(item['label']))
+            clear = self._params_without(facet)
+            clear.pop('cursor', None)
+            result.append({
+                'name': facet,
+                'label': label,
+                'values': values,
+                'active': any(self.params.get(key) for key in keys),
+                'clear_query': clear.urlencode(),
+            })
+        return result
+
+    def search(self, cursor=None):
+        """
+        Returns (page, facets) for the current parameters.
+        """
+        return self.catalog.page(cursor), self.facets()
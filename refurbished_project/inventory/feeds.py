@@ -0,0 +1,283 @@
+# inventory/feeds.py
+
+"""
+Streaming inventory import and export (CSV or JSON Lines).
+
+Imports read one row at a time and write in batches: each batch is validated against the
+Phone field constraints without touching the database, de-duplicated on the upsert key
+and written with one INSERT ... ON CONFLICT DO UPDATE inside its own transaction, so
+memory stays bounded by the batch size whatever the size of the feed. Brands are resolved
+through a name -> id map loaded once.
+
+A blank cell, or a key missing from a JSON Lines row, means "no value": a new phone gets
+the field's default and an existing one keeps what it has, so each row only updates the
+columns it has values for.
+
+Bulk writes send no model signals, so facet counts are rebuilt, every phone is queued for
+new recommendations and cached pages are invalidated once at the end of an import.
+"""
+
+import csv
+import itertools
+import json
+import time
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import facets, pagecache, recommendations
+from .models import Brand, Phone
+
+FORMATS = ('csv', 'jsonl')
+# Columns a feed may carry, in export order. brand is the brand's name.
+FEED_FIELDS = ('id', 'sku', 'brand', 'name', 'base_price', 'condition', 'stock', 'memory', 'color', 'camera_quality')
+REQUIRED_FIELDS = ('name', 'base_price', 'condition')
+KEYS = ('sku', 'id')
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class FeedError(ValueError):
+    """
+    Raised when a feed can't be imported at all (unknown format, missing columns).
+    """
+
+
+class RowError(ValueError):
+    """
+    Raised for a single invalid row; the import skips the row and carries on.
+    """
+
+
+class ImportStats:
+    """
+    Counters for one import run, with throughput.
+    """
+
+    def __init__(self):
+        self.read = 0
+        self.written = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        return self
+
+    @property
+    def seconds(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.read} rows read, {self.written} upserted, {self.rejected} rejected in {self.seconds:.2f}s "
+            f"({self.rows_per_second:.0f} rows/sec)"
+        )
+
+
+def detect_format(path, fmt=None):
+    if fmt is None:
+        fmt = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+        fmt = {'json': 'jsonl', 'ndjson': 'jsonl'}.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise FeedError(f"Unknown feed format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    return fmt
+
+
+def open_feed(stream, fmt):
+    """
+    Returns (columns, rows) for a feed, where rows lazily yields (line number, dict) pairs.
+    A JSON Lines feed's columns are the keys of its first row.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        columns = reader.fieldnames or []
+        return columns, ((reader.line_num, row) for row in reader)
+
+    rows = _json_rows(stream)
+    first = next(rows, None)
+    if first is None:
+        return [], iter(())
+    columns = list(first[1]) if isinstance(first[1], dict) else []
+    return columns, itertools.chain([first], rows)
+
+
+def _json_rows(stream):
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as exc:
+            # Reported as a rejected row rather than aborting the whole import.
+            yield line_number, exc
+
+
+class BrandResolver:
+    """
+    In-memory brand name -> id map, optionally creating brands it hasn't seen.
+    """
+
+    def __init__(self, create=False):
+        self.create = create
+        self.ids = {}
+        for pk, name in Brand.objects.values_list('pk', 'name'):
+            self.ids[name] = pk
+            self.ids.setdefault(name.lower(), pk)
+
+    def resolve(self, name):
+        name = (name or '').strip()
+        if not name:
+            return None
+        pk = self.ids.get(name, self.ids.get(name.lower()))
+        if pk is None:
+            if not self.create:
+                raise RowError(f"Unknown brand {name!r}.")
+            pk = Brand.objects.get_or_create(name=name)[0].pk
+            self.ids[name] = self.ids[name.lower()] = pk
+        return pk
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def build_phone(row, columns, brands, key):
+    """
+    Turns one feed row into an unsaved, validated Phone and the tuple of columns the row
+    has values for. Raises RowError.
+    """
+    if not isinstance(row, dict):
+        raise RowError(f"Expected an object, got {type(row).__name__}.")
+    if _blank(row.get(key)):
+        raise RowError(f"Missing {key}.")
+    values = {}
+    given = []
+    for field in columns:
+        value = row.get(field)
+        if (field == 'id' and key != 'id') or _blank(value):
+            continue
+        given.append(field)
+        if field == 'brand':
+            values['brand_id'] = brands.resolve(value)
+        elif field in ('color', 'camera_quality', 'sku'):
+            values[field] = str(value).strip()
+        else:
+            values[field] = value.strip() if isinstance(value, str) else value
+    for field in REQUIRED_FIELDS:
+        if field not in values:
+            raise RowError(f"Missing {field}.")
+    phone = Phone(**values)
+    try:
+        # Field-level checks only (types, max_length, choices, validators): no queries.
+        phone.clean_fields(exclude=['brand', 'image'])
+    except ValidationError as exc:
+        raise RowError('; '.join(f"{field}: {' '.join(messages)}" for field, messages in exc.message_dict.items()))
+    return phone, tuple(given)
+
+
+def write_batch(rows, key):
+    """
+    Upserts (phone, columns) pairs from build_phone(), with one INSERT ... ON CONFLICT per
+    distinct set of columns, so a conflict only overwrites the columns the row has values for.
+    """
+    # The same key twice in one INSERT ... ON CONFLICT is an error in SQLite; the last row wins.
+    unique = {getattr(phone, key): (phone, given) for phone, given in rows}
+    groups = defaultdict(list)
+    for phone, given in unique.values():
+        groups[tuple(column for column in given if column not in ('id', key))].append(phone)
+    with transaction.atomic():
+        for update_fields, phones in groups.items():
+            Phone.objects.bulk_create(
+                phones,
+                batch_size=len(phones),
+                update_conflicts=True,
+                unique_fields=[key],
+                update_fields=list(update_fields),
+            )
+    return len(unique)
+
+
+def import_rows(rows, columns, key='sku', batch_size=DEFAULT_BATCH_SIZE, create_brands=False, max_errors=100):
+    """
+    Upserts (line number, row) pairs from open_feed() into Phone. Returns ImportStats.
+
+    columns are the feed's columns: only those a row has values for are written on
+    conflict, so a feed without a stock column, or a row with a blank stock cell, leaves
+    existing stock alone.
+    """
+    if key not in KEYS:
+        raise FeedError(f"Unknown key {key!r}; use one of {', '.join(KEYS)}.")
+    columns = [column for column in columns if column in FEED_FIELDS]
+    missing = [field for field in (key,) + REQUIRED_FIELDS if field not in columns]
+    if missing:
+        raise FeedError(f"Feed is missing required column(s): {', '.join(missing)}.")
+
+    brands = BrandResolver(create=create_brands)
+    stats = ImportStats()
+    batch = []
+    for line_number, row in rows:
+        stats.read += 1
+        try:
+            if isinstance(row, Exception):
+                raise RowError(str(row))
+            batch.append(build_phone(row, columns, brands, key))
+        except RowError as exc:
+            stats.rejected += 1
+            if len(stats.errors) < max_errors:
+                stats.errors.append((line_number, str(exc)))
+        if len(batch) >= batch_size:
+            stats.written += write_batch(batch, key)
+            batch = []
+    if batch:
+        stats.written += write_batch(batch, key)
+
+    if stats.written:
+        facets.rebuild()
+        recommendations.queue_all()
+        pagecache.bump_tags('brand', 'phone')
+    return stats.finish()
+
+
+def import_feed(stream, fmt, **kwargs):
+    columns, rows = open_feed(stream, fmt)
+    return import_rows(rows, columns, **kwargs)
+
+
+def export_rows(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields one dict per phone in FEED_FIELDS order, streaming from the database.
+    """
+    if queryset is None:
+        queryset = Phone.objects.all()
+    columns = ['id', 'sku', 'brand__name', 'name', 'base_price', 'condition', 'stock', 'memory', 'color', 'camera_quality']
+    for values in queryset.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size):
+        row = dict(zip(FEED_FIELDS, values))
+        row['base_price'] = str(row['base_price'])
+        yield row
+
+
+def write_feed(stream, fmt, rows):
+    """
+    Writes rows to stream as CSV or JSON Lines. Returns the number of rows written.
+    """
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FEED_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps(row) + '\n')
+            count += 1
+    return count
@@ -0,0 +1,225 @@
+# inventory/fileserver.py
+
+"""
+In-process static and media file server.
+
+With settings.SERVE_FILES on, the site serves STATIC_ROOT and MEDIA_ROOT itself, so a
+single process needs no separate web server for them. Compared with django.views.static
+(which is meant for development only) every response carries:
+
+- ETag (size and modification time) and Last-Modified, and conditional requests
+  (If-None-Match, If-Modified-Since, ...) get a 304 without opening the file;
+- Cache-Control: a year and immutable for content-hashed names (static files listed in
+  the collectstatic manifest, media derivatives/ from inventory/images.py),
+  STATIC_MAX_AGE / MEDIA_MAX_AGE seconds for everything else;
+- Accept-Ranges: a single byte range (Range: bytes=a-b, a- or -n) gets a 206 with only
+  those bytes, honouring If-Range; an unsatisfiable one gets a 416;
+- for static files, the precompressed .br/.gz copy made by collectstatic (see
+  inventory/staticfiles.py) when the client accepts it, with Vary: Accept-Encoding.
+  Range requests always get the uncompressed file.
+
+The body is a FileResponse around the open file, so WSGI servers that provide
+wsgi.file_wrapper (gunicorn, uWSGI) send it from the file descriptor with sendfile(2)
+instead of copying it through Python; ranges are positioned on the descriptor and bounded
+by Content-Length, so they are sent the same way.
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import images, staticfiles
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+DEFAULT_STATIC_MAX_AGE = 60
+DEFAULT_MEDIA_MAX_AGE = 24 * 60 * 60
+BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """
+    A file object limited to length bytes from start, for FileResponse.
+
+    The underlying file is positioned at start, so a server doing sendfile() from the
+    descriptor starts there; read() stops at the end of the range.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Returns (start, length) for a single-range Range header, None to ignore the header
+    (absent, malformed, or several ranges) or raises ValueError if it can't be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last n bytes.
+        length = min(int(last), size)
+        if length == 0:
+            raise ValueError(header)
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def accepted_encodings(request):
+    """
+    The content codings in the request's Accept-Encoding, without those refused with q=0.
+    """
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.partition(';')
+        try:
+            quality = float(params.strip().removeprefix('q=')) if params.strip() else 1.0
+        except ValueError:
+            continue
+        if coding.strip() and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def if_range_matches(request, etag, last_modified):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        # Only a strong validator can make a range request conditional.
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def serve(request, path, document_root, cache_control=None, precompressed=False):
+    """
+    Serves the file at path under document_root (see the module docstring).
+    cache_control is a function of the path returning the Cache-Control value.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(document_root, path)
+        st = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('"%s" does not exist' % path)
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404('"%s" does not exist' % path)
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    if encoding or not content_type:
+        # A compressed file asked for by name (style.css.gz) is sent as is, not decoded.
+        content_type = 'application/octet-stream'
+    size = st.st_size
+    last_modified = int(st.st_mtime)
+    etag = f'"{size:x}-{st.st_mtime_ns:x}"'
+    content_encoding = None
+    byte_range = None
+    if precompressed and not request.headers.get('Range'):
+        accepted = accepted_encodings(request)
+        for coding, suffix in staticfiles.encodings():
+            if coding in accepted and os.path.isfile(fullpath + suffix):
+                fullpath, content_encoding = fullpath + suffix, coding
+                size = os.stat(fullpath).st_size
+                etag = f'{etag[:-1]}-{coding}"'
+                break
+    elif if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+    }
+    if cache_control is not None:
+        headers['Cache-Control'] = cache_control(path)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        response = not_modified
+    elif request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    else:
+        start, length = byte_range or (0, size)
+        response = FileResponse(FileRange(open(fullpath, 'rb'), start, length), content_type=content_type)
+        response.block_size = BLOCK_SIZE
+        if byte_range:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    if response.status_code in (200, 206):
+        response['Content-Length'] = str(byte_range[1] if byte_range else size)
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+    for name, value in headers.items():
+        response[name] = value
+    if precompressed:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def static_cache_control(path):
+    is_hashed = getattr(staticfiles_storage, 'is_hashed', None)
+    if is_hashed is not None and is_hashed(path):
+        return IMMUTABLE
+    return f"public, max-age={getattr(settings, 'STATIC_MAX_AGE', DEFAULT_STATIC_MAX_AGE)}"
+
+
+def media_cache_control(path):
+    if path.startswith(images.DIRECTORY + '/'):
+        return IMMUTABLE
+    return f"public, max-age={getattr(settings, 'MEDIA_MAX_AGE', DEFAULT_MEDIA_MAX_AGE)}"
+
+
+def urlpatterns():
+    """
+    URL patterns serving STATIC_URL from STATIC_ROOT and MEDIA_URL from MEDIA_ROOT.
+    """
+    patterns = []
+    served = (
+        (settings.STATIC_URL, settings.STATIC_ROOT, static_cache_control, True),
+        (settings.MEDIA_URL, settings.MEDIA_ROOT, media_cache_control, False),
+    )
+    for prefix, root, cache_control, precompressed in served:
+        if not prefix or not root or '://' in prefix:
+            continue
+        kwargs = {'document_root': root, 'cache_control': cache_control, 'precompressed': precompressed}
+        patterns.append(re_path(r'^%s(?P<path>.*)$' % re.escape(prefix.lstrip('/')), serve, kwargs))
+    return patterns
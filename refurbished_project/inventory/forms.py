@@ -9,3 +9,9 @@ class ReviewForm(forms.ModelForm):
             'rating': forms.NumberInput(attrs={'class': 'w-full p-2 border rounded', 'min': 1, 'max': 5}),
             'comment': forms.Textarea(attrs={'class': 'w-full p-2 border rounded', 'rows': 4}),
         }
+
+class BulkStockForm(forms.Form):
+    """
+    The stock to set on the phones selected in the admin changelist.
+    """
+    stock = forms.IntegerField(min_value=0)
@@ -0,0 +1,241 @@
+# inventory/images.py
+
+"""
+Responsive image derivatives.
+
+Uploaded phone images, brand logos and home page images are re-encoded as AVIF and WebP at
+the widths in settings.IMAGE_DERIVATIVE_WIDTHS (never wider than the original) and stored
+under derivatives/ with the first 12 hex digits of the original's SHA-256 in their names,
+so a URL always names the same bytes and can be cached forever. The result is recorded on
+the row in a JSON field next to the image field:
+
+    {"source": "phone_images/x.jpg", "width": 1200, "height": 900,
+     "formats": {"avif": [[160, "derivatives/phone_images/x-3f2a...-160w.avif"], ...], "webp": [...]}}
+
+The {% picture %} tag (templatetags/responsive_images.py) turns that into <source srcset>
+elements and falls back to the original file until derivatives exist, or when they were
+made for a file the row no longer points at.
+
+Encoding (AVIF especially) takes far longer than a request should, so the upload views
+hand the work to a pool of settings.IMAGE_WORKERS threads once their transaction commits;
+Pillow releases the GIL while it resizes and encodes. build_image_derivatives backfills
+existing files. The field is filled with a bulk UPDATE of every row using that file, so
+signals aren't sent and the cached pages showing them are invalidated here.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from . import pagecache
+from .models import Brand, HomePageImage, Phone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (160, 320, 640, 960)
+# Format -> encoder quality, in order of preference (browsers use the first <source> they support).
+DEFAULT_FORMATS = {'avif': 50, 'webp': 80}
+DEFAULT_WORKERS = 2
+DIRECTORY = 'derivatives'
+DIGEST_LENGTH = 12
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+_state = {'executor': None}
+_lock = threading.Lock()
+
+
+class ImageSource:
+    """
+    An image field that gets derivatives, the JSON field they are recorded in and the page
+    cache tag of the pages showing it (None if no cached page does).
+    """
+
+    def __init__(self, model, field, variants_field, tag):
+        self.model = model
+        self.field = field
+        self.variants_field = variants_field
+        self.tag = tag
+
+    def __str__(self):
+        return f'{self.model._meta.label}.{self.field}'
+
+
+SOURCES = {
+    'phone': ImageSource(Phone, 'image', 'image_variants', 'phone'),
+    'brand': ImageSource(Brand, 'logo', 'logo_variants', 'brand'),
+    # Not shown on any cached page yet.
+    'home': ImageSource(HomePageImage, 'image', 'image_variants', None),
+}
+
+
+def widths():
+    return tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DEFAULT_WIDTHS))
+
+
+def formats():
+    return dict(getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', DEFAULT_FORMATS))
+
+
+def derivative_name(source_name, digest, width, fmt):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(DIRECTORY, directory, f'{stem}-{digest}-{width}w.{fmt}').replace(os.sep, '/')
+
+
+def target_widths(original_width, sizes):
+    """
+    The configured widths narrower than the original, plus the original width when some
+    configured width is wider (images are never scaled up).
+    """
+    targets = [width for width in sorted(sizes) if width < original_width]
+    if len(targets) < len(sizes):
+        targets.append(original_width)
+    return targets
+
+
+def render(source_name, storage=default_storage, replace=False):
+    """
+    Writes the derivatives of one stored image and returns the variants dict to record.
+    Derivatives already stored are kept unless replace is set (e.g. after changing quality).
+    """
+    with storage.open(source_name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]
+    with Image.open(io.BytesIO(data)) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+    variants = {'source': source_name, 'width': image.width, 'height': image.height, 'formats': {}}
+    encoders = formats()
+    resized = {}
+    for width in target_widths(image.width, widths()):
+        height = max(1, round(image.height * width / image.width))
+        resized[width] = image if width == image.width else image.resize(
+            (width, height), Image.Resampling.LANCZOS, reducing_gap=3.0
+        )
+    for fmt, quality in encoders.items():
+        entries = variants['formats'][fmt] = []
+        for width, scaled in resized.items():
+            name = derivative_name(source_name, digest, width, fmt)
+            if replace and storage.exists(name):
+                storage.delete(name)
+            if not storage.exists(name):
+                buffer = io.BytesIO()
+                scaled.save(buffer, fmt.upper(), quality=quality)
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            entries.append([width, name])
+    return variants
+
+
+def record(source, name, variants):
+    """
+    Stores variants on every row of source that uses the file name. Returns the number of rows.
+    """
+    updated = source.model.objects.filter(**{source.field: name}).update(**{source.variants_field: variants})
+    if updated and source.tag:
+        pagecache.bump_tags(source.tag)
+    return updated
+
+
+def build(source, name, storage=default_storage):
+    """
+    Makes the derivatives of one file and records them. Returns the number of rows updated.
+    """
+    return record(source, name, render(name, storage))
+
+
+def pending(source, force=False):
+    """
+    The distinct files of source whose rows have no up-to-date derivatives (all of them with force).
+    """
+    names = set()
+    rows = (
+        source.model.objects.exclude(**{source.field: ''}).exclude(**{f'{source.field}__isnull': True})
+        .values_list(source.field, source.variants_field)
+        .iterator(chunk_size=2000)
+    )
+    for name, variants in rows:
+        if force or (variants or {}).get('source') != name:
+            names.add(name)
+    return names
+
+
+def _run(source, name):
+    try:
+        build(source, name)
+    except Exception:
+        logger.exception("Couldn't make derivatives of %s (%s).", name, source)
+    finally:
+        close_old_connections()
+
+
+def executor():
+    """
+    The process's pool of image workers, started on first use.
+    """
+    if _state['executor'] is None:
+        with _lock:
+            if _state['executor'] is None:
+                _state['executor'] = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'IMAGE_WORKERS', DEFAULT_WORKERS), thread_name_prefix='images',
+                )
+    return _state['executor']
+
+
+def schedule(instance, field):
+    """
+    Queues derivatives for instance's image field once the current transaction commits.
+    With IMAGE_WORKERS = 0 they are made in the caller's thread instead.
+    """
+    source = next(
+        source for source in SOURCES.values() if isinstance(instance, source.model) and source.field == field
+    )
+    name = getattr(instance, field).name
+    if not name:
+        return
+    if not getattr(settings, 'IMAGE_WORKERS', DEFAULT_WORKERS):
+        transaction.on_commit(lambda: build(source, name))
+    else:
+        transaction.on_commit(lambda: executor().submit(_run, source, name))
+
+
+def current_variants(image, variants):
+    """
+    Returns variants if they were made for the file image points at, else None.
+    """
+    if not image or not variants or variants.get('source') != image.name:
+        return None
+    return variants
+
+
+def srcset(variants, fmt, storage=default_storage):
+    """
+    The srcset attribute value for one format: "url 160w, url 320w, ...".
+    """
+    return ', '.join(f'{storage.url(name)} {width}w' for width, name in variants['formats'].get(fmt, ()))
+
+
+class UploadedImagesMixin:
+    """
+    For model form views: schedules derivatives for the image_fields the form changed.
+    """
+
+    image_fields = ()
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        for field in self.image_fields:
+            if field in form.changed_data:
+                schedule(self.object, field)
+        return response
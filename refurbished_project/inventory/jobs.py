@@ -0,0 +1,274 @@
+# inventory/jobs.py
+
+"""
+A job queue in the database, for work too slow to do in a request: repricing and
+relisting, feed imports, image derivatives and the admin's bulk actions (bulkjobs.py).
+
+enqueue(task name, args) adds a Job row and run_workers runs queued jobs in a pool of
+worker threads or processes; there is no broker to run. Tasks are functions registered
+with @task (see tasks.py) and called as function(job, **args). Long ones call report()
+with how far they got, which staff see in the admin along with each job's attempts and
+errors. A job that raises is tried again JOB_RETRY_DELAY seconds later, the delay doubling
+each time, until it has had max_attempts attempts; then it is marked failed. Tasks should
+therefore be safe to run again after a partial attempt.
+
+Workers claim jobs through the database. On PostgreSQL, SELECT ... FOR UPDATE SKIP LOCKED
+gives each worker a different row. SQLite has no row locks, so a worker reads the oldest
+few ready jobs and claims one with UPDATE ... WHERE status = 'queued', which only one
+worker can win; the losers try the next candidate. Claims and results are short writes,
+retried on "database is locked" like stock writes (database.retry_on_lock).
+
+A worker that dies leaves its job running. Jobs whose heartbeat (set when claimed and on
+every report()) is older than JOB_TIMEOUT seconds are queued again by the next idle
+worker, or failed if they have no attempts left; tasks that can run longer than that must
+call report() on the way.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from datetime import timedelta
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .database import retry_on_lock
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 30
+DEFAULT_TIMEOUT = 15 * 60
+DEFAULT_POLL_INTERVAL = 1.0
+# Ready jobs a worker tries to claim on SQLite before reading the queue again.
+CLAIM_CANDIDATES = 10
+MESSAGE_LENGTH = 200
+
+# name -> (function, max_attempts or None for JOB_MAX_ATTEMPTS)
+TASKS = {}
+
+
+def task(name, max_attempts=None):
+    """
+    Registers the decorated function as the task called name.
+    """
+    def register(function):
+        TASKS[name] = (function, max_attempts)
+        return function
+    return register
+
+
+def retry_delay():
+    return getattr(settings, 'JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+
+
+def timeout():
+    return getattr(settings, 'JOB_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def poll_interval():
+    return getattr(settings, 'JOB_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+
+
+def enqueue(name, args=None, user=None, max_attempts=None):
+    """
+    Queues the task called name with the JSON-serializable keyword arguments args.
+    """
+    if name not in TASKS:
+        raise ValueError(f"Unknown task {name!r}.")
+    _, task_attempts = TASKS[name]
+    return Job.objects.create(
+        task=name,
+        args=args or {},
+        created_by=user,
+        max_attempts=max_attempts or task_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+    )
+
+
+@retry_on_lock
+def claim(worker):
+    """
+    Marks the oldest ready job as running for worker and returns it, or None if no job is ready.
+    """
+    now = timezone.now()
+    ready = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'pk')
+    claimed = {
+        'status': Job.RUNNING, 'worker': worker, 'heartbeat': now, 'started_at': now, 'attempts': F('attempts') + 1,
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = ready.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            Job.objects.filter(pk=pk).update(**claimed)
+    else:
+        for pk in ready.values_list('pk', flat=True)[:CLAIM_CANDIDATES]:
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(**claimed):
+                break
+        else:
+            return None
+    return Job.objects.get(pk=pk)
+
+
+@retry_on_lock
+def report(job, done, total=None, message=None):
+    """
+    Records how far a running job got, and that its worker is still alive.
+    """
+    job.progress = done
+    if total is not None:
+        job.total = total
+    if message is not None:
+        job.message = message[:MESSAGE_LENGTH]
+    job.heartbeat = timezone.now()
+    job.save(update_fields=['progress', 'total', 'message', 'heartbeat'])
+
+
+@retry_on_lock
+def _save_outcome(job):
+    job.save(update_fields=['status', 'run_after', 'worker', 'message', 'error', 'finished_at'])
+
+
+def execute(job):
+    """
+    Runs a claimed job and records the outcome: done, queued for another attempt, or failed.
+    """
+    function, _ = TASKS.get(job.task, (None, None))
+    try:
+        if function is None:
+            raise LookupError(f"Unknown task {job.task!r}.")
+        result = function(job, **job.args)
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed on attempt %s of %s', job.pk, job.task, job.attempts, job.max_attempts)
+        job.error = f'{type(exc).__name__}: {exc}'
+        if function is not None and job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=retry_delay() * 2 ** (job.attempts - 1))
+            job.worker = ''
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.DONE
+        job.error = ''
+        job.finished_at = timezone.now()
+        if result is not None:
+            job.message = str(result)[:MESSAGE_LENGTH]
+    _save_outcome(job)
+    return job
+
+
+@retry_on_lock
+def requeue_stale():
+    """
+    Queues again (or fails, if they have no attempts left) running jobs whose worker has
+    stopped reporting. Returns the number of jobs.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat__lt=now - timedelta(seconds=timeout()))
+    error = 'The worker running it stopped responding.'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(status=Job.FAILED, error=error, finished_at=now)
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status=Job.QUEUED, error=error, run_after=now, worker='',
+    )
+    return failed + requeued
+
+
+def work(worker, stop, burst=False, own_connections=False):
+    """
+    Claims and runs jobs as worker until stop is set, or with burst until no job is ready.
+    Returns the number of jobs run. Workers in their own thread or process pass
+    own_connections to have their database connections recycled between jobs and closed
+    at the end.
+    """
+    ran = 0
+    try:
+        while not stop.is_set():
+            job = claim(worker)
+            if job is None:
+                if requeue_stale():
+                    continue
+                if burst:
+                    break
+                stop.wait(poll_interval())
+                continue
+            execute(job)
+            ran += 1
+            if own_connections:
+                close_old_connections()
+    finally:
+        if own_connections:
+            connections.close_all()
+    return ran
+
+
+def worker_name(index):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+def _stop_on_signals(stop):
+    # The first Ctrl-C or SIGTERM lets running jobs finish; a second Ctrl-C interrupts them.
+    def handle(signum, frame):
+        if stop.is_set() and signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        stop.set()
+
+    return {signum: signal.signal(signum, handle) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+
+def _thread_main(index, stop, burst, counts):
+    counts[index] = work(worker_name(index), stop, burst, own_connections=True)
+
+
+def _process_main(index, stop, burst, counter):
+    if not apps.ready:
+        django.setup()
+    _stop_on_signals(stop)
+    ran = work(worker_name(index), stop, burst, own_connections=True)
+    with counter.get_lock():
+        counter.value += ran
+
+
+def run_pool(workers, processes=False, burst=False):
+    """
+    Runs workers worker threads, or processes, until SIGINT or SIGTERM, or with burst until
+    no job is ready. A single worker thread is the calling thread. Returns the number of
+    jobs run.
+    """
+    # Forked workers inherit the settings of the calling process, including a test database's name.
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    stop = context.Event()
+    previous = _stop_on_signals(stop) if threading.current_thread() is threading.main_thread() else {}
+    try:
+        if processes:
+            # Connections must not be shared with the forked processes.
+            connections.close_all()
+            counter = context.Value('q', 0)
+            pool = [
+                context.Process(target=_process_main, args=(index, stop, burst, counter), name=f'jobs-{index}')
+                for index in range(workers)
+            ]
+        elif workers == 1:
+            return work(worker_name(0), stop, burst)
+        else:
+            counts = [0] * workers
+            pool = [
+                threading.Thread(target=_thread_main, args=(index, stop, burst, counts), name=f'jobs-{index}')
+                for index in range(workers)
+            ]
+        for member in pool:
+            member.start()
+        for member in pool:
+            member.join()
+        return counter.value if processes else sum(counts)
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
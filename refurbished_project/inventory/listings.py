@@ -0,0 +1,307 @@
+# inventory/listings.py
+
+"""
+Bulk listing engine: prices and lists phones on platforms in batches.
+
+Per-listing code (Listing.calculate_platform_price / map_condition_to_platform) loads the
+phone and platform for every row. Here each platform's fee terms and condition table are
+resolved once, phones are streamed as plain tuples, and each batch is written with a single
+upsert (INSERT ... ON CONFLICT DO UPDATE), so relisting a whole catalog is a handful of statements per thousand phones.
+
+potential_listings() prices one phone on every platform for the phone detail page and
+caches the result; see its docstring for what the cache key covers.
+"""
+
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import conditions, pagecache
+from .models import Listing, Phone, Platform, platform_selling_price
+
+DEFAULT_BATCH_SIZE = 2000
+PLATFORMS_VERSION_KEY = 'listings:platforms'
+PHONE_VERSION_KEY = 'listings:phone:{}'
+POTENTIAL_CACHE_TIMEOUT = 60 * 60
+
+
+class ListingRun:
+    """
+    Counters for one bulk run, with throughput.
+    """
+
+    def __init__(self):
+        self.phones = 0
+        self.listings = 0
+        self.skipped = 0
+        self.delisted = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        return self
+
+    @property
+    def seconds(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def listings_per_second(self):
+        return self.listings / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'phones': self.phones,
+            'listings': self.listings,
+            'skipped': self.skipped,
+            'delisted': self.delisted,
+            'seconds': round(self.seconds, 3),
+            'listings_per_second': round(self.listings_per_second, 1),
+        }
+
+    def __str__(self):
+        return (
+            f"{self.listings} listings for {self.phones} phones in {self.seconds:.2f}s "
+            f"({self.listings_per_second:.0f} listings/sec, {self.skipped} skipped, {self.delisted} delisted)"
+        )
+
+
+class PlatformTerms:
+    """
+    A platform's pricing inputs and condition table, resolved once per run.
+    """
+
+    def __init__(self, platform):
+        self.platform = platform
+        self.conditions = conditions.mappings().get(platform.pk, {})
+
+    def price(self, base_price):
+        return platform_selling_price(base_price, self.platform.fee_percentage, self.platform.fixed_fee)
+
+    def condition(self, general_condition):
+        return self.conditions.get(general_condition, conditions.UNKNOWN)
+
+    def is_profitable(self, base_price):
+        # Same rule as Listing.check_profitability: the price has to more than cover the cost.
+        price = self.price(base_price)
+        return isinstance(price, Decimal) and price > base_price
+
+    def listing_values(self, base_price, condition):
+        """
+        Returns (price, condition category), or None when the phone can't be listed at a valid price.
+        """
+        price = self.price(base_price)
+        if not isinstance(price, Decimal) or price <= 0:
+            return None
+        return price, self.condition(condition)
+
+
+def _token():
+    return uuid.uuid4().hex
+
+
+def platforms_version():
+    return cache.get_or_set(PLATFORMS_VERSION_KEY, _token, None)
+
+
+def bump_platforms_version():
+    """
+    Invalidates cached potential listings of every phone, e.g. after a fee change or bulk relist.
+    """
+    cache.set(PLATFORMS_VERSION_KEY, _token(), None)
+    pagecache.bump_tags('listing')
+
+
+def bump_phone_version(phone_id):
+    """
+    Invalidates the cached potential listings of one phone, e.g. after one of its listings changed.
+    """
+    cache.set(PHONE_VERSION_KEY.format(phone_id), _token(), POTENTIAL_CACHE_TIMEOUT)
+    pagecache.bump_tags('listing')
+
+
+def potential_listings_key(phone):
+    phone_key = PHONE_VERSION_KEY.format(phone.pk)
+    versions = cache.get_many([PLATFORMS_VERSION_KEY, phone_key])
+    platforms = versions.get(PLATFORMS_VERSION_KEY) or platforms_version()
+    listings = versions.get(phone_key)
+    if listings is None:
+        listings = _token()
+        cache.set(phone_key, listings, POTENTIAL_CACHE_TIMEOUT)
+    return (
+        f"listings:potential:{phone.pk}:{phone.base_price}:{phone.condition}:{phone.stock}:"
+        f"{platforms}:{listings}:{conditions.current_version()}"
+    )
+
+
+def compute_potential_listings(phone):
+    """
+    Evaluates every platform for phone in two queries, plus one to load the condition
+    mappings if this process doesn't have them yet.
+    """
+    existing = {listing.platform_id: listing for listing in Listing.objects.filter(phone=phone)}
+    items = []
+    for platform in Platform.objects.order_by('name'):
+        terms = PlatformTerms(platform)
+        values = terms.listing_values(phone.base_price, phone.condition)
+        listing = existing.get(platform.pk)
+        if listing is None:
+            listing = Listing(
+                phone_id=phone.pk,
+                platform=platform,
+                platform_price=values[0] if values else Decimal('0.00'),
+                platform_condition_category=terms.condition(phone.condition),
+            )
+        is_profitable = terms.is_profitable(phone.base_price)
+        items.append({
+            'platform': platform,
+            'listing': listing,
+            'is_profitable': is_profitable,
+            'can_list': values is not None and is_profitable and phone.stock > 0,
+        })
+    return items
+
+
+def potential_listings(phone):
+    """
+    Returns one item per platform (platform, listing, can_list, is_profitable) for the phone
+    detail page. listing is the saved Listing if there is one, else an unsaved priced one.
+
+    Cached per phone under a key made of the fields the result depends on (base_price,
+    condition, stock), a platform version bumped when any Platform changes or listings are
+    bulk-written, a per-phone version bumped when one of its Listings changes, and the
+    condition mapping version; editing any of them simply moves on to a new key.
+    """
+    key = potential_listings_key(phone)
+    items = cache.get(key)
+    if items is None:
+        items = compute_potential_listings(phone)
+        cache.set(key, items, POTENTIAL_CACHE_TIMEOUT)
+    return items
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _delist(skipped):
+    """
+    Marks unlisted the listings of skipped ({platform id: [phone ids]}): phones that can't be
+    priced any more would otherwise stay on sale at a price worked out under old terms.
+    Returns how many were listed.
+    """
+    return sum(
+        Listing.objects.filter(platform_id=platform_id, phone_id__in=phone_ids, is_listed=True).update(is_listed=False)
+        for platform_id, phone_ids in skipped.items()
+    )
+
+
+def list_phones(platforms=None, phones=None, batch_size=DEFAULT_BATCH_SIZE, is_listed=True, progress=None):
+    """
+    Prices every phone on every platform and upserts the listings.
+
+    platforms and phones default to all rows; phones may be any Phone queryset.
+    Existing listings get their price, condition category and is_listed overwritten, and
+    those of phones that can't be priced are delisted (run.delisted).
+    progress, if given, is called with the ListingRun after each batch.
+    """
+    run = ListingRun()
+    terms = [PlatformTerms(platform) for platform in (platforms if platforms is not None else Platform.objects.all())]
+    if phones is None:
+        phones = Phone.objects.all()
+    rows = phones.order_by('pk').values_list('pk', 'base_price', 'condition').iterator(chunk_size=batch_size)
+
+    for batch in _batches(rows, batch_size):
+        listings = []
+        skipped = defaultdict(list)
+        for phone_id, base_price, condition in batch:
+            for platform_terms in terms:
+                values = platform_terms.listing_values(base_price, condition)
+                if values is None:
+                    run.skipped += 1
+                    skipped[platform_terms.platform.pk].append(phone_id)
+                    continue
+                listings.append(Listing(
+                    phone_id=phone_id,
+                    platform_id=platform_terms.platform.pk,
+                    platform_price=values[0],
+                    platform_condition_category=values[1],
+                    is_listed=is_listed,
+                ))
+        with transaction.atomic():
+            Listing.objects.bulk_create(
+                listings,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['phone', 'platform'],
+                update_fields=['platform_price', 'platform_condition_category', 'is_listed'],
+            )
+            run.delisted += _delist(skipped)
+        run.phones += len(batch)
+        run.listings += len(listings)
+        if progress is not None:
+            progress(run)
+    bump_platforms_version()
+    return run.finish()
+
+
+def reprice_platform(platform, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Recomputes price and condition category of every existing listing on platform,
+    e.g. after its fee_percentage or fixed_fee changed. is_listed is left alone, except
+    that listings that can't be priced any more are delisted (run.delisted).
+    progress is called as for list_phones.
+
+    Every row already exists, so this goes through the same upsert as list_phones (with
+    is_listed left out of the update) rather than bulk_update's much slower CASE per column.
+    """
+    run = ListingRun()
+    platform_terms = PlatformTerms(platform)
+    rows = (
+        Listing.objects.filter(platform=platform)
+        .order_by('pk')
+        .values_list('phone_id', 'phone__base_price', 'phone__condition')
+        .iterator(chunk_size=batch_size)
+    )
+    for batch in _batches(rows, batch_size):
+        listings = []
+        skipped = []
+        for phone_id, base_price, condition in batch:
+            values = platform_terms.listing_values(base_price, condition)
+            if values is None:
+                run.skipped += 1
+                skipped.append(phone_id)
+                continue
+            listings.append(Listing(
+                phone_id=phone_id,
+                platform_id=platform.pk,
+                platform_price=values[0],
+                platform_condition_category=values[1],
+            ))
+        with transaction.atomic():
+            Listing.objects.bulk_create(
+                listings,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['phone', 'platform'],
+                update_fields=['platform_price', 'platform_condition_category'],
+            )
+            run.delisted += _delist({platform.pk: skipped})
+        run.phones += len(batch)
+        run.listings += len(listings)
+        if progress is not None:
+            progress(run)
+    bump_platforms_version()
+    return run.finish()
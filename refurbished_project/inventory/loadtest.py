@@ -0,0 +1,436 @@
+# inventory/loadtest.py
+
+"""
+In-process load test: replays a weighted mix of storefront requests against the WSGI
+application from several threads and reports latency percentiles and queries per request.
+
+Requests go through django.core.handlers.wsgi.WSGIHandler with a WSGI environ built the
+way a server would build it, so every middleware, the page cache and the session and
+CSRF machinery run as in production; only the network and the HTTP server are missing.
+Logged-in traffic uses sessions created up front for existing users (see datagen), with
+a CSRF cookie and header on POSTs.
+
+Each scenario builds one request from a random generator; the mix is a {scenario: weight}
+dict. Product pages are requested with a skewed popularity, so a small set of phones gets
+most of the traffic, as on a real storefront.
+"""
+
+import asyncio
+import io
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .benchmarks import CONDITIONS, MEMORY_SIZES, percentile
+from .catalog import SORT_OPTIONS
+from .models import Phone
+
+DEFAULT_MIX = {
+    'list': 40,
+    'detail': 35,
+    'home': 10,
+    'cart': 8,
+    'add_to_cart': 4,
+    'order': 3,
+}
+# Every scenario build() knows; 'query' (chatbot) and 'sell' (sell-new-model form) aren't in the default mix.
+SCENARIOS = tuple(DEFAULT_MIX) + ('query', 'sell')
+# Scenarios that need a logged-in user.
+AUTHENTICATED = ('cart', 'add_to_cart')
+# Larger is more skewed: with 3, the top 10% of phones get about 46% of detail views.
+POPULARITY_SKEW = 3
+
+
+def parse_mix(text):
+    """
+    Parses 'list=40,detail=35,...' into a {scenario: weight} dict.
+    """
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; use {', '.join(SCENARIOS)}.")
+        try:
+            mix[name] = int(weight)
+        except ValueError:
+            raise ValueError(f"Weight of {name!r} must be an integer.")
+        if mix[name] < 0:
+            raise ValueError(f"Weight of {name!r} can't be negative.")
+    if not any(mix.values()):
+        raise ValueError('At least one scenario needs a positive weight.')
+    return mix
+
+
+def _host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+class Session:
+    """
+    Cookies and CSRF token of one simulated visitor; anonymous when user is None.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self.csrf_token = get_random_string(CSRF_SECRET_LENGTH, allowed_chars=CSRF_ALLOWED_CHARS)
+        cookies = {settings.CSRF_COOKIE_NAME: self.csrf_token}
+        if user is not None:
+            store = SessionStore()
+            store[SESSION_KEY] = str(user.pk)
+            store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            store.create()
+            cookies[settings.SESSION_COOKIE_NAME] = store.session_key
+        self.cookie = '; '.join(f'{name}={value}' for name, value in cookies.items())
+
+
+class Result:
+    __slots__ = ('scenario', 'status', 'seconds', 'queries', 'page_cache')
+
+    def __init__(self, scenario, status, seconds, queries, page_cache):
+        self.scenario = scenario
+        self.status = status
+        self.seconds = seconds
+        self.queries = queries
+        self.page_cache = page_cache
+
+
+class QueryCounter:
+    """
+    Counts the queries run on this thread's connection (installed with execute_wrapper).
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class LoadTest:
+    def __init__(self, mix=None, seed=0, users=None):
+        self.mix = mix or dict(DEFAULT_MIX)
+        self.seed = seed
+        self.handler = WSGIHandler()
+        self.host = _host()
+        # Popular phones first; detail views pick from the front of the list more often.
+        self.phone_ids = list(Phone.objects.order_by('-rating_count', 'pk').values_list('pk', flat=True)[:50000])
+        self.in_stock_ids = list(Phone.objects.filter(stock__gt=0).order_by('pk').values_list('pk', flat=True)[:50000])
+        self.brand_ids = list(Phone.objects.exclude(brand=None).order_by().values_list('brand', flat=True).distinct()[:200])
+        self.sessions = [Session(user) for user in (users or [])]
+        self.anonymous = Session()
+        if not self.phone_ids:
+            raise ValueError('There are no phones to request; generate data first.')
+        if not self.sessions and any(self.mix.get(name) for name in AUTHENTICATED):
+            raise ValueError('Cart scenarios need users; generate some or leave them out of the mix.')
+
+    def popular_phone(self, rng):
+        return self.phone_ids[int(len(self.phone_ids) * rng.random() ** POPULARITY_SKEW)]
+
+    def build(self, scenario, rng):
+        """
+        Returns (method, path, query string, form data, session) for one request.
+        """
+        anonymous = self.anonymous
+        if scenario == 'home':
+            return 'GET', reverse('home'), '', None, anonymous
+        if scenario == 'list':
+            params = {}
+            if rng.random() < 0.5:
+                params['sort'] = rng.choice(list(SORT_OPTIONS))
+            if rng.random() < 0.3:
+                params['condition'] = rng.choice(CONDITIONS)
+            if rng.random() < 0.2:
+                params['memory'] = rng.choice(MEMORY_SIZES)
+            if self.brand_ids and rng.random() < 0.2:
+                params['brand'] = rng.choice(self.brand_ids)
+            return 'GET', reverse('phone_list'), urlencode(params), None, anonymous
+        if scenario == 'detail':
+            return 'GET', reverse('phone_detail', args=[self.popular_phone(rng)]), '', None, anonymous
+        if scenario == 'query':
+            data = {'name': 'Load Test', 'email': 'loadtest@example.com', 'message': f'Question {rng.random()}'}
+            return 'POST', reverse('submit_query'), '', data, anonymous
+        if scenario == 'sell':
+            data = {
+                'name': 'Load Test', 'email': 'loadtest@example.com', 'phone_name': 'Model X',
+                'brand': 'Acme', 'condition': rng.choice(CONDITIONS), 'comments': '',
+            }
+            return 'POST', reverse('sell_new_model'), '', data, anonymous
+        session = rng.choice(self.sessions) if self.sessions else anonymous
+        if scenario == 'cart':
+            return 'GET', reverse('cart'), '', None, session
+        phone_id = rng.choice(self.in_stock_ids or self.phone_ids)
+        if scenario == 'add_to_cart':
+            return 'POST', reverse('add_to_cart', args=[phone_id]), '', None, session
+        return 'POST', reverse('create_order', args=[phone_id]), '', {'order_type': rng.choice(('BUY', 'BUY', 'SELL'))}, session
+
+    def environ(self, method, path, query_string, data, session):
+        body = urlencode(data).encode() if data else b''
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': self.host,
+            'HTTP_COOKIE': session.cookie,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if method == 'POST':
+            environ['CONTENT_TYPE'] = 'application/x-www-form-urlencoded'
+            environ['CONTENT_LENGTH'] = str(len(body))
+            environ['HTTP_X_CSRFTOKEN'] = session.csrf_token
+        return environ
+
+    def scope(self, method, path, query_string, data, session):
+        """
+        The ASGI equivalent of environ(): (scope, request body).
+        """
+        body = urlencode(data).encode() if data else b''
+        headers = [(b'host', self.host.encode()), (b'cookie', session.cookie.encode())]
+        if method == 'POST':
+            headers += [
+                (b'content-type', b'application/x-www-form-urlencoded'),
+                (b'content-length', str(len(body)).encode()),
+                (b'x-csrftoken', session.csrf_token.encode()),
+            ]
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': (self.host, 80),
+        }
+        return scope, body
+
+    def plan(self, requests, seed=None):
+        """
+        Builds a fixed list of (scenario, request) pairs, so that different runs can replay
+        exactly the same traffic.
+        """
+        rng = random.Random(f'{self.seed if seed is None else seed}:plan')
+        scenarios, weights = zip(*self.mix.items())
+        return [(scenario, self.build(scenario, rng)) for scenario in rng.choices(scenarios, weights, k=requests)]
+
+    def request(self, scenario, rng, counter):
+        return self.send(scenario, self.build(scenario, rng), counter)
+
+    def send(self, scenario, spec, counter=None):
+        """
+        Sends one request built by build() through the WSGI handler. Returns a Result.
+        """
+        environ = self.environ(*spec)
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_start['status'] = int(status.split(' ', 1)[0])
+            response_start['headers'] = dict(headers)
+
+        counter = counter or QueryCounter()
+        counter.count = 0
+        started = time.perf_counter()
+        response = self.handler(environ, start_response)
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+        seconds = time.perf_counter() - started
+        return Result(scenario, response_start['status'], seconds, counter.count, response_start['headers'].get('X-Page-Cache'))
+
+    async def asend(self, application, scenario, spec):
+        """
+        Sends one request built by build() to an ASGI application. Queries aren't counted:
+        they run in threads the harness can't see.
+        """
+        scope, body = self.scope(*spec)
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        disconnected = asyncio.Event()
+        response_start = {}
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # Django listens for a disconnect while the view runs; the client never leaves.
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response_start['status'] = message['status']
+                response_start['headers'] = {name.lower(): value for name, value in message['headers']}
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        seconds = time.perf_counter() - started
+        page_cache = response_start['headers'].get(b'x-page-cache')
+        return Result(scenario, response_start['status'], seconds, 0, page_cache.decode() if page_cache else None)
+
+    def worker(self, worker_id, count, results, lock):
+        rng = random.Random(f'{self.seed}:{worker_id}')
+        scenarios, weights = zip(*self.mix.items())
+        counter = QueryCounter()
+        local = []
+        try:
+            with connection.execute_wrapper(counter):
+                for _ in range(count):
+                    local.append(self.request(rng.choices(scenarios, weights)[0], rng, counter))
+        finally:
+            with lock:
+                results.extend(local)
+            connections.close_all()
+
+    def run(self, requests, threads=4):
+        """
+        Sends requests spread over threads. Returns a Report.
+        """
+        results = []
+        lock = threading.Lock()
+        shares = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+        workers = [
+            threading.Thread(target=self.worker, args=(worker_id, share, results, lock))
+            for worker_id, share in enumerate(shares)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return Report(results, time.perf_counter() - started, threads)
+
+
+def replay_wsgi(test, plan, concurrency, workers):
+    """
+    Replays plan with up to concurrency requests in flight, served by a pool of workers
+    threads as by a threaded WSGI server. Latency includes the time a request waits for a
+    free worker. Returns a Report.
+    """
+    def serve(scenario, spec, submitted):
+        result = test.send(scenario, spec)
+        result.seconds = time.perf_counter() - submitted
+        return result
+
+    results = []
+    pending = set()
+    queue = iter(plan)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit():
+            for scenario, spec in queue:
+                pending.add(pool.submit(serve, scenario, spec, time.perf_counter()))
+                return
+
+        for _ in range(concurrency):
+            submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                results.append(future.result())
+                submit()
+    return Report(results, time.perf_counter() - started, workers)
+
+
+async def replay_asgi(test, application, plan, concurrency):
+    """
+    Replays plan against an ASGI application from concurrency clients on one event loop,
+    i.e. one ASGI worker process. Returns a Report.
+    """
+    results = []
+    queue = iter(plan)
+
+    async def client():
+        for scenario, spec in queue:
+            results.append(await test.asend(application, scenario, spec))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return Report(results, time.perf_counter() - started, 1)
+
+
+class Report:
+    def __init__(self, results, seconds, threads):
+        self.results = results
+        self.seconds = seconds
+        self.threads = threads
+
+    @property
+    def errors(self):
+        return sum(1 for result in self.results if result.status >= 400)
+
+    def rows(self):
+        """
+        Yields one summary dict per scenario, then one for all requests.
+        """
+        by_scenario = defaultdict(list)
+        for result in self.results:
+            by_scenario[result.scenario].append(result)
+        for scenario in sorted(by_scenario, key=lambda name: -len(by_scenario[name])):
+            yield self._summary(scenario, by_scenario[scenario])
+        yield self._summary('all', self.results)
+
+    @staticmethod
+    def _summary(name, results):
+        latencies = [result.seconds for result in results]
+        queries = [result.queries for result in results]
+        statuses = Counter(result.status for result in results)
+        cached = [result.page_cache for result in results if result.page_cache]
+        return {
+            'scenario': name,
+            'requests': len(results),
+            'errors': sum(count for status, count in statuses.items() if status >= 400),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries_avg': sum(queries) / len(queries) if queries else 0.0,
+            'queries_max': max(queries, default=0),
+            'page_cache_hits': (cached.count('hit') / len(cached)) if cached else None,
+        }
+
+    def __str__(self):
+        lines = [
+            f"{'scenario':<12} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>8} {'max q':>6} {'cache hit':>9}"
+        ]
+        for row in self.rows():
+            hits = '-' if row['page_cache_hits'] is None else f"{row['page_cache_hits']:.0%}"
+            lines.append(
+                f"{row['scenario']:<12} {row['requests']:>8} {row['errors']:>6} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                f"{row['p99_ms']:>8.2f} {row['queries_avg']:>8.1f} {row['queries_max']:>6} {hits:>9}"
+            )
+        rate = len(self.results) / self.seconds if self.seconds else 0.0
+        lines.append(f"{len(self.results)} requests in {self.seconds:.2f}s ({rate:.0f} req/s) with {self.threads} threads")
+        return '\n'.join(lines)
@@ -0,0 +1,57 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from inventory import analytics, datagen
+from inventory.benchmarks import measure, scratch_database, summarize
+from inventory.models import Order, OrderRollup
+
+
+def raw_report(start, group_by):
+    """
+    The same figures computed from the Order table, as a report without rollups would.
+    """
+    column = {'day': 'day', 'brand': 'phone__brand_id', 'condition': 'phone__condition'}[group_by]
+    sold, bought = Q(order_type='BUY'), Q(order_type='SELL')
+    return list(
+        Order.objects.filter(status=analytics.COUNTED_STATUS, created_at__gte=analytics.day_start(start))
+        .annotate(day=TruncDate('created_at')).values(column)
+        .annotate(
+            orders=Count('id', filter=sold), units=Sum('quantity', filter=sold), revenue=Sum('total_price', filter=sold),
+            buyback_units=Sum('quantity', filter=bought), buyback_spend=Sum('total_price', filter=bought),
+        )
+        .order_by(F(column).asc())
+    )
+
+
+class Command(BaseCommand):
+    help = 'Times a year of order analytics from the daily rollups and from raw orders (runs in a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500_000)
+        parser.add_argument('--phones', type=int, default=5000)
+        parser.add_argument('--brands', type=int, default=20)
+        parser.add_argument('--iterations', type=int, default=20, help='Reports per scenario.')
+        parser.add_argument('--db-file', help='Benchmark against an on-disk SQLite file instead of shared memory.')
+
+    def handle(self, *args, **options):
+        with scratch_database(options['db_file']):
+            datagen.Generator(seed=0).run(brands=options['brands'], phones=options['phones'], orders=options['orders'])
+            started = time.perf_counter()
+            cells = analytics.rebuild()
+            self.stdout.write(
+                f"{options['orders']:,} orders -> {cells:,} rollup rows "
+                f"(full rebuild {time.perf_counter() - started:.2f}s, {OrderRollup.objects.count():,} rows)"
+            )
+            end = timezone.localdate()
+            start = end - timedelta(days=364)
+            for group_by in analytics.GROUPINGS:
+                samples = measure(lambda: analytics.report(start, end, group_by), options['iterations'])
+                self.stdout.write(f"  {f'rollups, by {group_by}':<24} {summarize(samples)}")
+                samples = measure(lambda: raw_report(start, group_by), max(1, options['iterations'] // 10))
+                self.stdout.write(f"  {f'raw orders, by {group_by}':<24} {summarize(samples)}")
+            self.stdout.write(self.style.SUCCESS('Done.'))
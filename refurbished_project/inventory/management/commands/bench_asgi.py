@@ -0,0 +1,95 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+
+from inventory import datagen, loadtest, pagecache
+from inventory.asgi import StorefrontASGIHandler
+from inventory.benchmarks import scratch_database
+
+# The endpoints that have async variants: storefront pages and the two forms that write a Query.
+DEFAULT_MIX = 'list=30,detail=30,home=10,query=20,sell=10'
+
+
+class RoundTrip:
+    """
+    Execute wrapper adding a fixed delay to every query, like the network round trip to a
+    database server. Sleeping releases the GIL, as waiting on a socket does.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the WSGI deployment (sync views, a pool of worker threads) with ASGI (async views, '
+        'one event loop) at increasing numbers of concurrent connections (runs in a scratch database)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='WSGI worker threads.')
+        parser.add_argument('--concurrency', default='1,8,32,128', help='Comma-separated concurrent connection counts.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per run.')
+        parser.add_argument('--mix', default=DEFAULT_MIX)
+        parser.add_argument('--phones', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--db-latency-ms', type=float, default=0.0,
+            help='Delay added to every query, to model a database server over the network.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError as exc:
+            raise CommandError(exc)
+        if min(levels) < 1 or options['workers'] < 1 or options['requests'] < 1:
+            raise CommandError('--workers, --concurrency and --requests must be at least 1.')
+
+        db_file = os.path.join(tempfile.mkdtemp(), 'bench_asgi.sqlite3')
+        with scratch_database(db_file):
+            phones = options['phones']
+            datagen.Generator(seed=options['seed']).run(
+                users=100, brands=20, platforms=5, phones=phones, listings=phones * 3, orders=phones * 2, reviews=phones,
+            )
+            users = list(User.objects.filter(is_staff=False).order_by('pk')[:20])
+            test = loadtest.LoadTest(mix=mix, seed=options['seed'], users=users)
+            application = StorefrontASGIHandler()
+            # Both servers replay the same requests, each starting with a cold page cache.
+            plan = test.plan(options['requests'])
+            loadtest.replay_wsgi(test, test.plan(50, seed='warmup'), 1, 1)
+            asyncio.run(loadtest.replay_asgi(test, application, test.plan(50, seed='warmup'), 1))
+
+            if options['db_latency_ms']:
+                connection_created.connect(RoundTrip(options['db_latency_ms'] / 1000).install, weak=False)
+            self.stdout.write(
+                f"{'server':<6} {'conns':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>6}"
+            )
+            for level in levels:
+                for server in ('wsgi', 'asgi'):
+                    pagecache.bump_tags('brand', 'phone', 'review', 'listing')
+                    if server == 'wsgi':
+                        report = loadtest.replay_wsgi(test, plan, level, options['workers'])
+                    else:
+                        report = asyncio.run(loadtest.replay_asgi(test, application, plan, level))
+                    row = list(report.rows())[-1]
+                    rate = len(report.results) / report.seconds if report.seconds else 0.0
+                    self.stdout.write(
+                        f"{server:<6} {level:>5} {rate:>8.1f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                        f"{row['p99_ms']:>9.2f} {row['errors']:>6}"
+                    )
+            self.stdout.write(self.style.SUCCESS(f"Done. WSGI used {options['workers']} worker threads, ASGI one event loop."))
@@ -0,0 +1,64 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from inventory import facets
+from inventory.benchmarks import measure, scratch_database, seed_brands, seed_phones, summarize
+from inventory.catalog import CatalogQuery
+from inventory.models import Phone
+from inventory.views import PhoneListView
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks PhoneListView against a growing synthetic catalog (runs in a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phones', type=int, default=1_000_000, help='Final catalog size.')
+        parser.add_argument('--checkpoints', type=int, default=3, help='Number of catalog sizes to measure at (10x apart).')
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per scenario.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--db-file', help='Benchmark against an on-disk SQLite file instead of shared memory.')
+
+    def handle(self, *args, **options):
+        total = options['phones']
+        sizes = sorted({max(1, total // 10 ** i) for i in range(options['checkpoints'])})
+
+        with scratch_database(options['db_file']):
+            brand_ids = seed_brands()
+            seeded = 0
+            for size in sizes:
+                seeded += seed_phones(size - seeded, brand_ids, batch_size=options['batch_size'], start=seeded)
+                facets.rebuild()  # bulk_create bypasses the signals that keep facet counts current
+                self.stdout.write(self.style.MIGRATE_HEADING(f'Catalog size: {Phone.objects.count():,} phones'))
+                self.run_scenarios(options['iterations'])
+
+    def run_scenarios(self, iterations):
+        factory = RequestFactory()
+        view = PhoneListView.as_view()
+
+        def render(params):
+            request = factory.get('/phones/', params)
+            request.user = AnonymousUser()
+            return view(request).render()
+
+        scenarios = [
+            ('first page', {}),
+            ('price desc', {'sort': 'price_desc'}),
+            ('condition+memory filter', {'condition': 'Good', 'memory': '256'}),
+            ('price range filter', {'min_price': '200', 'max_price': '400'}),
+        ]
+        for label, params in scenarios:
+            samples = measure(lambda: render(params), iterations)
+            self.stdout.write(f'  {label:<28} {summarize(samples)}')
+
+        # Jump halfway into the catalog: keyset seeks straight there, OFFSET has to skip every row before it.
+        catalog = CatalogQuery({})
+        offset = Phone.objects.count() // 2
+        anchor = catalog.queryset()[offset]
+        cursor = catalog.cursor_for(anchor)
+        samples = measure(lambda: catalog.page(cursor), iterations)
+        self.stdout.write(f'  {"keyset query @ middle":<28} {summarize(samples)}')
+        samples = measure(lambda: list(catalog.queryset()[offset + 1:offset + 1 + catalog.page_size]), iterations)
+        self.stdout.write(f'  {f"OFFSET {offset:,} query":<28} {summarize(samples)}')
+        samples = measure(lambda: render({'cursor': cursor}), iterations)
+        self.stdout.write(f'  {"keyset page @ middle":<28} {summarize(samples)}')
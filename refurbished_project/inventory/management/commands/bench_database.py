@@ -0,0 +1,134 @@
+import gc
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from inventory import database, datagen, loadtest, pagecache
+from inventory.benchmarks import scratch_database
+
+# Storefront reads with a steady stream of stock-changing writes (reservations and orders).
+DEFAULT_MIX = 'list=35,detail=35,home=5,add_to_cart=10,order=15'
+
+# What the site ran with before inventory/database.py: a rollback journal with
+# synchronous=FULL, a new connection per request and every read on 'default'.
+BASELINE = {
+    'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'conn_max_age': 0,
+    'routers': [],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures mixed read/write storefront throughput with the old database settings and with the '
+        'tuned ones (WAL, persistent connections, read replica), in a scratch on-disk database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='WSGI worker threads.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run.')
+        parser.add_argument('--mix', default=DEFAULT_MIX)
+        parser.add_argument('--phones', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        if min(options['workers'], options['concurrency'], options['requests']) < 1:
+            raise CommandError('--workers, --concurrency and --requests must be at least 1.')
+
+        tuned = {
+            'pragmas': settings.SQLITE_PRAGMAS,
+            'conn_max_age': settings.DATABASES['default'].get('CONN_MAX_AGE', 0),
+            'routers': settings.DATABASE_ROUTERS,
+        }
+        db_file = os.path.join(tempfile.mkdtemp(), 'bench_database.sqlite3')
+        with scratch_database(db_file):
+            phones = options['phones']
+            datagen.Generator(seed=options['seed']).run(
+                users=100, brands=20, platforms=5, phones=phones, listings=phones * 3, orders=phones * 2, reviews=phones,
+            )
+            users = list(User.objects.filter(is_staff=False).order_by('pk')[:50])
+            test = loadtest.LoadTest(mix=mix, seed=options['seed'], users=users)
+            plan = test.plan(options['requests'])
+            # Templates, URL resolvers and per-process caches are loaded before either profile runs.
+            loadtest.replay_wsgi(test, test.plan(100, seed='warmup'), 1, 1)
+
+            self.stdout.write(
+                f"{'profile':<9} {'journal':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                f"{'errors':>6} {'replica reads':>13}"
+            )
+            for name, profile in (('baseline', BASELINE), ('tuned', tuned)):
+                report, journal, replica_reads = self.run_profile(test, plan, profile, options)
+                row = list(report.rows())[-1]
+                rate = len(report.results) / report.seconds if report.seconds else 0.0
+                self.stdout.write(
+                    f"{name:<9} {journal:>7} {rate:>8.1f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                    f"{row['p99_ms']:>9.2f} {row['errors']:>6} {replica_reads:>13}"
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"Done: {options['requests']} requests per profile, {options['concurrency']} in flight, "
+                f"{options['workers']} worker threads."
+            ))
+
+    def run_profile(self, test, plan, profile, options):
+        """
+        Replays plan with one profile's PRAGMAs, connection lifetime and routers.
+        Returns (report, journal mode, number of queries that went to the replica).
+        """
+        connections.close_all()
+        aliases = [alias for alias in connections if alias in settings.DATABASES]
+        saved = {alias: connections[alias].settings_dict.get('CONN_MAX_AGE', 0) for alias in aliases}
+        replica_reads = ReplicaCounter()
+        with override_settings(SQLITE_PRAGMAS=profile['pragmas'], DATABASE_ROUTERS=profile['routers']):
+            for alias in aliases:
+                connections[alias].settings_dict['CONN_MAX_AGE'] = profile['conn_max_age']
+            try:
+                # The journal mode is stored in the file: switch it while nothing else is connected
+                # (the previous run's worker threads are gone, but their connections may not be yet).
+                gc.collect()
+                journal = database.pragma(connections['default'], 'journal_mode')
+                connections.close_all()
+                pagecache.bump_tags('brand', 'phone', 'review', 'listing')
+                with replica_reads.installed():
+                    report = loadtest.replay_wsgi(test, plan, options['concurrency'], options['workers'])
+            finally:
+                connections.close_all()
+                for alias, age in saved.items():
+                    connections[alias].settings_dict['CONN_MAX_AGE'] = age
+        return report, journal, replica_reads.count
+
+
+class ReplicaCounter:
+    """
+    Counts the queries run on replica connections opened while installed.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if connection.alias == database.REPLICA and self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    @contextmanager
+    def installed(self):
+        connection_created.connect(self.install, weak=False)
+        try:
+            yield
+        finally:
+            connection_created.disconnect(self.install)
@@ -0,0 +1,45 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import jobs
+from inventory.benchmarks import scratch_database
+from inventory.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Measures how many jobs/sec run_workers gets through for several pool sizes (runs in a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=2000, help='Jobs per run.')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Pool sizes to try.')
+        parser.add_argument('--processes', action='store_true', help='Worker processes instead of threads.')
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds each job sleeps, to stand for I/O; 0 measures the queue itself.',
+        )
+
+    def handle(self, *args, **options):
+        # Workers in several threads or processes need an on-disk database.
+        db_file = os.path.join(tempfile.mkdtemp(), 'bench_jobs.sqlite3')
+        kind = 'processes' if options['processes'] else 'threads'
+        with scratch_database(db_file):
+            for workers in options['workers']:
+                Job.objects.all().delete()
+                Job.objects.bulk_create(
+                    [Job(task='noop', args={'seconds': options['sleep']}) for _ in range(options['jobs'])],
+                    batch_size=1000,
+                )
+                started = time.perf_counter()
+                ran = jobs.run_pool(workers, processes=options['processes'], burst=True)
+                elapsed = time.perf_counter() - started
+                done = Job.objects.filter(status=Job.DONE).count()
+                twice = Job.objects.filter(attempts__gt=1).count()
+                self.stdout.write(
+                    f"{workers:>3} {kind:<9} {ran:,} jobs in {elapsed:.2f}s = {ran / elapsed:,.0f} jobs/sec"
+                )
+                if done != options['jobs'] or ran != options['jobs'] or twice:
+                    raise CommandError(f'{done} jobs done, {ran} run, {twice} claimed more than once.')
+        self.stdout.write(self.style.SUCCESS('Every job ran exactly once.'))
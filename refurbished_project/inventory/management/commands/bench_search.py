@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import search
+from inventory.benchmarks import measure, scratch_database, seed_brands, seed_phones, summarize
+from inventory.models import Phone
+
+QUERIES = ['samsung', 'sams', 'gold 48mp', 'model 4242', 'nokia blue 12mp']
+
+
+class Command(BaseCommand):
+    help = 'Compares FTS5 phone search with the icontains path it replaces (runs in a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phones', type=int, default=200_000)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--db-file', help='Benchmark against an on-disk SQLite file instead of shared memory.')
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Full-text search needs SQLite.')
+
+        with scratch_database(options['db_file']):
+            seed_phones(options['phones'], seed_brands())
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Catalog size: {Phone.objects.count():,} phones'))
+
+            for text in QUERIES:
+                legacy = Phone.objects.filter(search._icontains(text)).select_related('brand').order_by('name', 'id')
+                indexed = search.filter_queryset(Phone.objects.all(), text)
+
+                self.stdout.write(f'"{text}": {indexed.count():,} matches (icontains: {legacy.count():,})')
+                samples = measure(lambda: list(legacy[:24]), options['iterations'])
+                self.stdout.write(f'  {"icontains top 24":<22} {summarize(samples)}')
+                samples = measure(lambda: search.search(text), options['iterations'])
+                self.stdout.write(f'  {"fts5 bm25 top 24":<22} {summarize(samples)}')
+                samples = measure(lambda: legacy.count(), options['iterations'])
+                self.stdout.write(f'  {"icontains count":<22} {summarize(samples)}')
+                samples = measure(lambda: indexed.count(), options['iterations'])
+                self.stdout.write(f'  {"fts5 count":<22} {summarize(samples)}')
+
+            for typo in ['samsnug', 'motorolla', 'silvr']:
+                samples = measure(lambda: search.suggest(typo), options['iterations'])
+                self.stdout.write(f'suggest "{typo}" -> "{search.suggest(typo)}"  {summarize(samples)}')
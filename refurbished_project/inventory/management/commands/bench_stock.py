@@ -0,0 +1,100 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.models import Sum
+
+from inventory import stock
+from inventory.benchmarks import scratch_database, seed_brands, seed_phones
+from inventory.models import Cart, CartItem, Order, Phone
+
+
+def legacy_buy(phone_pk):
+    """
+    The read-modify-write path create_order used before inventory/stock.py, kept for contrast.
+    """
+    phone = Phone.objects.get(pk=phone_pk)
+    if phone.stock <= 0:
+        raise stock.OutOfStock(phone_pk, 1)
+    phone.stock -= 1
+    phone.save()
+    Order.objects.create(phone=phone, order_type='BUY', quantity=1, total_price=phone.base_price, status='COMPLETED')
+
+
+class Command(BaseCommand):
+    help = 'Hammers stock purchases from many threads and checks that nothing is oversold (runs in a scratch database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--phones', type=int, default=5)
+        parser.add_argument('--stock', type=int, default=200, help='Initial stock of each phone.')
+        parser.add_argument('--cart-ratio', type=float, default=0.3, help='Share of purchases made via cart reserve + checkout.')
+        parser.add_argument('--legacy', action='store_true', help='Use the old read-modify-write purchase path.')
+
+    def handle(self, *args, **options):
+        db_file = os.path.join(tempfile.mkdtemp(), 'bench_stock.sqlite3')
+        with scratch_database(db_file):
+            seed_phones(options['phones'], seed_brands())
+            Phone.objects.update(stock=options['stock'])
+            phone_ids = list(Phone.objects.values_list('pk', flat=True))
+            users = [User.objects.create_user(f'bench{i}') for i in range(options['threads'])]
+            carts = [Cart.objects.create(user=user) for user in users]
+            initial = options['stock'] * len(phone_ids)
+
+            outcomes = Counter()
+            lock = threading.Lock()
+            started = time.perf_counter()
+            threads = [
+                threading.Thread(target=self.worker, args=(cart, phone_ids, options, outcomes, lock, seed))
+                for seed, cart in enumerate(carts)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            sold = Order.objects.filter(order_type='BUY').aggregate(units=Sum('quantity'))['units'] or 0
+            remaining = Phone.objects.aggregate(units=Sum('stock'))['units']
+            negative = Phone.objects.filter(stock__lt=0).count()
+            oversold = sold + remaining - initial
+
+            self.stdout.write(f"Initial stock: {initial}, units sold: {sold}, stock left: {remaining}")
+            self.stdout.write(f"Outcomes: {dict(outcomes)}")
+            self.stdout.write(f"Throughput: {outcomes['ordered'] / elapsed:.1f} orders/sec over {elapsed:.2f}s with {options['threads']} threads")
+            if oversold or negative:
+                raise CommandError(f'Oversold by {oversold} units; {negative} phones with negative stock.')
+            self.stdout.write(self.style.SUCCESS('No oversells.'))
+
+    def worker(self, cart, phone_ids, options, outcomes, lock, seed):
+        rng = random.Random(seed)
+        sold_out = set()
+        try:
+            while len(sold_out) < len(phone_ids):
+                phone_id = rng.choice([pk for pk in phone_ids if pk not in sold_out])
+                try:
+                    if options['legacy']:
+                        legacy_buy(phone_id)
+                    elif rng.random() < options['cart_ratio']:
+                        phone = Phone.objects.only('pk').get(pk=phone_id)
+                        stock.reserve(cart, phone)
+                        CartItem.objects.create(cart=cart, phone=phone)
+                        stock.checkout(cart)
+                    else:
+                        stock.buy(Phone.objects.only('pk', 'base_price').get(pk=phone_id))
+                    outcome = 'ordered'
+                except stock.OutOfStock:
+                    sold_out.add(phone_id)
+                    outcome = 'out_of_stock'
+                except OperationalError:
+                    outcome = 'lock_timeout'
+                with lock:
+                    outcomes[outcome] += 1
+        finally:
+            connections.close_all()
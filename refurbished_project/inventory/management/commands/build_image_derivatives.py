@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import images, jobs
+
+
+class Command(BaseCommand):
+    help = 'Makes the responsive AVIF/WebP derivatives of stored phone images, brand logos and home page images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', action='append', choices=sorted(images.SOURCES),
+            help='Only these image fields (repeatable; default: all).',
+        )
+        parser.add_argument(
+            '--force', action='store_true', help='Re-encode every file, including those that already have derivatives.',
+        )
+        parser.add_argument('--workers', type=int, default=4, help='Encoder threads.')
+        parser.add_argument('--queue', action='store_true', help='Queue the work for run_workers instead.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+        if options['queue']:
+            job = jobs.enqueue('build_image_derivatives', {'sources': options['source'], 'force': options['force']})
+            self.stdout.write(self.style.SUCCESS(f'Queued as job {job.pk}.'))
+            return
+        files = []
+        for key in options['source'] or sorted(images.SOURCES):
+            source = images.SOURCES[key]
+            names = images.pending(source, options['force'])
+            self.stdout.write(f'{source}: {len(names)} files to process.')
+            files += [(source, name) for name in sorted(names)]
+
+        built = failed = rows = 0
+        # Threads only encode; rows are updated from this thread, one short write at a time.
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='images') as pool:
+            futures = {pool.submit(images.render, name, replace=options['force']): (source, name) for source, name in files}
+            for future in as_completed(futures):
+                source, name = futures[future]
+                try:
+                    rows += images.record(source, name, future.result())
+                    built += 1
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{name}: {exc}')
+        self.stdout.write(self.style.SUCCESS(f'Built derivatives of {built} files for {rows} rows; {failed} failed.'))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.querybuffer import QueryBuffer
+
+
+class Command(BaseCommand):
+    help = 'Writes queries left in the query buffer spool by processes that are no longer running'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spool', help='Spool directory (default: settings.QUERY_BUFFER_SPOOL).')
+
+    def handle(self, *args, **options):
+        spool = options['spool'] or getattr(settings, 'QUERY_BUFFER_SPOOL', None)
+        if not spool:
+            raise CommandError('No spool directory: QUERY_BUFFER_SPOOL is not set.')
+        # Claims the orphaned spool files on creation; no writer thread is started.
+        buffer = QueryBuffer(spool=spool, flush_interval=None)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {buffer.flush()} spooled queries.'))
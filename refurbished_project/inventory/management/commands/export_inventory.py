@@ -0,0 +1,37 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import feeds
+
+
+class Command(BaseCommand):
+    help = 'Streams every phone to a CSV or JSON Lines feed that import_inventory can read back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for stdout.")
+        parser.add_argument('--format', choices=feeds.FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=feeds.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path == '-' and not options['format']:
+            raise CommandError('--format is required when writing to stdout.')
+        try:
+            fmt = feeds.detect_format(path, options['format'])
+            stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        except (feeds.FeedError, OSError) as exc:
+            raise CommandError(exc)
+
+        started = time.perf_counter()
+        try:
+            count = feeds.write_feed(stream, fmt, feeds.export_rows(chunk_size=options['chunk_size']))
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        elapsed = time.perf_counter() - started
+        if stream is not sys.stdout:
+            self.stdout.write(self.style.SUCCESS(
+                f'Exported {count} phones in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} rows/sec).'
+            ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import datagen
+
+# Defaults add up to about a million rows.
+DEFAULTS = {
+    'users': 20000,
+    'brands': 50,
+    'platforms': 10,
+    'phones': 100000,
+    'listings': 300000,
+    'orders': 400000,
+    'reviews': 150000,
+    'carts': 10000,
+}
+
+
+class Command(BaseCommand):
+    help = 'Bulk-inserts deterministic synthetic users, catalog, listings, orders, reviews and carts for load testing'
+
+    def add_arguments(self, parser):
+        for entity in datagen.ENTITIES:
+            parser.add_argument(f'--{entity}', type=int, default=DEFAULTS[entity], help=f'Number of {entity} (default {DEFAULTS[entity]}).')
+        parser.add_argument('--seed', type=int, default=0, help='The same seed always generates the same data.')
+        parser.add_argument('--batch-size', type=int, default=datagen.DEFAULT_BATCH_SIZE, help='Rows per transaction.')
+
+    def handle(self, *args, **options):
+        counts = {entity: options[entity] for entity in datagen.ENTITIES}
+        negative = [entity for entity, count in counts.items() if count < 0]
+        if negative:
+            raise CommandError(f"Counts can't be negative: {', '.join(negative)}")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        generator = datagen.Generator(seed=options['seed'], batch_size=options['batch_size'], log=self.stdout.write)
+        generator.run(**counts)
+        self.stdout.write(self.style.SUCCESS(f"Done. Generated users can log in with password {datagen.USER_PASSWORD!r}."))
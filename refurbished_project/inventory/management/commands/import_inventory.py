@@ -0,0 +1,71 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import feeds, jobs
+
+
+class Command(BaseCommand):
+    help = 'Streams a CSV or JSON Lines supplier feed into Phone, upserting in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file, or '-' for stdin.")
+        parser.add_argument('--format', choices=feeds.FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--key', choices=feeds.KEYS, default='sku', help='Column rows are matched on.')
+        parser.add_argument('--batch-size', type=int, default=feeds.DEFAULT_BATCH_SIZE)
+        parser.add_argument('--create-brands', action='store_true', help='Create brands the feed mentions that do not exist yet.')
+        parser.add_argument('--max-errors', type=int, default=20, help='How many rejected rows to list.')
+        parser.add_argument(
+            '--queue', action='store_true', help='Queue the import for run_workers, which must be able to read the file.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path == '-' and not options['format']:
+            raise CommandError('--format is required when reading from stdin.')
+        if options['queue']:
+            if path == '-':
+                raise CommandError("--queue needs a file, not '-'.")
+            if not os.path.isfile(path):
+                raise CommandError(f'No such file: {path}')
+            try:
+                fmt = feeds.detect_format(path, options['format'])
+            except feeds.FeedError as exc:
+                raise CommandError(exc)
+            job = jobs.enqueue('import_feed', {
+                'path': os.path.abspath(path),
+                'fmt': fmt,
+                'key': options['key'],
+                'batch_size': options['batch_size'],
+                'create_brands': options['create_brands'],
+            })
+            self.stdout.write(self.style.SUCCESS(f'Queued as job {job.pk}.'))
+            return
+
+        try:
+            fmt = feeds.detect_format(path, options['format'])
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except (feeds.FeedError, OSError) as exc:
+            raise CommandError(exc)
+
+        try:
+            stats = feeds.import_feed(
+                stream,
+                fmt,
+                key=options['key'],
+                batch_size=options['batch_size'],
+                create_brands=options['create_brands'],
+                max_errors=options['max_errors'],
+            )
+        except feeds.FeedError as exc:
+            raise CommandError(exc)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for line_number, error in stats.errors:
+            self.stderr.write(f'line {line_number}: {error}')
+        if stats.rejected > len(stats.errors):
+            self.stderr.write(f'... and {stats.rejected - len(stats.errors)} more rejected rows')
+        self.stdout.write(self.style.SUCCESS(f'Imported: {stats}'))
@@ -0,0 +1,62 @@
+import os
+import tempfile
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import datagen, loadtest
+from inventory.benchmarks import scratch_database
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays a weighted mix of storefront requests against the WSGI app and reports p50/p95/p99 '
+        'latency and queries per request (runs in a scratch database filled by generate_data unless --use-current-db)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{name}={weight}' for name, weight in loadtest.DEFAULT_MIX.items()),
+            help='Scenario weights, e.g. list=40,detail=35,home=10,cart=8,add_to_cart=4,order=3.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=50, help='Logged-in visitors to simulate.')
+        parser.add_argument('--warmup', type=int, default=200, help='Requests sent before measuring.')
+        parser.add_argument('--phones', type=int, default=20000, help='Catalog size of the scratch database.')
+        parser.add_argument('--use-current-db', action='store_true', help='Run against the configured database (it will be written to).')
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        if options['requests'] < 1 or options['threads'] < 1:
+            raise CommandError('--requests and --threads must be at least 1.')
+
+        if options['use_current_db']:
+            context = nullcontext()
+        else:
+            context = scratch_database(os.path.join(tempfile.mkdtemp(), 'loadtest.sqlite3'))
+        with context:
+            if not options['use_current_db']:
+                phones = options['phones']
+                datagen.Generator(seed=options['seed'], log=self.stdout.write).run(
+                    users=max(options['users'], phones // 10), brands=20, platforms=5, phones=phones,
+                    listings=phones * 3, orders=phones * 4, reviews=phones * 2, carts=options['users'],
+                )
+            users = list(User.objects.filter(is_active=True, is_staff=False).order_by('pk')[:options['users']])
+            try:
+                test = loadtest.LoadTest(mix=mix, seed=options['seed'], users=users)
+            except ValueError as exc:
+                raise CommandError(exc)
+            if options['warmup']:
+                test.run(options['warmup'], options['threads'])
+            report = test.run(options['requests'], options['threads'])
+            self.stdout.write(str(report))
+            if report.errors:
+                self.stderr.write(f'{report.errors} requests failed.')
+            self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory import facets
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the materialized phone facet counts from the Phone table'
+
+    def handle(self, *args, **kwargs):
+        cells = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {cells} facet cells.'))
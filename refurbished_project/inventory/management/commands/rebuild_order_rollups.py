@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import analytics
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily order analytics rollups from the Order table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD; default: the first order).')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD; default: the last order).')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+        if start and end and start > end:
+            raise CommandError('--start is after --end.')
+        cells = analytics.rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {cells} daily order rollups.'))
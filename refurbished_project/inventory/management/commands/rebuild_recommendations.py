@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the related-phones lists of queued phones (or of every phone with --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every list, refreshing co-purchases and sales.')
+        parser.add_argument('--loop', action='store_true', help='Keep processing the queue until interrupted.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between passes with --loop.')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            started = time.perf_counter()
+            try:
+                rewritten = recommendations.rebuild() if full else recommendations.update()
+            except recommendations.RecommendationsUnavailable as exc:
+                raise CommandError(exc)
+            if rewritten or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Rewrote {rewritten} recommendation lists in {time.perf_counter() - started:.2f}s.'
+                ))
+            if not options['loop']:
+                break
+            full = False
+            time.sleep(options['interval'])
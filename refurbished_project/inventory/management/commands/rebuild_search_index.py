@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the FTS5 phone search index and its sync triggers'
+
+    def handle(self, *args, **kwargs):
+        if not search.is_available():
+            raise CommandError('Full-text search needs SQLite; other databases use icontains lookups.')
+        indexed = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} phones.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from inventory import ratings
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the review aggregates stored on Phone for every phone whose values have drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many phones have drifted.')
+
+    def handle(self, *args, **options):
+        drifted = ratings.reconcile(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f'{drifted} phones have drifted review aggregates.')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {drifted} phones.'))
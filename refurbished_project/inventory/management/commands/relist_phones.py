@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import listings
+from inventory.models import Platform
+
+
+class Command(BaseCommand):
+    help = 'Prices and lists every phone on every platform in batches, or reprices existing listings after a fee change'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--platform', action='append', help='Platform name; repeat for several. Defaults to all.')
+        parser.add_argument('--reprice', action='store_true', help='Only refresh price and condition of existing listings.')
+        parser.add_argument('--unlisted', action='store_true', help='Create listings with is_listed off.')
+        parser.add_argument('--batch-size', type=int, default=listings.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        platforms = Platform.objects.order_by('name')
+        if options['platform']:
+            platforms = platforms.filter(name__in=options['platform'])
+            missing = set(options['platform']) - set(platforms.values_list('name', flat=True))
+            if missing:
+                raise CommandError(f"Unknown platform(s): {', '.join(sorted(missing))}")
+
+        if options['reprice']:
+            for platform in platforms:
+                run = listings.reprice_platform(platform, batch_size=options['batch_size'])
+                self.stdout.write(f"{platform.name}: repriced {run}")
+        else:
+            run = listings.list_phones(
+                platforms=list(platforms),
+                batch_size=options['batch_size'],
+                is_listed=not options['unlisted'],
+            )
+            self.stdout.write(f"Listed {run}")
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (repricing, feed imports, image derivatives, bulk actions) in a worker pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker threads (or processes).')
+        parser.add_argument('--processes', action='store_true', help='Run each worker in its own process.')
+        parser.add_argument('--burst', action='store_true', help='Stop once no job is ready instead of waiting.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+        kind = 'processes' if options['processes'] else 'threads'
+        if not options['burst']:
+            self.stdout.write(f"Running jobs with {options['workers']} worker {kind}; Ctrl-C to stop.")
+        started = time.perf_counter()
+        ran = jobs.run_pool(options['workers'], processes=options['processes'], burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs in {time.perf_counter() - started:.2f}s.'))
@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import pricing
+from inventory.models import Platform
+
+
+def synthetic_platforms(count):
+    """
+    count made-up platforms with fees from 5% to ~25% and fixed fees of $0-$2.
+    """
+    return [
+        pricing.Terms(-index, f'Platform {index}', Decimal(5 + index) + Decimal('0.25'), Decimal(index % 5) / 2)
+        for index in range(1, count + 1)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Prices every phone on every platform under hypothetical fees and a target margin'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fee', action='append', default=[], metavar='PLATFORM=PERCENT[:FIXED]',
+            help='Hypothetical fee_percentage (and fixed_fee) for a platform, by name; repeatable.',
+        )
+        parser.add_argument('--target-margin', default='0', help='Target margin, in percent of the selling price.')
+        parser.add_argument('--verify', type=int, default=pricing.DEFAULT_VERIFY,
+                            help='Phones whose prices are rechecked with Decimal arithmetic (0 to skip).')
+        parser.add_argument('--chunk-size', type=int, default=pricing.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--synthetic', type=int, metavar='PHONES',
+                            help='Simulate this many made-up phones instead of the database (for benchmarks).')
+        parser.add_argument('--synthetic-platforms', type=int, default=20,
+                            help='Made-up platforms with --synthetic.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        try:
+            if options['synthetic']:
+                current = synthetic_platforms(options['synthetic_platforms'])
+                phones = pricing.PhoneArrays.synthetic(options['synthetic'])
+            else:
+                current = [pricing.Terms.of(platform) for platform in Platform.objects.order_by('name')]
+                phones = None
+            params = {'margin': options['target_margin']}
+            by_name = {terms.name.lower(): terms for terms in current}
+            for value in options['fee']:
+                name, _, fees = value.partition('=')
+                if name.lower() not in by_name or not fees:
+                    raise CommandError(f'--fee {value}: expected PLATFORM=PERCENT[:FIXED] with a known platform.')
+                fee, _, fixed = fees.partition(':')
+                platform_id = by_name[name.lower()].platform_id
+                params[f'fee_{platform_id}'], params[f'fixed_{platform_id}'] = fee, fixed
+            scenario, margin = pricing.parse_scenario(params, current)
+            simulation = pricing.simulate(
+                scenario, margin, phones=phones, current=current,
+                chunk_size=options['chunk_size'], verify=options['verify'],
+            )
+        except (pricing.PricingUnavailable, ValueError) as exc:
+            raise CommandError(exc)
+
+        self.stdout.write(
+            f'{simulation.phones:,} phones x {len(current)} platforms = {simulation.cells:,} prices '
+            f'in {simulation.seconds:.2f}s (target margin {simulation.target_margin}%)'
+        )
+        for row in simulation.platforms:
+            fee, fixed = row['scenario_terms']
+            change = '-' if row['mean_price_change'] is None else f"{row['mean_price_change']:+}%"
+            self.stdout.write(
+                f"  {row['name']:<20} {fee:>6}% + {fixed:<6}{' *' if row['changed'] else '  '} "
+                f"now: mean ${row['current_mean_price']}, {row['current_losing']:,} losing, "
+                f"stock profit ${row['current_stock_profit']:,} | "
+                f"repriced: mean ${row['scenario_mean_price']} ({change}), {row['scenario_losing']:,} losing, "
+                f"stock profit ${row['scenario_stock_profit']:,}"
+            )
+        if simulation.mismatches:
+            for phone_id, platform_id, price, expected in simulation.mismatches[:10]:
+                self.stderr.write(f'  phone {phone_id}, platform {platform_id}: {price} != {expected}')
+            raise CommandError(f'{len(simulation.mismatches)} of {simulation.checked} sampled prices differ from Decimal arithmetic.')
+        if simulation.checked:
+            self.stdout.write(self.style.SUCCESS(f'{simulation.checked:,} sampled prices match Decimal arithmetic.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory import stock
+
+
+class Command(BaseCommand):
+    help = 'Returns stock held by expired cart reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping until interrupted.')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between sweeps with --loop.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        while True:
+            expired = 0
+            while True:
+                swept = stock.expire_reservations(batch_size=options['batch_size'])
+                expired += swept
+                if swept < options['batch_size']:
+                    break
+            if expired:
+                self.stdout.write(self.style.SUCCESS(f'Expired {expired} reservations.'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,361 @@
+# inventory/metrics.py
+
+"""
+Prometheus metrics, shared by all worker processes through memory-mapped files.
+
+Counters and histograms are updated where things happen: request latency and queries per
+URL name by PerfMiddleware (perf.py), cache lookups by the cache backend
+(cache_backends.py), orders, stock-outs and query submissions by the code that makes
+them. Each process adds to its own file in METRICS_DIR (<pid>.db) under a lock that only
+its own threads contend for, and /metrics adds up the files of every process, running or
+not, so counters don't go back when a worker is restarted. Gauges that describe the data
+rather than events (listings per platform, phones out of stock, cache hit ratios) are
+computed when /metrics is scraped.
+
+Empty METRICS_DIR on deploy to start the counters from zero; METRICS_DIR = None turns
+metrics off. When METRICS_TOKEN is set, /metrics needs "Authorization: Bearer <token>".
+"""
+
+import hmac
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Listing, Phone
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+INITIAL_FILE_SIZE = 64 * 1024
+HEADER = struct.Struct('<Q')
+KEY_LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+
+METRICS = []
+
+_lock = threading.Lock()
+_values = None
+
+
+def _padded(size):
+    return (size + 7) & ~7
+
+
+def read_entries(data):
+    """
+    Yields (key, offset of the value, value) for each entry of a values file's contents.
+    """
+    used = HEADER.unpack_from(data, 0)[0]
+    position = HEADER.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(data, position)[0]
+        key = bytes(data[position + KEY_LENGTH.size:position + KEY_LENGTH.size + length]).decode()
+        position += _padded(KEY_LENGTH.size + length)
+        yield key, position, VALUE.unpack_from(data, position)[0]
+        position += VALUE.size
+
+
+class ValueFile:
+    """
+    {key: float} in a memory-mapped file written by a single process.
+
+    The file starts with the number of bytes in use, followed by the entries: a 4-byte key
+    length, the UTF-8 key padded to a multiple of 8 bytes, and an 8-byte double. Entries
+    are only appended and values are updated in place, and the size in use is written
+    after a new entry, so other processes can read the file at any time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < INITIAL_FILE_SIZE:
+            self._file.truncate(INITIAL_FILE_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        # A file left by an earlier process with the same pid is carried on.
+        self._used = max(HEADER.size, HEADER.unpack_from(self._map, 0)[0])
+        self._positions = {key: position for key, position, _ in read_entries(self._map)}
+
+    def add(self, amounts):
+        """
+        Adds each (key, amount) of amounts to the key's value.
+        """
+        with self._lock:
+            for key, amount in amounts:
+                position = self._positions.get(key)
+                if position is None:
+                    position = self._append(key)
+                VALUE.pack_into(self._map, position, VALUE.unpack_from(self._map, position)[0] + amount)
+
+    def _append(self, key):
+        encoded = key.encode()
+        position = self._used + _padded(KEY_LENGTH.size + len(encoded))
+        end = position + VALUE.size
+        if end > len(self._map):
+            size = len(self._map)
+            while size < end:
+                size *= 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        KEY_LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + KEY_LENGTH.size:self._used + KEY_LENGTH.size + len(encoded)] = encoded
+        VALUE.pack_into(self._map, position, 0.0)
+        self._used = end
+        HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def values():
+    """
+    This process's ValueFile, or None when metrics are off.
+    """
+    global _values
+    if _values is None:
+        directory = metrics_dir()
+        if not directory:
+            return None
+        with _lock:
+            if _values is None:
+                os.makedirs(directory, exist_ok=True)
+                _values = ValueFile(os.path.join(directory, f'{os.getpid()}.db'))
+    return _values
+
+
+def reset():
+    """
+    Closes this process's file; the next update opens the one in the current METRICS_DIR.
+    """
+    global _values
+    with _lock:
+        if _values is not None:
+            _values.close()
+            _values = None
+
+
+def _after_fork():
+    # A worker forked from a process that already had its file open gets a file of its own.
+    # The lock may have been held by another thread of the parent, so it is replaced too.
+    global _lock, _values
+    _lock = threading.Lock()
+    _values = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+        METRICS.append(self)
+
+    def key(self, suffix, labelvalues, extra=()):
+        return json.dumps([self.name + suffix, list(zip(self.labelnames, labelvalues)) + list(extra)])
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        store = values()
+        if store is None:
+            return
+        key = self._keys.get(labelvalues)
+        if key is None:
+            key = self._keys[labelvalues] = self.key('_total', [str(value) for value in labelvalues])
+        store.add([(key, amount)])
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        store = values()
+        if store is None:
+            return
+        keys = self._keys.get(labelvalues)
+        if keys is None:
+            labels = [str(label) for label in labelvalues]
+            # Buckets are stored as plain counts and made cumulative when exposed.
+            bounds = [_format(bound) for bound in self.buckets] + ['+Inf']
+            keys = self._keys[labelvalues] = (
+                [self.key('_bucket', labels, [['le', bound]]) for bound in bounds],
+                self.key('_sum', labels),
+                self.key('_count', labels),
+            )
+        buckets, sum_key, count_key = keys
+        store.add([(buckets[bisect_left(self.buckets, value)], 1), (sum_key, value), (count_key, 1)])
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to serve a request, by URL name and method.', ('view', 'method'),
+)
+REQUESTS = Counter('http_requests', 'Requests served, by URL name, method and status code.', ('view', 'method', 'status'))
+DB_QUERIES = Counter('inventory_db_queries', 'SQL queries run while serving requests, by URL name.', ('view',))
+DB_QUERY_SECONDS = Counter(
+    'inventory_db_query_seconds', 'Time spent running SQL queries while serving requests, by URL name.', ('view',),
+)
+CACHE_LOOKUPS = Counter(
+    'inventory_cache_lookups', 'Cache lookups by key family and outcome (local_hits, shared_hits or misses).',
+    ('family', 'outcome'),
+)
+ORDERS_CREATED = Counter('inventory_orders_created', 'Orders created, by type and status.', ('type', 'status'))
+STOCK_OUTS = Counter('inventory_stock_outs', 'Attempts to take more units of a phone than are in stock.')
+QUERY_SUBMISSIONS = Counter(
+    'inventory_query_submissions',
+    'Chatbot and sell-form queries submitted, by outcome (accepted, invalid, or rejected for a full write buffer).',
+    ('outcome',),
+)
+
+
+def observe_request(timings):
+    """
+    Records a request timed by PerfMiddleware.
+    """
+    view = timings.view or 'unresolved'
+    REQUEST_LATENCY.observe(timings.seconds, view, timings.method)
+    REQUESTS.inc(view, timings.method, timings.status)
+    if timings.queries:
+        DB_QUERIES.inc(view, amount=timings.queries)
+        DB_QUERY_SECONDS.inc(view, amount=timings.sql_seconds)
+
+
+def count_orders(orders):
+    for order in orders:
+        ORDERS_CREATED.inc(order.order_type, order.status)
+
+
+def collect():
+    """
+    {sample name: [(label pairs, value)]}, added up over the files of every process.
+    """
+    directory = metrics_dir()
+    totals = defaultdict(float)
+    if directory and os.path.isdir(directory):
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('.db'):
+                continue
+            with open(entry.path, 'rb') as f:
+                data = f.read()
+            if len(data) >= HEADER.size:
+                for key, _, value in read_entries(data):
+                    totals[key] += value
+    samples = defaultdict(list)
+    for key, value in totals.items():
+        name, labels = json.loads(key)
+        samples[name].append((tuple(tuple(pair) for pair in labels), value))
+    return samples
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{label}="{_escape(text)}"' for label, text in labels) + '}'
+    return f'{name} {_format(value)}'
+
+
+def _exposition(name, documentation, kind, lines):
+    return [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}'] + lines
+
+
+def _histogram_lines(metric, samples):
+    lines = []
+    bounds = [_format(bound) for bound in metric.buckets] + ['+Inf']
+    counts = defaultdict(dict)
+    for labels, value in samples.get(metric.name + '_bucket', ()):
+        counts[labels[:-1]][labels[-1][1]] = value
+    sums = dict(samples.get(metric.name + '_sum', ()))
+    for labels in sorted(counts):
+        cumulative = 0
+        for bound in bounds:
+            cumulative += counts[labels].get(bound, 0)
+            lines.append(_sample(metric.name + '_bucket', labels + (('le', bound),), cumulative))
+        lines.append(_sample(metric.name + '_sum', labels, sums.get(labels, 0)))
+        lines.append(_sample(metric.name + '_count', labels, cumulative))
+    return lines
+
+
+def gauges(samples):
+    """
+    (name, documentation, [(label pairs, value)]) of the gauges computed at scrape time.
+    """
+    listings = (
+        Listing.objects.order_by().values_list('platform__name', 'is_listed').annotate(count=Count('pk'))
+    )
+    yield 'inventory_listings', 'Listings per platform, listed or not.', [
+        ((('platform', platform), ('listed', 'true' if listed else 'false')), count)
+        for platform, listed, count in listings
+    ]
+    yield 'inventory_phones_out_of_stock', 'Phones with no units in stock.', [
+        ((), Phone.objects.filter(stock=0).count()),
+    ]
+    lookups = defaultdict(lambda: defaultdict(float))
+    for labels, value in samples.get(CACHE_LOOKUPS.name + '_total', ()):
+        family, outcome = dict(labels)['family'], dict(labels)['outcome']
+        lookups[family][outcome] += value
+    ratios = []
+    for family, counts in sorted(lookups.items()):
+        total = sum(counts.values())
+        if total:
+            ratios.append(((('family', family),), (counts['local_hits'] + counts['shared_hits']) / total))
+    yield 'inventory_cache_hit_ratio', 'Share of cache lookups that were hits, by key family, since the counters started.', ratios
+
+
+def render():
+    """
+    All metrics in the Prometheus text format.
+    """
+    samples = collect()
+    lines = []
+    for metric in METRICS:
+        if metric.kind == 'histogram':
+            metric_lines = _histogram_lines(metric, samples)
+        else:
+            metric_lines = [
+                _sample(metric.name + '_total', labels, value)
+                for labels, value in sorted(samples.get(metric.name + '_total', ()))
+            ]
+        lines += _exposition(metric.name, metric.documentation, metric.kind, metric_lines)
+    for name, documentation, gauge_samples in gauges(samples):
+        lines += _exposition(name, documentation, 'gauge', [_sample(name, labels, value) for labels, value in gauge_samples])
+    return '\n'.join(lines) + '\n'
+
+
+def authorized(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        return True
+    return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
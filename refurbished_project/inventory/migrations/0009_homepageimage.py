@@ -0,0 +1,22 @@
+# Generated by Django 5.1.15 on 2026-10-17 20:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_cart_cartitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HomePageImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='home_page_images/')),
+                ('title', models.CharField(max_length=100)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-17 20:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_homepageimage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['base_price', 'id'], name='phone_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['brand', 'base_price', 'id'], name='phone_brand_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['condition', 'base_price', 'id'], name='phone_cond_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['memory', 'base_price', 'id'], name='phone_memory_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['name', 'id'], name='phone_name_id_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.15 on 2026-10-17 21:01
+
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Value, When
+
+# Upper bounds of inventory.facets.PRICE_BUCKETS, as they were when the table was added.
+PRICE_BUCKET_HIGHS = (100, 200, 300, 500, 750, 1000)
+
+
+def backfill_facet_counts(apps, schema_editor):
+    # The same cells as inventory.facets.rebuild(), with the historical models.
+    Phone = apps.get_model('inventory', 'Phone')
+    PhoneFacetCount = apps.get_model('inventory', 'PhoneFacetCount')
+    bucket = Case(
+        *[When(base_price__lt=high, then=Value(index)) for index, high in enumerate(PRICE_BUCKET_HIGHS)],
+        default=Value(len(PRICE_BUCKET_HIGHS)),
+        output_field=IntegerField(),
+    )
+    rows = (
+        Phone.objects.annotate(price_bucket=bucket)
+        .values('brand_id', 'condition', 'memory', 'color', 'camera_quality', 'price_bucket')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    PhoneFacetCount.objects.bulk_create([
+        PhoneFacetCount(**{**row, 'color': row['color'] or '', 'camera_quality': row['camera_quality'] or ''})
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_phone_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhoneFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('brand_id', models.BigIntegerField(blank=True, null=True)),
+                ('condition', models.CharField(max_length=20)),
+                ('memory', models.IntegerField()),
+                ('color', models.CharField(blank=True, max_length=50)),
+                ('camera_quality', models.CharField(blank=True, max_length=50)),
+                ('price_bucket', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('brand_id', 'condition', 'memory', 'color', 'camera_quality', 'price_bucket')},
+            },
+        ),
+        migrations.RunPython(backfill_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.15 on 2026-10-17 21:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Snapshot of the table Listing.map_condition_to_platform used to hard-code.
+DEFAULT_MAPPINGS = {
+    'X': {'New': 'New', 'Good': 'Good', 'Usable': 'Scrap', 'Scrap': 'Scrap'},
+    'Y': {'New': '3 stars (Excellent)', 'Good': '2 stars (Good)', 'Usable': '1 star (Usable)', 'Scrap': '1 star (Usable)'},
+    'Z': {'New': 'New', 'Good': 'As New', 'Usable': 'Good', 'Scrap': 'Good'},
+}
+
+
+def seed_mappings(apps, schema_editor):
+    Platform = apps.get_model('inventory', 'Platform')
+    PlatformConditionMapping = apps.get_model('inventory', 'PlatformConditionMapping')
+    PlatformConditionMapping.objects.bulk_create([
+        PlatformConditionMapping(platform=platform, general_condition=condition, platform_category=category)
+        for platform in Platform.objects.filter(name__in=DEFAULT_MAPPINGS)
+        for condition, category in DEFAULT_MAPPINGS[platform.name].items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformConditionMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('general_condition', models.CharField(choices=[('New', 'New'), ('Good', 'Good'), ('Usable', 'Usable'), ('Scrap', 'Scrap')], max_length=20)),
+                ('platform_category', models.CharField(help_text="Condition category shown on the platform (e.g., '3 stars (Excellent)').", max_length=50)),
+                ('platform', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='condition_mappings', to='inventory.platform')),
+            ],
+            options={
+                'ordering': ('platform', 'general_condition'),
+                'unique_together': {('platform', 'general_condition')},
+            },
+        ),
+        migrations.RunPython(seed_mappings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.15 on 2026-10-17 21:18
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+
+
+def drop_search_triggers(apps, schema_editor):
+    from inventory import search
+    search.drop_triggers(schema_editor.connection)
+
+
+def install_search_triggers(apps, schema_editor):
+    from inventory import search
+    search.install(schema_editor.connection)
+
+
+def backfill_ratings(apps, schema_editor):
+    Phone = apps.get_model('inventory', 'Phone')
+    Review = apps.get_model('inventory', 'Review')
+    reviews = Review.objects.filter(phone=OuterRef('pk')).order_by().values('phone')
+    Phone.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        rating_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+    )
+    Phone.objects.filter(rating_count__gt=0).update(
+        rating_average=Cast(F('rating_sum'), FloatField()) / F('rating_count')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_platformconditionmapping'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, install_search_triggers),
+        migrations.AddField(
+            model_name='phone',
+            name='rating_average',
+            field=models.FloatField(default=0, editable=False, help_text='rating_sum / rating_count, stored so that it can be indexed for sorting and filtering.'),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['rating_average', 'id'], name='phone_rating_id_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+        migrations.RunPython(install_search_triggers, drop_search_triggers),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-17 21:21
+
+from django.db import migrations, models
+
+
+def drop_search_triggers(apps, schema_editor):
+    from inventory import search
+    search.drop_triggers(schema_editor.connection)
+
+
+def install_search_triggers(apps, schema_editor):
+    from inventory import search
+    search.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_phone_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, install_search_triggers),
+        migrations.AddField(
+            model_name='phone',
+            name='sku',
+            field=models.CharField(blank=True, help_text='Supplier stock-keeping unit; the key inventory feeds are imported on.', max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(install_search_triggers, drop_search_triggers),
+    ]
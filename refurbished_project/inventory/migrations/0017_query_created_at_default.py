@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_phone_sku'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='query',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:13
+
+from django.db import migrations, models
+
+
+def drop_search_triggers(apps, schema_editor):
+    from inventory import search
+    search.drop_triggers(schema_editor.connection)
+
+
+def install_search_triggers(apps, schema_editor):
+    from inventory import search
+    search.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_query_created_at_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, install_search_triggers),
+        migrations.AddField(
+            model_name='brand',
+            name='logo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='homepageimage',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(install_search_triggers, drop_search_triggers),
+    ]
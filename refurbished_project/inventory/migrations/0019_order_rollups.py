@@ -0,0 +1,72 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:25
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    # The same cells as inventory.analytics.rebuild(), with the historical models.
+    Order = apps.get_model('inventory', 'Order')
+    OrderRollup = apps.get_model('inventory', 'OrderRollup')
+    days = (
+        Order.objects.filter(status='COMPLETED')
+        .annotate(day=TruncDate('created_at'), brand_id=F('phone__brand_id'), condition=F('phone__condition'))
+        .values('day', 'brand_id', 'condition', 'order_type')
+        .annotate(count=Count('id'), quantity=Sum('quantity'), money=Sum('total_price'))
+        .order_by()
+    )
+    cells = defaultdict(lambda: [0, 0, 0])
+    for row in days.iterator():
+        day, brand_id, condition, order_type = row['day'], row['brand_id'], row['condition'], row['order_type']
+        for key in (
+            ('day', day, brand_id, condition, order_type),
+            ('month', day.replace(day=1), brand_id, condition, order_type),
+            ('day_total', day, None, '', order_type),
+        ):
+            totals = cells[key]
+            totals[0] += row['count']
+            totals[1] += row['quantity']
+            totals[2] += row['money']
+    OrderRollup.objects.bulk_create([
+        OrderRollup(
+            period=period, day=day, brand_id=brand_id, condition=condition, order_type=order_type,
+            orders=orders, units=units, revenue=revenue,
+        )
+        for (period, day, brand_id, condition, order_type), (orders, units, revenue) in cells.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day, by brand and condition'), ('month', 'Month, by brand and condition'), ('day_total', 'Day, all brands and conditions')], max_length=10)),
+                ('day', models.DateField(help_text='The day, or the first day of the month.')),
+                ('brand_id', models.BigIntegerField(blank=True, null=True)),
+                ('condition', models.CharField(blank=True, max_length=20)),
+                ('order_type', models.CharField(choices=[('BUY', 'Buy'), ('SELL', 'Sell')], max_length=4)),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='orderrollup',
+            unique_together={('period', 'day', 'brand_id', 'condition', 'order_type')},
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def queue_existing_phones(apps, schema_editor):
+    # Lists are computed by rebuild_recommendations (it needs NumPy); queue every phone for it.
+    Phone = apps.get_model('inventory', 'Phone')
+    PendingRecommendation = apps.get_model('inventory', 'PendingRecommendation')
+    now = django.utils.timezone.now()
+    PendingRecommendation.objects.bulk_create(
+        [PendingRecommendation(phone_id=phone_id, queued_at=now) for phone_id in Phone.objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_order_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_id', models.BigIntegerField(unique=True)),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PhoneRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField(help_text='Distance from the phone; lower is closer.')),
+                ('phone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='inventory.phone')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_in', to='inventory.phone')),
+            ],
+            options={
+                'unique_together': {('phone', 'rank')},
+            },
+        ),
+        migrations.RunPython(queue_existing_phones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.15 on 2026-10-17 22:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0020_phone_recommendations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=20)),
+                ('model', models.CharField(help_text='app_label.model_name of the rows.', max_length=100)),
+                ('query', models.BinaryField(help_text="The selected rows' pickled Query.")),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('description', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('cursor', models.BigIntegerField(default=0)),
+                ('total', models.PositiveBigIntegerField(blank=True, help_text='Estimated number of rows.', null=True)),
+                ('processed', models.PositiveBigIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['stock', 'id'], name='phone_stock_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='query',
+            index=models.Index(fields=['created_at'], name='query_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='bulkjob',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
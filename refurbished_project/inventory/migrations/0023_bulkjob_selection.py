@@ -0,0 +1,38 @@
+# Generated by Django 5.1.15 on 2026-10-17 23:30
+
+from django.db import migrations, models
+from django.utils import timezone
+
+UNFINISHED = ('queued', 'running', 'failed')
+ERROR = 'Queued with a pickled selection, which is no longer read; queue the action again.'
+
+
+def fail_unfinished_jobs(apps, schema_editor):
+    # Their selection was a pickled Query, dropped here rather than unpickled.
+    BulkJob = apps.get_model('inventory', 'BulkJob')
+    Job = apps.get_model('inventory', 'Job')
+    now = timezone.now()
+    BulkJob.objects.filter(status__in=UNFINISHED).update(status='failed', error=ERROR, finished_at=now)
+    Job.objects.filter(task='bulk_job', status__in=('queued', 'running')).update(
+        status='failed', error=ERROR, finished_at=now,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0022_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_unfinished_jobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='bulkjob',
+            name='query',
+        ),
+        migrations.AddField(
+            model_name='bulkjob',
+            name='selection',
+            field=models.JSONField(default=dict, help_text='The selected rows: {"pks": [...]}, or {"changelist": "<admin changelist query string>"}.'),
+        ),
+    ]
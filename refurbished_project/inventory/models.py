@@ -1,8 +1,12 @@
 # inventory/models.py
 
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import F, Sum
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Brand(models.Model):
     """
@@ -10,6 +14,8 @@ class Brand(models.Model):
     """
     name = models.CharField(max_length=100, unique=True)
     logo = models.ImageField(upload_to='brand_logos/', blank=True, null=True)
+    # Resized WebP/AVIF copies of the logo, written by inventory/images.py.
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -27,6 +33,13 @@ class Phone(models.Model):
     ]
 
     name = models.CharField(max_length=100, help_text="Name of the phone model (e.g., 12, Galaxy S21)")
+    sku = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Supplier stock-keeping unit; the key inventory feeds are imported on."
+    )
     base_price = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -55,6 +68,30 @@ class Phone(models.Model):
         null=True,
         help_text="Image of the phone."
     )
+    # Resized WebP/AVIF copies of the image, written by inventory/images.py.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Review aggregates, kept up to date by inventory/ratings.py; reconcile_ratings recomputes them.
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(
+        default=0,
+        editable=False,
+        help_text="rating_sum / rating_count, stored so that it can be indexed for sorting and filtering."
+    )
+
+    class Meta:
+        # Composite indexes backing the catalog's keyset pagination (see inventory/catalog.py).
+        # Each filter column leads so that "filter + ORDER BY sort key, id" is a single index range scan.
+        indexes = [
+            models.Index(fields=['base_price', 'id'], name='phone_price_id_idx'),
+            models.Index(fields=['brand', 'base_price', 'id'], name='phone_brand_price_idx'),
+            models.Index(fields=['condition', 'base_price', 'id'], name='phone_cond_price_idx'),
+            models.Index(fields=['memory', 'base_price', 'id'], name='phone_memory_price_idx'),
+            models.Index(fields=['name', 'id'], name='phone_name_id_idx'),
+            models.Index(fields=['rating_average', 'id'], name='phone_rating_id_idx'),
+            # The admin's stock range filter and the out-of-stock gauge (inventory/metrics.py).
+            models.Index(fields=['stock', 'id'], name='phone_stock_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.condition})"
@@ -81,6 +118,48 @@ class Platform(models.Model):
     def __str__(self):
         return self.name
 
+class PlatformConditionMapping(models.Model):
+    """
+    Maps a general phone condition to a platform's own condition category.
+    Read through the process-local cache in inventory/conditions.py.
+    """
+    platform = models.ForeignKey(Platform, on_delete=models.CASCADE, related_name='condition_mappings')
+    general_condition = models.CharField(max_length=20, choices=Phone.CONDITION_CHOICES)
+    platform_category = models.CharField(
+        max_length=50,
+        help_text="Condition category shown on the platform (e.g., '3 stars (Excellent)')."
+    )
+
+    class Meta:
+        unique_together = ('platform', 'general_condition')
+        ordering = ('platform', 'general_condition')
+
+    def __str__(self):
+        return f"{self.platform.name}: {self.general_condition} -> {self.platform_category}"
+
+def platform_selling_price(base_price, fee_percentage, fixed_fee):
+    """
+    Selling price that covers the base price plus the platform's percentage and fixed fees.
+    """
+    # Ensure base_price is not zero to avoid division by zero or nonsensical calculations
+    if base_price <= 0:
+        return 0.00 # Or raise an error, depending on desired behavior
+
+    # Calculate price considering percentage and fixed fees
+    # We assume the base_price is the cost, and we want to set a selling price
+    # that covers the cost + fees.
+    # Let S = selling_price
+    # S - (S * fee_percentage / 100) - fixed_fee = base_price (assuming we want to break even at base_price)
+    # S * (1 - fee_percentage / 100) = base_price + fixed_fee
+    # S = (base_price + fixed_fee) / (1 - fee_percentage / 100)
+
+    fee_percentage_decimal = fee_percentage / 100
+    if fee_percentage_decimal >= 1: # Prevent division by zero or negative margin
+        return base_price # Cannot make profit, just return base price or mark as unprofitable
+
+    selling_price = (base_price + fixed_fee) / (1 - fee_percentage_decimal)
+    return round(selling_price, 2)
+
 class Listing(models.Model):
     """
     Represents a phone listed on a specific platform.
@@ -113,53 +192,14 @@ class Listing(models.Model):
         Calculates the selling price on the specific platform based on fees.
         This is a simplified calculation for demonstration.
         """
-        # Ensure base_price is not zero to avoid division by zero or nonsensical calculations
-        if self.phone.base_price <= 0:
-            return 0.00 # Or raise an error, depending on desired behavior
-
-        # Calculate price considering percentage and fixed fees
-        # We assume the base_price is the cost, and we want to set a selling price
-        # that covers the cost + fees.
-        # Let S = selling_price
-        # S - (S * fee_percentage / 100) - fixed_fee = base_price (assuming we want to break even at base_price)
-        # S * (1 - fee_percentage / 100) = base_price + fixed_fee
-        # S = (base_price + fixed_fee) / (1 - fee_percentage / 100)
-
-        fee_percentage_decimal = self.platform.fee_percentage / 100
-        if fee_percentage_decimal >= 1: # Prevent division by zero or negative margin
-            return self.phone.base_price # Cannot make profit, just return base price or mark as unprofitable
-
-        selling_price = (self.phone.base_price + self.platform.fixed_fee) / (1 - fee_percentage_decimal)
-        return round(selling_price, 2)
+        return platform_selling_price(self.phone.base_price, self.platform.fee_percentage, self.platform.fixed_fee)
 
     def map_condition_to_platform(self):
         """
         Maps the general phone condition to a platform-specific category.
         """
-        general_condition = self.phone.condition
-        platform_name = self.platform.name
-
-        mapping = {
-            'X': {
-                'New': 'New',
-                'Good': 'Good',
-                'Usable': 'Scrap', # Assuming Usable maps to Scrap on X
-                'Scrap': 'Scrap',
-            },
-            'Y': {
-                'New': '3 stars (Excellent)',
-                'Good': '2 stars (Good)',
-                'Usable': '1 star (Usable)',
-                'Scrap': '1 star (Usable)', # Assuming Scrap maps to Usable on Y
-            },
-            'Z': {
-                'New': 'New',
-                'Good': 'As New', # Assuming Good maps to As New on Z
-                'Usable': 'Good', # Assuming Usable maps to Good on Z
-                'Scrap': 'Good', # Assuming Scrap maps to Good on Z
-            }
-        }
-        return mapping.get(platform_name, {}).get(general_condition, 'Unknown') # Default to Unknown if not found
+        from .conditions import platform_category
+        return platform_category(self.platform_id, self.phone.condition) # 'Unknown' if not mapped
 
     def check_profitability(self):
         """
@@ -193,6 +233,12 @@ class Order(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Date-range backfills of the analytics rollups (see inventory/analytics.py).
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.order_type} order for {self.quantity} x {self.phone.name} at {self.total_price}"
 
@@ -203,7 +249,13 @@ class Query(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
     message = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: queries are written in batches by inventory/querybuffer.py and keep the
+    # time they were submitted.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        # The admin changelist lists the newest first.
+        indexes = [models.Index(fields=['created_at'], name='query_created_idx')]
 
     def __str__(self):
         return f"Query from {self.name} at {self.created_at}"
@@ -232,7 +284,20 @@ class Cart(models.Model):
         return f"Cart for {self.user.username}"
 
     def get_total_price(self):
-        return sum(item.phone.base_price * item.quantity for item in self.items.all())
+        # Reuse prefetched items (see view_cart); otherwise let the database do the sum in one query.
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return sum(item.phone.base_price * item.quantity for item in self.items.all())
+        return self.totals()['total']
+
+    def totals(self):
+        """
+        {'count': units in the cart, 'total': their price}, with one aggregate query.
+        """
+        totals = self.items.aggregate(
+            count=Sum('quantity'),
+            total=Sum(F('phone__base_price') * F('quantity'), output_field=models.DecimalField()),
+        )
+        return {'count': totals['count'] or 0, 'total': totals['total'] or Decimal('0.00')}
 
 class CartItem(models.Model):
     """
@@ -245,13 +310,189 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.phone.name} in cart for {self.cart.user.username}"
 
+class StockReservation(models.Model):
+    """
+    Stock held back for a cart until it is checked out or the hold expires.
+    The reserved units have already been subtracted from Phone.stock.
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    phone = models.ForeignKey(Phone, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField(default=1)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('cart', 'phone')
+
+    def __str__(self):
+        return f"{self.quantity} x {self.phone_id} held for cart {self.cart_id} until {self.expires_at}"
+
 class HomePageImage(models.Model):
     """
     Represents an image on the home page.
     """
     image = models.ImageField(upload_to='home_page_images/')
+    # Resized WebP/AVIF copies of the image, written by inventory/images.py.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     title = models.CharField(max_length=100)
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
         return self.title
+
+class PhoneFacetCount(models.Model):
+    """
+    Materialized number of phones for one combination of facet values.
+    Maintained incrementally by Phone signals; see inventory/facets.py.
+    """
+    brand_id = models.BigIntegerField(null=True, blank=True)
+    condition = models.CharField(max_length=20)
+    memory = models.IntegerField()
+    color = models.CharField(max_length=50, blank=True)
+    camera_quality = models.CharField(max_length=50, blank=True)
+    price_bucket = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('brand_id', 'condition', 'memory', 'color', 'camera_quality', 'price_bucket')
+
+    def __str__(self):
+        return f"{self.count} phones in facet cell {self.pk}"
+
+class OrderRollup(models.Model):
+    """
+    Materialized totals of the completed orders of one period: a day or a month for each
+    brand, condition and order type, or a day over all brands and conditions.
+    Maintained incrementally by Order signals and stock.checkout(); see inventory/analytics.py.
+    """
+    DAY = 'day'
+    MONTH = 'month'
+    DAY_TOTAL = 'day_total'
+    PERIOD_CHOICES = [
+        (DAY, 'Day, by brand and condition'),
+        (MONTH, 'Month, by brand and condition'),
+        (DAY_TOTAL, 'Day, all brands and conditions'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    day = models.DateField(help_text="The day, or the first day of the month.")
+    brand_id = models.BigIntegerField(null=True, blank=True)
+    condition = models.CharField(max_length=20, blank=True)
+    order_type = models.CharField(max_length=4, choices=Order.ORDER_TYPE_CHOICES)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        # period and day lead, so every report is a range scan of this index.
+        unique_together = ('period', 'day', 'brand_id', 'condition', 'order_type')
+
+    def __str__(self):
+        return f"{self.order_type} {self.units} units in {self.period} {self.day} (brand {self.brand_id}, {self.condition})"
+
+class PhoneRecommendation(models.Model):
+    """
+    One entry of a phone's precomputed related-phones list; see inventory/recommendations.py.
+    """
+    phone = models.ForeignKey(Phone, on_delete=models.CASCADE, related_name='recommendations')
+    rank = models.PositiveSmallIntegerField()
+    related = models.ForeignKey(Phone, on_delete=models.CASCADE, related_name='recommended_in')
+    score = models.FloatField(help_text="Distance from the phone; lower is closer.")
+
+    class Meta:
+        # The detail page reads a phone's list as one range scan of this index.
+        unique_together = ('phone', 'rank')
+
+    def __str__(self):
+        return f"#{self.rank} for phone {self.phone_id}: phone {self.related_id}"
+
+class PendingRecommendation(models.Model):
+    """
+    A phone whose related-phones lists need recomputing by rebuild_recommendations.
+    """
+    # Not a foreign key: deleted phones are queued too, so the lists they were in get refilled.
+    phone_id = models.BigIntegerField(unique=True)
+    queued_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Phone {self.phone_id} queued at {self.queued_at}"
+
+class BulkJob(models.Model):
+    """
+    An admin bulk action on the rows of a changelist, worked through in chunks by
+    a Job; see inventory/bulkjobs.py.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    action = models.CharField(max_length=20)
+    model = models.CharField(max_length=100, help_text="app_label.model_name of the rows.")
+    selection = models.JSONField(
+        default=dict,
+        help_text='The selected rows: {"pks": [...]}, or {"changelist": "<admin changelist query string>"}.',
+    )
+    params = models.JSONField(default=dict, blank=True)
+    description = models.CharField(max_length=200)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Primary key of the last row done; the next chunk starts after it.
+    cursor = models.BigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True, blank=True, help_text="Estimated number of rows.")
+    processed = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.description} ({self.status})"
+
+class Job(models.Model):
+    """
+    A task queued for run_workers; see inventory/jobs.py.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Not claimed before this time; failed attempts push it back.
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    worker = models.CharField(max_length=100, blank=True, help_text="host:pid:index of the worker running it.")
+    # Set when claimed and on every progress report; see jobs.requeue_stale().
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    progress = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True, blank=True)
+    message = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, help_text="When the last attempt started.")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for the oldest ready job.
+            models.Index(fields=['status', 'run_after', 'id'], name='job_ready_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
@@ -0,0 +1,177 @@
+# inventory/pagecache.py
+
+"""
+Full-page and fragment caching for the public storefront, invalidated by tags.
+
+A tag ('brand', 'phone', 'review', 'listing') names a kind of data a page shows. Each tag
+has a version token in the cache, and every page or fragment key includes the versions
+of its tags, so bump_tags() (called from model signals, see signals.py) makes every
+dependent entry unreachable at once; the old entries just age out.
+
+Pages opt in with @cache_page_for_anonymous(timeout, tags=...) (via method_decorator on
+class-based views) and are cached by AnonymousPageCacheMiddleware. Only anonymous GETs
+without pending messages are cached. The CSRF tokens in a page (the chatbot form is on
+every page) and the cart badge in the header are stored as placeholders and filled in
+with the visitor's own token and cart count (see cart.py) when the page is served.
+
+Templates cache fragments with the stock {% cache %} tag, varying on the tag versions the
+cache_tags context processor exposes: {% cache 600 brand_grid cache_tags.brand %}.
+"""
+
+import hashlib
+import re
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from . import cart
+
+TAG_KEY = 'tag:{}'
+DEFAULT_PAGE_TIMEOUT = 10 * 60
+CSRF_PLACEHOLDER = b'__csrf_token__'
+CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def tag_versions(tags):
+    """
+    Returns {tag: version token}, creating tokens for tags that have none yet.
+    """
+    keys = {TAG_KEY.format(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {tag: found[key] for key, tag in keys.items()}
+
+
+def bump_tags(*tags):
+    """
+    Invalidates every cached page and fragment that depends on any of tags.
+    """
+    cache.set_many({TAG_KEY.format(tag): uuid.uuid4().hex for tag in tags}, None)
+
+
+class TagVersions:
+    """
+    Lazy {tag: version} mapping for templates; only the tags a template asks for are fetched.
+    """
+
+    def __init__(self):
+        self._versions = {}
+
+    def __getitem__(self, tag):
+        if tag not in self._versions:
+            self._versions.update(tag_versions([tag]))
+        return self._versions[tag]
+
+
+def cache_tags(request):
+    return {'cache_tags': TagVersions()}
+
+
+def cache_page_for_anonymous(timeout=None, tags=()):
+    """
+    Caches the view's full response for anonymous visitors until timeout or until one of tags is bumped.
+    """
+    def decorator(view_func):
+        view_func.page_cache = (timeout, tuple(tags))
+        return view_func
+    return decorator
+
+
+def page_key(request, tags):
+    versions = tag_versions(tags)
+    fingerprint = '|'.join([request.get_full_path()] + [versions[tag] for tag in sorted(tags)])
+    view = request.resolver_match.url_name if request.resolver_match else 'unnamed'
+    return f'page:{view}:' + hashlib.md5(fingerprint.encode()).hexdigest()
+
+
+def is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # Messages are rendered into the page; len() reads them without marking them as seen.
+    return not len(messages.get_messages(request))
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Serves and stores pages of views marked with cache_page_for_anonymous().
+    Must come after the authentication and messages middleware.
+
+    Works in both sync and async stacks; process_view, which reads the session and the
+    user, stays synchronous and is run in a thread by Django under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        entry = self.entry(request, response)
+        if entry is not None:
+            cache.set(*entry)
+            response['X-Page-Cache'] = 'miss'
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        entry = self.entry(request, response)
+        if entry is not None:
+            await cache.aset(*entry)
+            response['X-Page-Cache'] = 'miss'
+        return response
+
+    def entry(self, request, response):
+        """
+        Returns the (key, value, timeout) to store for a freshly rendered page, or None.
+        """
+        key = getattr(request, '_page_cache_key', None)
+        if key is None or not self.is_cacheable_response(response):
+            return None
+        content = CSRF_INPUT.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content)
+        content = cart.strip_badge(content)
+        return key, (content, response.get('Content-Type')), request._page_cache_timeout
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = getattr(view_func, 'page_cache', None)
+        if config is None or not is_cacheable_request(request):
+            return None
+        timeout, tags = config
+        key = page_key(request, tags)
+        cached = cache.get(key)
+        if cached is None:
+            request._page_cache_key = key
+            request._page_cache_timeout = timeout or getattr(settings, 'PAGE_CACHE_TIMEOUT', DEFAULT_PAGE_TIMEOUT)
+            return None
+        content, content_type = cached
+        if CSRF_PLACEHOLDER in content:
+            content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+        if cart.BADGE_PLACEHOLDER in content:
+            content = cart.fill_badge(content, request)
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Page-Cache'] = 'hit'
+        return response
+
+    @staticmethod
+    def is_cacheable_response(response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not response.has_header('Cache-Control')
+        )
@@ -0,0 +1,381 @@
+# inventory/perf.py
+
+"""
+Per-request performance timings and an opt-in profiler for slow requests.
+
+PerfMiddleware times every request and records, along with its URL name: the total
+latency, the number of SQL queries and the time spent running them, and the time spent
+rendering templates. Queries are timed by an execute wrapper installed on every
+connection when it is opened (see signals.py), and templates by the TimedDjangoTemplates
+backend (settings.TEMPLATES). Both add to the timings of the current request, held in a
+context variable, so they work under WSGI and ASGI like the query budget (querybudget.py).
+Queries run while a template renders (lazy querysets) count as SQL, not template time;
+whatever is left of the latency is Python.
+
+The timings of the last PERF_BUFFER_SIZE requests are kept in a ring buffer in this
+process; /ops/perf/ shows percentiles per URL name (see summary()). They are also added
+to the Prometheus metrics shared by all processes (metrics.py).
+
+Profiling is off unless PERF_PROFILE_SAMPLE_RATE is above 0. That fraction of requests
+runs under cProfile (or pyinstrument, with PERF_PROFILER = 'pyinstrument' and the package
+installed), one request at a time per process, and the profiles of those that took
+PERF_PROFILE_THRESHOLD seconds or more are written to PERF_PROFILE_DIR: pstats .prof
+files for snakeviz or flameprof (flameprof x.prof > x.svg), or speedscope JSON from
+pyinstrument. Under ASGI, cProfile only sees the event loop thread, not the threads the
+async ORM runs its queries in.
+"""
+
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from . import metrics
+from .benchmarks import percentile
+
+try:
+    import pyinstrument
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    pyinstrument = None
+
+DEFAULT_BUFFER_SIZE = 5000
+DEFAULT_PROFILE_THRESHOLD = 0.5
+DEFAULT_PROFILE_KEEP = 100
+PROFILERS = ('cprofile', 'pyinstrument')
+
+_current = ContextVar('perf_timings', default=None)
+_lock = threading.Lock()
+_buffer = None
+# Held while a request is being profiled; sampled requests that find it taken aren't profiled.
+_profiling = threading.Lock()
+
+
+class Timings:
+    __slots__ = (
+        'view', 'method', 'status', 'started', 'seconds', 'queries', 'sql_seconds',
+        'template_seconds', 'template_sql_seconds', 'rendering',
+    )
+
+    def __init__(self, method):
+        self.view = None
+        self.method = method
+        self.status = None
+        self.started = time.time()
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_sql_seconds = 0.0
+        self.rendering = 0
+
+    @property
+    def python_seconds(self):
+        return max(0.0, self.seconds - self.sql_seconds - self.template_seconds)
+
+    def as_dict(self):
+        return {
+            'view': self.view,
+            'method': self.method,
+            'status': self.status,
+            'total_ms': self.seconds * 1000,
+            'queries': self.queries,
+            'sql_ms': self.sql_seconds * 1000,
+            'template_ms': self.template_seconds * 1000,
+            'python_ms': self.python_seconds * 1000,
+        }
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding to the timings of the request being served, if any.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        timings.queries += 1
+        timings.sql_seconds += elapsed
+        if timings.rendering:
+            timings.template_sql_seconds += elapsed
+
+
+def install(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        timings.rendering += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.rendering -= 1
+            # Templates rendered from within a template are part of the outer render.
+            if not timings.rendering:
+                timings.template_seconds += time.perf_counter() - start - timings.template_sql_seconds
+                timings.template_sql_seconds = 0.0
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each render for the request being served.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def buffer_size():
+    return getattr(settings, 'PERF_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)
+
+
+def record(timings):
+    global _buffer
+    with _lock:
+        if _buffer is None:
+            _buffer = deque(maxlen=buffer_size())
+        _buffer.append(timings)
+
+
+def recent():
+    """
+    The buffered timings, oldest first.
+    """
+    with _lock:
+        return list(_buffer or ())
+
+
+def reset():
+    """
+    Empties the buffer; it is recreated with the current PERF_BUFFER_SIZE.
+    """
+    global _buffer
+    with _lock:
+        _buffer = None
+
+
+def summary(timings=None):
+    """
+    One dict per URL name, the views the most time went into first: requests, errors
+    (status 500 or above), latency percentiles and the mean SQL, template and Python time
+    in milliseconds, and the mean and maximum number of queries.
+    """
+    by_view = defaultdict(list)
+    for entry in recent() if timings is None else timings:
+        by_view[entry.view].append(entry)
+    rows = []
+    for view, entries in by_view.items():
+        latencies = [entry.seconds for entry in entries]
+        queries = [entry.queries for entry in entries]
+        count = len(entries)
+        rows.append({
+            'view': view,
+            'requests': count,
+            'errors': sum(1 for entry in entries if entry.status >= 500),
+            'total_ms': sum(latencies) * 1000,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': max(latencies) * 1000,
+            'sql_ms': sum(entry.sql_seconds for entry in entries) / count * 1000,
+            'template_ms': sum(entry.template_seconds for entry in entries) / count * 1000,
+            'python_ms': sum(entry.python_seconds for entry in entries) / count * 1000,
+            'queries_avg': sum(queries) / count,
+            'queries_max': max(queries),
+        })
+    rows.sort(key=lambda row: -row['total_ms'])
+    return rows
+
+
+def slowest(count=20):
+    """
+    as_dict() of the count slowest buffered requests, slowest first.
+    """
+    return [entry.as_dict() for entry in sorted(recent(), key=lambda entry: -entry.seconds)[:count]]
+
+
+def profiler_name():
+    name = getattr(settings, 'PERF_PROFILER', 'cprofile')
+    if name not in PROFILERS:
+        raise ImproperlyConfigured(f"PERF_PROFILER must be one of {', '.join(PROFILERS)}.")
+    if name == 'pyinstrument' and pyinstrument is None:
+        raise ImproperlyConfigured("PERF_PROFILER = 'pyinstrument' needs the pyinstrument package.")
+    return name
+
+
+def sample_rate():
+    return getattr(settings, 'PERF_PROFILE_SAMPLE_RATE', 0)
+
+
+def profile_threshold():
+    return getattr(settings, 'PERF_PROFILE_THRESHOLD', DEFAULT_PROFILE_THRESHOLD)
+
+
+def start_profile():
+    """
+    Starts profiling the current request if it is sampled and no other request in this
+    process is being profiled; returns the profiler, or None.
+    """
+    rate = sample_rate()
+    if not rate or random.random() >= rate or not _profiling.acquire(blocking=False):
+        return None
+    try:
+        if profiler_name() == 'pyinstrument':
+            profiler = pyinstrument.Profiler(async_mode='enabled')
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+    except BaseException:
+        _profiling.release()
+        raise
+    return profiler
+
+
+def stop_profile(profiler):
+    try:
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+    finally:
+        _profiling.release()
+
+
+def profile_dir():
+    return getattr(settings, 'PERF_PROFILE_DIR', None)
+
+
+def save_profile(profiler, timings):
+    """
+    Writes the profile of a request that took PERF_PROFILE_THRESHOLD seconds or more and
+    removes the oldest profiles beyond PERF_PROFILE_KEEP. Returns the path, or None.
+    """
+    directory = profile_dir()
+    if not directory or timings.seconds < profile_threshold():
+        return None
+    os.makedirs(directory, exist_ok=True)
+    started = datetime.fromtimestamp(timings.started, timezone.utc)
+    view = (timings.view or 'unresolved').replace(':', '-')
+    name = f'{started:%Y%m%dT%H%M%S.%f}-{view}-{timings.seconds * 1000:.0f}ms-{os.getpid()}'
+    if isinstance(profiler, cProfile.Profile):
+        path = os.path.join(directory, name + '.prof')
+        profiler.dump_stats(path)
+    else:
+        path = os.path.join(directory, name + '.speedscope.json')
+        with open(path, 'w') as f:
+            f.write(profiler.output(SpeedscopeRenderer()))
+    for old in saved_profiles()[getattr(settings, 'PERF_PROFILE_KEEP', DEFAULT_PROFILE_KEEP):]:
+        try:
+            os.remove(os.path.join(directory, old['name']))
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def saved_profiles():
+    """
+    [{'name', 'size', 'modified'}] of the profiles in PERF_PROFILE_DIR, newest first.
+    """
+    directory = profile_dir()
+    if not directory or not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(('.prof', '.speedscope.json')):
+            stat = entry.stat()
+            profiles.append({
+                'name': entry.name,
+                'size': stat.st_size,
+                'modified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            })
+    profiles.sort(key=lambda profile: profile['name'], reverse=True)
+    return profiles
+
+
+class PerfMiddleware:
+    """
+    Records the timings of every request and profiles a sample of them. Goes first in
+    MIDDLEWARE so the latency includes the other middleware. Works in both sync and
+    async stacks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        profiler_name()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not buffer_size() and not metrics.metrics_dir():
+            return self.get_response(request)
+        timings = Timings(request.method)
+        token = _current.set(timings)
+        profiler = start_profile()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings.seconds = time.perf_counter() - start
+            if profiler is not None:
+                stop_profile(profiler)
+            _current.reset(token)
+        self.finish(request, response, timings, profiler)
+        return response
+
+    async def __acall__(self, request):
+        if not buffer_size() and not metrics.metrics_dir():
+            return await self.get_response(request)
+        timings = Timings(request.method)
+        token = _current.set(timings)
+        profiler = start_profile()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings.seconds = time.perf_counter() - start
+            if profiler is not None:
+                stop_profile(profiler)
+            _current.reset(token)
+        self.finish(request, response, timings, profiler)
+        return response
+
+    def finish(self, request, response, timings, profiler):
+        match = request.resolver_match
+        timings.view = match.view_name if match else ''
+        timings.status = response.status_code
+        record(timings)
+        metrics.observe_request(timings)
+        if profiler is not None:
+            save_profile(profiler, timings)
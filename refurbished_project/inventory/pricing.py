@@ -0,0 +1,352 @@
+# inventory/pricing.py
+
+"""
+Vectorized pricing simulator for platform fee scenarios.
+
+Listing.calculate_platform_price() prices one phone on one platform with Decimal
+arithmetic. simulate() answers "what if" questions about the whole phone x platform
+matrix at once: given hypothetical fee_percentage / fixed_fee values for some platforms
+and a target margin, it evaluates every cell with NumPy, a chunk of phones at a time, and
+reports per platform:
+
+- the current prices (those list_phones() sets under today's fees) and what they would
+  earn under the scenario's fees, i.e. what happens if fees change and nothing is repriced;
+- the prices the scenario calls for, and what they earn.
+
+Money is held as integer cents and fees as integer hundredths of a percent, so the whole
+computation is exact integer arithmetic: the selling price
+
+    S = (base_price + fixed_fee) / (1 - fee_percentage/100 - target_margin/100)
+
+is an integer division rounded half to even, as round(Decimal, 2) does, and every total is
+an exact int64 sum. Phones with base_price <= 0 and platforms whose fees (plus margin)
+reach 100% are handled as in platform_selling_price(). As a cross-check, the cells of a
+random sample of phones are also priced with platform_selling_price()'s Decimal formula;
+any difference is reported as a mismatch.
+
+Profit per unit is S - (S * fee_percentage/100, rounded to the cent) - fixed_fee - base_price;
+totals weight it by the phone's stock.
+"""
+
+import random
+import time
+from decimal import Decimal
+
+from django.db import connection
+
+from .models import Phone, Platform, platform_selling_price
+
+try:
+    import numpy as np
+except ImportError:  # the simulator is unavailable without it; nothing else needs NumPy
+    np = None
+
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_VERIFY = 200
+# fee_percentage and target margins are given to 2 decimal places: 100% = 10000.
+WHOLE = 10000
+CENT = Decimal('0.01')
+
+
+class PricingUnavailable(Exception):
+    """
+    Raised when the simulator is used without NumPy installed.
+    """
+
+
+class Terms:
+    """
+    A platform's fee terms, current or hypothetical.
+    """
+
+    def __init__(self, platform_id, name, fee_percentage, fixed_fee):
+        self.platform_id = platform_id
+        self.name = name
+        self.fee_percentage = Decimal(fee_percentage).quantize(CENT)
+        self.fixed_fee = Decimal(fixed_fee).quantize(CENT)
+
+    @classmethod
+    def of(cls, platform):
+        return cls(platform.pk, platform.name, platform.fee_percentage, platform.fixed_fee)
+
+    def replace(self, fee_percentage=None, fixed_fee=None):
+        return Terms(
+            self.platform_id,
+            self.name,
+            self.fee_percentage if fee_percentage is None else fee_percentage,
+            self.fixed_fee if fixed_fee is None else fixed_fee,
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Terms) and (self.platform_id, self.fee_percentage, self.fixed_fee) == (
+            other.platform_id, other.fee_percentage, other.fixed_fee
+        )
+
+    def __repr__(self):
+        return f'<Terms {self.name}: {self.fee_percentage}% + {self.fixed_fee}>'
+
+
+class PhoneArrays:
+    """
+    The columns of the phone table the simulator needs, as NumPy arrays (prices in cents).
+    """
+
+    def __init__(self, ids, base_cents, stock):
+        self.ids = ids
+        self.base_cents = base_cents
+        self.stock = stock
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls):
+        """
+        Reads every phone with one query, converting prices to cents in SQL.
+        """
+        _require_numpy()
+        table = Phone._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id, CAST(ROUND(base_price * 100) AS INTEGER), stock FROM {table} ORDER BY id')
+            rows = cursor.fetchall()
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        return cls(columns[:, 0], columns[:, 1].copy(), columns[:, 2].copy())
+
+    @classmethod
+    def synthetic(cls, count, seed=0):
+        """
+        count made-up phones (base prices $50-$1500, stock 0-20), for benchmarks.
+        """
+        _require_numpy()
+        rng = np.random.default_rng(seed)
+        return cls(
+            np.arange(1, count + 1, dtype=np.int64),
+            rng.integers(5000, 150001, size=count, dtype=np.int64),
+            rng.integers(0, 21, size=count, dtype=np.int64),
+        )
+
+
+def _require_numpy():
+    if np is None:
+        raise PricingUnavailable('The pricing simulator needs NumPy (pip install numpy).')
+
+
+def cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def hundredths(percentage):
+    return int((Decimal(percentage) * 100).to_integral_value())
+
+
+def divide_half_even(numerator, denominator):
+    """
+    numerator / denominator rounded half to even, elementwise, for non-negative int64 arrays.
+    """
+    quotient, remainder = np.divmod(numerator, denominator)
+    twice = 2 * remainder
+    return quotient + ((twice > denominator) | ((twice == denominator) & (quotient % 2 == 1)))
+
+
+def selling_prices(base_cents, fee, fixed_cents, margin=0):
+    """
+    Selling prices in cents for a column of base prices (n x 1) and rows of platform fees in
+    hundredths of a percent and fixed fees in cents (1 x k): an n x k matrix.
+    """
+    denominator = WHOLE - fee - margin
+    priceable = denominator > 0
+    prices = divide_half_even((base_cents + fixed_cents) * WHOLE, np.where(priceable, denominator, 1))
+    # As platform_selling_price(): fees of 100% or more leave the base price, and a
+    # non-positive base price gives 0.
+    prices = np.where(priceable, prices, base_cents)
+    return np.where(base_cents > 0, prices, 0)
+
+
+def unit_profits(prices, base_cents, fee, fixed_cents):
+    """
+    Profit per unit, in cents, of selling at prices under the given fees.
+    """
+    return prices - divide_half_even(prices * fee, WHOLE) - fixed_cents - base_cents
+
+
+def reference_price(base_price, fee_percentage, fixed_fee, target_margin=Decimal(0)):
+    """
+    The Decimal price the vectorized path must reproduce.
+    """
+    if not target_margin:
+        return Decimal(platform_selling_price(base_price, fee_percentage, fixed_fee)).quantize(CENT)
+    if base_price <= 0:
+        return Decimal('0.00')
+    remaining = 1 - fee_percentage / 100 - target_margin / 100
+    if remaining <= 0:
+        return base_price
+    return round((base_price + fixed_fee) / remaining, 2)
+
+
+class Simulation:
+    """
+    The outcome of simulate(): per-platform totals plus counters for the run.
+    """
+
+    def __init__(self, current, scenario, target_margin):
+        self.current = current
+        self.scenario = scenario
+        self.target_margin = target_margin
+        self.phones = 0
+        self.platforms = []
+        self.checked = 0
+        self.mismatches = []
+        self.seconds = 0.0
+
+    @property
+    def cells(self):
+        return self.phones * len(self.current)
+
+    @property
+    def verified(self):
+        return self.checked > 0 and not self.mismatches
+
+    def as_dict(self):
+        return {
+            'phones': self.phones,
+            'cells': self.cells,
+            'target_margin': self.target_margin,
+            'platforms': self.platforms,
+            'checked': self.checked,
+            'mismatches': len(self.mismatches),
+            'seconds': round(self.seconds, 3),
+        }
+
+
+def _money(total_cents):
+    return (Decimal(int(total_cents)) / 100).quantize(CENT)
+
+
+def simulate(scenario=None, target_margin=Decimal(0), phones=None, current=None,
+             chunk_size=DEFAULT_CHUNK_SIZE, verify=DEFAULT_VERIFY, seed=0):
+    """
+    Evaluates the phone x platform matrix under current and scenario terms.
+
+    current is a list of Terms (default: every Platform), scenario a list of the same
+    platforms with hypothetical terms (default: unchanged), target_margin a percentage of
+    the selling price, phones a PhoneArrays (default: every Phone). verify is the number
+    of phones whose cells are re-priced with Decimal arithmetic.
+    """
+    _require_numpy()
+    started = time.perf_counter()
+    if current is None:
+        current = [Terms.of(platform) for platform in Platform.objects.order_by('name')]
+    scenario = scenario or current
+    if [terms.platform_id for terms in scenario] != [terms.platform_id for terms in current]:
+        raise ValueError('The scenario must give terms for the same platforms, in the same order.')
+    target_margin = Decimal(target_margin).quantize(CENT)
+    if not 0 <= target_margin < 100:
+        raise ValueError('The target margin must be at least 0% and below 100%.')
+    if phones is None:
+        phones = PhoneArrays.load()
+
+    result = Simulation(current, scenario, target_margin)
+    result.phones = len(phones)
+    margin = hundredths(target_margin)
+    fee_now = np.array([[hundredths(terms.fee_percentage) for terms in current]], dtype=np.int64)
+    fixed_now = np.array([[cents(terms.fixed_fee) for terms in current]], dtype=np.int64)
+    fee_new = np.array([[hundredths(terms.fee_percentage) for terms in scenario]], dtype=np.int64)
+    fixed_new = np.array([[cents(terms.fixed_fee) for terms in scenario]], dtype=np.int64)
+
+    width = len(current)
+    sums = {name: np.zeros(width, dtype=np.int64) for name in (
+        'priced', 'current_price', 'current_profit', 'current_losing', 'new_price', 'new_profit', 'new_losing',
+    )}
+    for offset in range(0, len(phones), chunk_size):
+        base = phones.base_cents[offset:offset + chunk_size, None]
+        stock = phones.stock[offset:offset + chunk_size, None]
+        priced = base > 0
+        current_prices = selling_prices(base, fee_now, fixed_now)
+        new_prices = selling_prices(base, fee_new, fixed_new, margin)
+        current_profits = unit_profits(current_prices, base, fee_new, fixed_new)
+        new_profits = unit_profits(new_prices, base, fee_new, fixed_new)
+        sums['priced'] += np.broadcast_to(priced, current_prices.shape).sum(axis=0)
+        sums['current_price'] += current_prices.sum(axis=0)
+        sums['current_profit'] += (current_profits * stock).sum(axis=0)
+        sums['current_losing'] += ((current_profits < 0) & priced).sum(axis=0)
+        sums['new_price'] += new_prices.sum(axis=0)
+        sums['new_profit'] += (new_profits * stock).sum(axis=0)
+        sums['new_losing'] += ((new_profits < 0) & priced).sum(axis=0)
+
+    for index, (now, new) in enumerate(zip(current, scenario)):
+        priced = int(sums['priced'][index])
+        current_mean = _money(sums['current_price'][index] // priced) if priced else Decimal('0.00')
+        new_mean = _money(sums['new_price'][index] // priced) if priced else Decimal('0.00')
+        result.platforms.append({
+            'platform_id': now.platform_id,
+            'name': now.name,
+            'current_terms': (now.fee_percentage, now.fixed_fee),
+            'scenario_terms': (new.fee_percentage, new.fixed_fee),
+            'changed': now != new,
+            'priced': priced,
+            'current_mean_price': current_mean,
+            'current_stock_profit': _money(sums['current_profit'][index]),
+            'current_losing': int(sums['current_losing'][index]),
+            'scenario_mean_price': new_mean,
+            'scenario_stock_profit': _money(sums['new_profit'][index]),
+            'scenario_losing': int(sums['new_losing'][index]),
+            'mean_price_change': (
+                round((new_mean - current_mean) / current_mean * 100, 2) if current_mean else None
+            ),
+        })
+
+    _verify(result, phones, fee_new, fixed_new, margin, verify, seed)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def _verify(result, phones, fee, fixed, margin, sample_size, seed):
+    """
+    Re-prices the cells of sample_size random phones with Decimal arithmetic.
+    """
+    if not sample_size or not len(phones):
+        return
+    rows = sorted(random.Random(seed).sample(range(len(phones)), min(sample_size, len(phones))))
+    base = phones.base_cents[rows, None]
+    prices = selling_prices(base, fee, fixed, margin)
+    for row, (phone_cents,), phone_prices in zip(rows, base.tolist(), prices.tolist()):
+        base_price = _money(phone_cents)
+        for terms, price in zip(result.scenario, phone_prices):
+            expected = reference_price(base_price, terms.fee_percentage, terms.fixed_fee, result.target_margin)
+            result.checked += 1
+            if _money(price) != expected:
+                result.mismatches.append((int(phones.ids[row]), terms.platform_id, _money(price), expected))
+
+
+def _decimal(value, name):
+    try:
+        number = Decimal(value).quantize(CENT)
+    except (ArithmeticError, ValueError):
+        raise ValueError(f'{name} must be a number, not {value!r}.')
+    # Decimal('NaN') survives quantize() and would make the range checks raise InvalidOperation.
+    if not number.is_finite():
+        raise ValueError(f'{name} must be a number, not {value!r}.')
+    return number
+
+
+def parse_scenario(params, current):
+    """
+    Reads a scenario from params: fee_<platform id> and fixed_<platform id> override a
+    platform's fee_percentage and fixed_fee, margin is the target margin (default 0).
+    Returns (scenario, target_margin); raises ValueError for malformed or out-of-range values.
+    """
+    scenario = []
+    for terms in current:
+        fee = params.get(f'fee_{terms.platform_id}') or None
+        fixed = params.get(f'fixed_{terms.platform_id}') or None
+        fee = None if fee is None else _decimal(fee, f'The fee of {terms.name}')
+        fixed = None if fixed is None else _decimal(fixed, f'The fixed fee of {terms.name}')
+        if fee is not None and not 0 <= fee <= 100:
+            raise ValueError(f'The fee of {terms.name} must be between 0% and 100%.')
+        if fixed is not None and fixed < 0:
+            raise ValueError(f'The fixed fee of {terms.name} can\'t be negative.')
+        scenario.append(terms.replace(fee, fixed))
+    margin = _decimal(params.get('margin') or 0, 'The target margin')
+    if not 0 <= margin < 100:
+        raise ValueError('The target margin must be at least 0% and below 100%.')
+    return scenario, margin
@@ -0,0 +1,111 @@
+# inventory/querybudget.py
+
+"""
+Per-request SQL query budgets.
+
+QueryBudgetMiddleware counts every query a request runs. A view opts into a budget with
+@query_budget(n) (or method_decorator(query_budget(n), name='dispatch') on class-based
+views); other views get settings.QUERY_BUDGET_DEFAULT. Going over budget logs a warning,
+or raises QueryBudgetExceeded when settings.QUERY_BUDGET_RAISE is on, as it is in the tests.
+
+Queries are counted by an execute wrapper installed on every connection when it is opened
+(see signals.py), which adds to the counter of the current request, held in a context
+variable. Async views run their queries in other threads (the async ORM goes through
+sync_to_async), and context variables follow them there, so the same count works under
+WSGI and ASGI.
+"""
+
+import logging
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_counter = ContextVar('query_budget_counter', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a request runs more queries than its view allows.
+    """
+
+
+def query_budget(max_queries):
+    """
+    Declares the maximum number of queries a single request to the view may run.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+
+def count_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding to the counter of the request being served, if any.
+    """
+    counter = _counter.get()
+    if counter is not None:
+        counter.count += 1
+    return execute(sql, params, many, context)
+
+
+def install(connection):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        request.query_budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        counter = QueryCounter()
+        token = _counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            _counter.reset(token)
+        self.check(request, counter)
+        return response
+
+    async def __acall__(self, request):
+        request.query_budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        counter = QueryCounter()
+        token = _counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _counter.reset(token)
+        self.check(request, counter)
+        return response
+
+    def check(self, request, counter):
+        budget = request.query_budget
+        if budget is not None and counter.count > budget:
+            view = getattr(request.resolver_match, 'view_name', request.path)
+            message = f'{view} ran {counter.count} queries (budget {budget}) for {request.path}'
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = getattr(view_func, 'query_budget', None)
+        if budget is not None:
+            request.query_budget = budget
@@ -0,0 +1,351 @@
+# inventory/querybuffer.py
+
+"""
+Write-behind buffer for customer queries (the chatbot widget and the sell-a-phone form).
+
+submit() queues the query in memory and returns at once. A background thread writes the
+queue to the Query table with bulk_create() in one short transaction every
+QUERY_BUFFER_FLUSH_INTERVAL seconds, or as soon as QUERY_BUFFER_BATCH_SIZE queries are
+waiting, so a burst of submissions takes SQLite's writer lock a few times instead of
+once per request. At most QUERY_BUFFER_SIZE queries may be waiting; past that submit()
+raises BufferFull and the views answer 503 with a Retry-After header. close() (run at
+interpreter exit) stops the thread and writes whatever is left.
+
+Queries are validated (full_clean) by submit(), which raises ValidationError for one the
+table can't take, so an invalid query never reaches a batch. Should a batch still fail to
+insert (spooled by an older version, say), its queries are written one at a time and any
+that fails on its own is logged and dropped, so one bad row can't hold up the rest forever.
+Errors that aren't about the rows (a locked or unreachable database) leave the batch queued.
+
+When QUERY_BUFFER_SPOOL names a directory, each process also appends its submissions as
+JSON lines to <spool>/<pid>.jsonl before accepting them. A flush renames that file to
+<pid>-<token>.batch and deletes it only once its rows are committed, so queries survive a
+crash of the process (though not of the machine: the file isn't fsynced). The next buffer
+started in any process, or the drain_query_spool command, claims the files of processes
+that are no longer running and writes them. A crash between a commit and the delete
+writes that batch twice.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, OperationalError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metrics
+from .models import Query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZE = 1000
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 0.5
+# Seconds clients are asked to wait when the buffer is full.
+RETRY_AFTER = 5
+BUSY_MESSAGE = "We're receiving a lot of messages right now. Please try again in a few seconds."
+
+_state = {'buffer': None}
+_lock = threading.Lock()
+
+
+class BufferFull(Exception):
+    """
+    Raised by submit() when the buffer already holds QUERY_BUFFER_SIZE unwritten queries.
+    """
+
+
+def _record(query):
+    return {
+        'name': query.name,
+        'email': query.email,
+        'message': query.message,
+        'created_at': query.created_at or timezone.now(),
+    }
+
+
+def _encode(record):
+    return json.dumps(dict(record, created_at=record['created_at'].isoformat())) + '\n'
+
+
+def _decode(line):
+    record = json.loads(line)
+    record['created_at'] = parse_datetime(record['created_at'])
+    return record
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Batch:
+    """
+    Queries taken off the buffer for one write, and the spool file that holds them.
+    """
+
+    def __init__(self, records, path=None):
+        self.records = records
+        self.path = path
+
+    def __len__(self):
+        return len(self.records)
+
+
+class QueryBuffer:
+    """
+    A bounded write-behind queue of Query rows. With flush_interval=None no thread is
+    started and nothing is written until flush() or close() is called.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, spool=None):
+        self.size = size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.written = 0
+        self.rejected = 0
+        self.dropped = 0
+        self._pending = []
+        # Batches taken off the queue but not yet committed, oldest first.
+        self._unwritten = []
+        # Pending plus unwritten queries: what the size limit applies to.
+        self._waiting = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        if spool:
+            os.makedirs(spool, exist_ok=True)
+            self._unwritten = self.recover()
+            self._waiting = sum(len(batch) for batch in self._unwritten)
+
+    def __len__(self):
+        return self._waiting
+
+    def submit(self, query):
+        """
+        Queues an unsaved Query to be written. Raises ValidationError for a query that can't
+        be saved and BufferFull when the buffer is full.
+        """
+        query.full_clean()
+        record = _record(query)
+        with self._lock:
+            if self._waiting >= self.size:
+                self.rejected += 1
+                raise BufferFull
+            if self.spool:
+                if self._file is None:
+                    self._file = open(self._spool_path(), 'a', encoding='utf-8')
+                self._file.write(_encode(record))
+                self._file.flush()
+            self._pending.append(record)
+            self._waiting += 1
+            batch_ready = len(self._pending) >= self.batch_size
+        self._start()
+        if batch_ready:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Writes every waiting query on the calling thread and returns how many were written.
+        A batch that fails to write for a reason other than its rows stays queued (and
+        spooled) for the next flush.
+        """
+        written = 0
+        with self._flush_lock:
+            batch = self._take()
+            if batch is not None:
+                self._unwritten.append(batch)
+            while self._unwritten:
+                batch = self._unwritten[0]
+                written += self._write(batch)
+                self._unwritten.pop(0)
+                with self._lock:
+                    self._waiting -= len(batch)
+        self.written += written
+        return written
+
+    def close(self):
+        """
+        Stops the writer thread and writes whatever is still waiting.
+        """
+        self._stopped = True
+        self._wakeup.set()
+        atexit.unregister(self.close)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        try:
+            self.flush()
+        except Exception:
+            if self.spool:
+                logger.exception("Couldn't write %d buffered queries; they remain in %s.", len(self), self.spool)
+            else:
+                logger.exception("Couldn't write %d buffered queries; they are lost.", len(self))
+
+    def recover(self):
+        """
+        Claims the spool files of processes that are no longer running (or that had this
+        process's pid before it) and returns them as batches to be written.
+        """
+        batches = []
+        for filename in sorted(os.listdir(self.spool)):
+            stem, ext = os.path.splitext(filename)
+            if ext not in ('.jsonl', '.batch'):
+                continue
+            try:
+                pid = int(stem.split('-', 1)[0])
+            except ValueError:
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            path = self._batch_path()
+            try:
+                os.replace(os.path.join(self.spool, filename), path)
+            except FileNotFoundError:
+                # Another process claimed it first.
+                continue
+            records = []
+            with open(path, encoding='utf-8') as spooled:
+                for line in spooled:
+                    try:
+                        records.append(_decode(line))
+                    except (ValueError, KeyError, TypeError):
+                        # The last line of a process that died mid-write.
+                        logger.warning('Skipping an unreadable line in %s.', path)
+            batches.append(Batch(records, path))
+        return batches
+
+    def _spool_path(self):
+        return os.path.join(self.spool, f'{os.getpid()}.jsonl')
+
+    def _batch_path(self):
+        return os.path.join(self.spool, f'{os.getpid()}-{uuid.uuid4().hex}.batch')
+
+    def _take(self):
+        with self._lock:
+            if not self._pending:
+                return None
+            records, self._pending = self._pending, []
+            path = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                path = self._batch_path()
+                os.replace(self._spool_path(), path)
+        return Batch(records, path)
+
+    def _write(self, batch):
+        """
+        Inserts the batch and removes its spool file; returns how many queries were written.
+        """
+        try:
+            with transaction.atomic():
+                Query.objects.bulk_create([Query(**record) for record in batch.records], batch_size=self.batch_size)
+            written = len(batch)
+        except OperationalError:
+            raise
+        except (DatabaseError, TypeError, ValueError):
+            written = self._write_one_by_one(batch)
+        if batch.path:
+            os.remove(batch.path)
+        return written
+
+    def _write_one_by_one(self, batch):
+        # All or nothing still: a locked database mid-way leaves the whole batch for the next flush.
+        written = 0
+        with transaction.atomic():
+            for record in batch.records:
+                try:
+                    with transaction.atomic():
+                        query = Query(**record)
+                        query.full_clean()
+                        query.save()
+                except OperationalError:
+                    raise
+                except (DatabaseError, TypeError, ValueError, ValidationError) as exc:
+                    logger.error('Dropping a buffered query that cannot be written (%s): %r', exc, record)
+                    self.dropped += 1
+                else:
+                    written += 1
+        return written
+
+    def _start(self):
+        if self._thread is not None or self._stopped or self.flush_interval is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='query-buffer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing buffered queries failed; retrying in %ss.', self.flush_interval)
+                # Start the next attempt on a fresh connection.
+                connection.close()
+        connection.close()
+
+
+def get_buffer():
+    """
+    The process's QueryBuffer, configured from the QUERY_BUFFER_* settings.
+    """
+    buffer = _state['buffer']
+    if buffer is None:
+        with _lock:
+            buffer = _state['buffer']
+            if buffer is None:
+                buffer = _state['buffer'] = QueryBuffer(
+                    size=getattr(settings, 'QUERY_BUFFER_SIZE', DEFAULT_SIZE),
+                    batch_size=getattr(settings, 'QUERY_BUFFER_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                    flush_interval=getattr(settings, 'QUERY_BUFFER_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                    spool=getattr(settings, 'QUERY_BUFFER_SPOOL', None),
+                )
+    return buffer
+
+
+def submit(query):
+    try:
+        get_buffer().submit(query)
+    except ValidationError:
+        metrics.QUERY_SUBMISSIONS.inc('invalid')
+        raise
+    except BufferFull:
+        metrics.QUERY_SUBMISSIONS.inc('rejected')
+        raise
+    metrics.QUERY_SUBMISSIONS.inc('accepted')
+
+
+def flush():
+    return get_buffer().flush()
+
+
+def reset():
+    """
+    Closes the process's buffer, writing what it holds; the next get_buffer() starts a new one.
+    """
+    with _lock:
+        buffer, _state['buffer'] = _state['buffer'], None
+    if buffer is not None:
+        buffer.close()
@@ -0,0 +1,87 @@
+# inventory/ratings.py
+
+"""
+Review aggregates stored on Phone.
+
+Phone.rating_sum and rating_count change by the review's rating and by one whenever a
+review is added, removed or re-rated (see the Review signals in signals.py), using a
+single conditional UPDATE so concurrent reviews can't lose each other's increments.
+rating_average is recomputed in the same statement from the pre-update values, so the
+three columns always agree. reconcile() recomputes everything from the Review table.
+"""
+
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from . import facets
+from .models import Phone, Review
+
+
+def adjust(phone_id, rating_delta, count_delta):
+    new_sum = F('rating_sum') + rating_delta
+    new_count = F('rating_count') + count_delta
+    Phone.objects.filter(pk=phone_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        rating_average=Case(
+            When(rating_count__gt=-count_delta, then=Cast(new_sum, FloatField()) / new_count),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    )
+    # Facet counts filtered by min_rating depend on the average.
+    facets.bump_version()
+
+
+def add(review):
+    adjust(review.phone_id, review.rating, 1)
+
+
+def remove(review):
+    adjust(review.phone_id, -review.rating, -1)
+
+
+def _actual_sum():
+    return Coalesce(
+        Subquery(
+            Review.objects.filter(phone=OuterRef('pk')).order_by().values('phone').annotate(total=Sum('rating')).values('total')
+        ),
+        0,
+    )
+
+
+def _actual_count():
+    return Coalesce(
+        Subquery(
+            Review.objects.filter(phone=OuterRef('pk')).order_by().values('phone').annotate(total=Count('id')).values('total')
+        ),
+        0,
+    )
+
+
+def reconcile(batch_size=1000, dry_run=False):
+    """
+    Recomputes the aggregates of every phone whose stored values disagree with its reviews.
+    Returns how many phones were (or, with dry_run, would be) corrected.
+    """
+    drifted = list(
+        Phone.objects.annotate(actual_sum=_actual_sum(), actual_count=_actual_count())
+        .filter(~Q(rating_sum=F('actual_sum')) | ~Q(rating_count=F('actual_count')))
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    if dry_run:
+        return len(drifted)
+    for start in range(0, len(drifted), batch_size):
+        batch = drifted[start:start + batch_size]
+        Phone.objects.filter(pk__in=batch).update(rating_sum=_actual_sum(), rating_count=_actual_count())
+        Phone.objects.filter(pk__in=batch).update(
+            rating_average=Case(
+                When(rating_count__gt=0, then=Cast(F('rating_sum'), FloatField()) / F('rating_count')),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        )
+    if drifted:
+        facets.bump_version()
+    return len(drifted)
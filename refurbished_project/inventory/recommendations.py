@@ -0,0 +1,329 @@
+# inventory/recommendations.py
+
+"""
+Related-phone recommendations.
+
+Each phone gets a precomputed list of its RELATED_PHONES nearest neighbours, stored as
+PhoneRecommendation rows (phone, rank, related phone, score). The detail page reads them
+with one query on the unique (phone, rank) index, joined to the related phones.
+
+The distance between two phones adds up weighted differences of their features:
+
+- brand and color: WEIGHTS['brand'] / WEIGHTS['color'] if they differ;
+- price: the difference of the log prices, so $100 vs $120 is as far apart as $1000 vs $1200;
+- memory and camera megapixels: the difference of their log2 (a step of 128 -> 256 GB is 1);
+  a phone without a camera rating is WEIGHTS['camera'] away from every other;
+- condition: the number of steps between them (New, Good, Usable, Scrap).
+
+Two bonuses are subtracted: co-purchases (log(1 + the number of carts the two phones have
+been in together), from CartItem) and the related phone's sales (log(1 + completed BUY
+units), from Order), so a bestseller wins a tie. Orders don't record a buyer or basket,
+so carts are the only source of "bought together".
+
+Every phone is only compared with the WINDOW phones on either side of it in price order
+(plus its co-purchases), which bounds a full rebuild to O(phones x WINDOW) distance
+computations, evaluated with NumPy a batch of phones at a time; phones farther apart in
+price than that are too far apart anyway.
+
+Phone saves queue the phone in PendingRecommendation (bulk writes queue everything); the
+rebuild_recommendations command (run with --loop in the background) recomputes the lists
+of queued phones, of the phones whose list contains one, and of the phones in a queued
+phone's window it is now closer to than their current last neighbour. Windows are taken
+by position, so a change also shifts the edges of its neighbours' windows by a phone; the
+phones that brings into or out of a window are only reconsidered by a full rebuild
+(--full), which also refreshes co-purchase counts and sales, both slow to change.
+"""
+
+import math
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import CartItem, Order, PendingRecommendation, Phone, PhoneRecommendation
+
+try:
+    import numpy as np
+except ImportError:  # recommendations can't be rebuilt without it; queueing still works
+    np = None
+
+DEFAULT_RELATED_PHONES = 4
+DEFAULT_WINDOW = 1000
+BATCH_SIZE = 256
+# A queue longer than this fraction of the catalog is cheaper to handle with a full rebuild.
+FULL_REBUILD_RATIO = 0.25
+WEIGHTS = {
+    'brand': 1.0,
+    'price': 2.0,
+    'memory': 0.3,
+    'condition': 0.3,
+    'camera': 0.2,
+    'color': 0.1,
+    'co_purchase': 0.5,
+    'sales': 0.05,
+}
+CONDITION_STEPS = {'New': 0, 'Good': 1, 'Usable': 2, 'Scrap': 3}
+FEATURE_FIELDS = ('id', 'brand_id', 'base_price', 'memory', 'condition', 'camera_quality', 'color')
+
+
+class RecommendationsUnavailable(Exception):
+    """
+    Raised when recommendations are rebuilt without NumPy installed.
+    """
+
+
+def related_count():
+    return getattr(settings, 'RELATED_PHONES', DEFAULT_RELATED_PHONES)
+
+
+def window():
+    return getattr(settings, 'RECOMMENDATION_WINDOW', DEFAULT_WINDOW)
+
+
+def related_phones(phone_id):
+    """
+    The phones recommended for phone_id, best first: one query using the (phone, rank) index.
+    """
+    return (
+        Phone.objects.filter(recommended_in__phone_id=phone_id)
+        .select_related('brand')
+        .order_by('recommended_in__rank')
+    )
+
+
+def queue(phone_ids):
+    """
+    Queues phones for the background rebuild; re-queueing a phone moves its timestamp forward.
+    """
+    now = timezone.now()
+    PendingRecommendation.objects.bulk_create(
+        [PendingRecommendation(phone_id=phone_id, queued_at=now) for phone_id in set(phone_ids)],
+        update_conflicts=True, unique_fields=['phone_id'], update_fields=['queued_at'],
+    )
+
+
+def queue_all():
+    """
+    Queues every phone, after writes that bypass the Phone signals. One INSERT ... SELECT.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {PendingRecommendation._meta.db_table} (phone_id, queued_at) '
+            f'SELECT id, %s FROM {Phone._meta.db_table} WHERE true '
+            f'ON CONFLICT (phone_id) DO UPDATE SET queued_at = excluded.queued_at',
+            [timezone.now()],
+        )
+
+
+def _camera_megapixels(value):
+    digits = ''.join(character for character in value or '' if character.isdigit())
+    return int(digits) if digits else 0
+
+
+class Features:
+    """
+    Every phone's features as NumPy arrays, sorted by price (the order windows are taken in).
+    """
+
+    def __init__(self, rows, sales=None, co_purchases=None):
+        _require_numpy()
+        rows = sorted(rows, key=lambda row: (row[2], row[0]))
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.position = {phone_id: index for index, phone_id in enumerate(self.ids.tolist())}
+        self.brand = np.array([row[1] or 0 for row in rows], dtype=np.int64)
+        colors = {}
+        self.color = np.array([colors.setdefault((row[6] or '').lower(), len(colors)) for row in rows], dtype=np.int64)
+        megapixels = np.array([_camera_megapixels(row[5]) for row in rows], dtype=np.float64)
+        self.has_camera = megapixels > 0
+        # Numeric features, pre-weighted: the absolute difference is that feature's part of the distance.
+        self.numeric = [
+            WEIGHTS['price'] * np.log(np.array([max(float(row[2]), 0.01) for row in rows])),
+            WEIGHTS['memory'] * np.log2(np.array([max(row[3], 1) for row in rows], dtype=np.float64)),
+            WEIGHTS['condition'] * np.array([CONDITION_STEPS.get(row[4], 1.5) for row in rows]),
+        ]
+        self.numeric = [column.astype(np.float32) for column in self.numeric]
+        self.camera = (WEIGHTS['camera'] * np.log2(np.where(self.has_camera, megapixels, 1))).astype(np.float32)
+        self.sales = np.zeros(len(rows), dtype=np.float32)
+        for phone_id, units in (sales or {}).items():
+            if phone_id in self.position:
+                self.sales[self.position[phone_id]] = math.log1p(units)
+        # {row: {other row: bonus}}
+        self.co_purchases = {}
+        for (first, second), carts in (co_purchases or {}).items():
+            if first in self.position and second in self.position:
+                bonus = WEIGHTS['co_purchase'] * math.log1p(carts)
+                self.co_purchases.setdefault(self.position[first], {})[self.position[second]] = bonus
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls):
+        """
+        Reads phones, sales and co-purchases with three queries.
+        """
+        rows = list(Phone.objects.values_list(*FEATURE_FIELDS))
+        sales = dict(
+            Order.objects.filter(order_type='BUY', status='COMPLETED')
+            .values_list('phone_id').annotate(Sum('quantity')).order_by()
+        )
+        return cls(rows, sales, co_purchases())
+
+    def distances(self, rows, candidates):
+        """
+        Distances from each of rows (an array of positions) to the matching row of
+        candidates (a len(rows) x n array of positions, or 1 x n for the same ones).
+        """
+        rows = rows[:, None]
+        distance = WEIGHTS['brand'] * (self.brand[rows] != self.brand[candidates]).astype(np.float32)
+        for column in self.numeric:
+            distance += np.abs(column[rows] - column[candidates])
+        # Without a camera rating on either side, the camera term is a flat WEIGHTS['camera'].
+        both_rated = self.has_camera[rows] & self.has_camera[candidates]
+        distance += np.where(both_rated, np.abs(self.camera[rows] - self.camera[candidates]), np.float32(WEIGHTS['camera']))
+        distance += WEIGHTS['color'] * (self.color[rows] != self.color[candidates])
+        distance -= WEIGHTS['sales'] * self.sales[candidates]
+        return distance
+
+    def windows(self, rows, size):
+        """
+        The positions within size of each of rows, as a len(rows) x (2 * size + 1) array;
+        positions past either end are clipped (and so repeated), and masked by distances().
+        """
+        offsets = np.arange(-size, size + 1)
+        return np.clip(rows[:, None] + offsets, 0, len(self) - 1)
+
+    def nearest(self, rows, count, size):
+        """
+        {row: [(score, related row), ...]} with the count nearest phones of each of rows.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1:
+            # A run of consecutive rows (a full rebuild) shares one span of candidates, so the
+            # features are compared by broadcasting instead of gathered row by row.
+            span = np.arange(max(rows[0] - size, 0), min(rows[-1] + size + 1, len(self)))[None, :]
+            excluded = np.abs(span - rows[:, None]) > size
+            candidates = np.broadcast_to(span, (len(rows), span.shape[1]))
+        else:
+            span = candidates = self.windows(rows, size)
+            # The repeats that clipping at either end produced.
+            excluded = np.zeros(candidates.shape, dtype=bool)
+            excluded[:, 1:] = candidates[:, 1:] == candidates[:, :-1]
+        distance = self.distances(rows, span)
+        distance[excluded | (candidates == rows[:, None])] = np.inf
+        take = min(count, candidates.shape[1])
+        best = np.argpartition(distance, take - 1, axis=1)[:, :take] if take else np.empty((len(rows), 0), int)
+
+        result = {}
+        for index, row in enumerate(rows.tolist()):
+            scored = {
+                int(candidates[index, column]): float(distance[index, column])
+                for column in best[index].tolist() if distance[index, column] != np.inf
+            }
+            partners = self.co_purchases.get(row)
+            if partners:
+                others = np.array(list(partners), dtype=np.int64)
+                scores = self.distances(np.array([row]), others[None, :])[0] - np.array(list(partners.values()))
+                scored.update(zip(others.tolist(), scores.tolist()))
+            result[row] = sorted((score, other) for other, score in scored.items())[:count]
+        return result
+
+
+def _require_numpy():
+    if np is None:
+        raise RecommendationsUnavailable('Recommendations need NumPy (pip install numpy).')
+
+
+def co_purchases():
+    """
+    {(phone id, other phone id): number of carts holding both}, in both directions.
+    """
+    table = CartItem._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT a.phone_id, b.phone_id, COUNT(DISTINCT a.cart_id) FROM {table} a '
+            f'JOIN {table} b ON b.cart_id = a.cart_id AND b.phone_id != a.phone_id '
+            f'GROUP BY a.phone_id, b.phone_id'
+        )
+        return {(first, second): carts for first, second, carts in cursor.fetchall()}
+
+
+def _write(features, lists, replace_all=False):
+    rows = [
+        PhoneRecommendation(
+            phone_id=int(features.ids[row]), rank=rank, related_id=int(features.ids[other]), score=score,
+        )
+        for row, nearest in lists.items()
+        for rank, (score, other) in enumerate(nearest)
+    ]
+    with transaction.atomic():
+        if replace_all:
+            PhoneRecommendation.objects.all().delete()
+        else:
+            phone_ids = [int(features.ids[row]) for row in lists]
+            for start in range(0, len(phone_ids), 500):
+                PhoneRecommendation.objects.filter(phone_id__in=phone_ids[start:start + 500]).delete()
+        PhoneRecommendation.objects.bulk_create(rows, batch_size=1000)
+    return len(lists)
+
+
+def rebuild(features=None, batch_size=BATCH_SIZE):
+    """
+    Recomputes every phone's list. Returns the number of phones.
+    """
+    started = timezone.now()
+    if features is None:
+        features = Features.load()
+    count, size = related_count(), window()
+    lists = {}
+    for start in range(0, len(features), batch_size):
+        lists.update(features.nearest(range(start, min(start + batch_size, len(features))), count, size))
+    _write(features, lists, replace_all=True)
+    PendingRecommendation.objects.filter(queued_at__lte=started).delete()
+    return len(lists)
+
+
+def affected_rows(features, phone_ids):
+    """
+    The positions of the phones whose lists a change to phone_ids can alter.
+    """
+    count, size = related_count(), window()
+    rows = {features.position[phone_id] for phone_id in phone_ids if phone_id in features.position}
+    # Phones listing a changed (or deleted) phone.
+    listing = PhoneRecommendation.objects.filter(related_id__in=list(phone_ids)).values_list('phone_id', flat=True)
+    rows.update(features.position[phone_id] for phone_id in listing if phone_id in features.position)
+    changed = np.array(sorted(row for row in rows if int(features.ids[row]) in phone_ids), dtype=np.int64)
+    for row in changed.tolist():
+        rows.update(features.co_purchases.get(row, ()))
+    # Phones a changed phone is now closer to than their last neighbour, or with a short list.
+    if len(changed):
+        neighbours = features.windows(changed, size)
+        distance = features.distances(neighbours.reshape(-1), np.repeat(changed, neighbours.shape[1])[:, None])[:, 0]
+        last = dict(PhoneRecommendation.objects.filter(rank=count - 1).values_list('phone_id', 'score'))
+        limits = np.array([last.get(int(features.ids[row]), np.inf) for row in neighbours.reshape(-1).tolist()])
+        rows.update(neighbours.reshape(-1)[distance < limits].tolist())
+    return sorted(rows)
+
+
+def update(phone_ids=None, batch_size=BATCH_SIZE):
+    """
+    Processes the queue (or phone_ids): recomputes the lists the queued phones affect.
+    Returns the number of lists rewritten.
+    """
+    started = timezone.now()
+    if phone_ids is None:
+        phone_ids = set(PendingRecommendation.objects.filter(queued_at__lte=started).values_list('phone_id', flat=True))
+    if not phone_ids:
+        return 0
+    features = Features.load()
+    if len(phone_ids) > FULL_REBUILD_RATIO * len(features):
+        return rebuild(features, batch_size)
+    rows = affected_rows(features, set(phone_ids))
+    lists = {}
+    for start in range(0, len(rows), batch_size):
+        lists.update(features.nearest(rows[start:start + batch_size], related_count(), window()))
+    _write(features, lists)
+    PendingRecommendation.objects.filter(phone_id__in=list(phone_ids), queued_at__lte=started).delete()
+    return len(lists)
+
@@ -0,0 +1,59 @@
+# inventory/runner.py
+
+"""
+The test runner (settings.TEST_RUNNER). Runs the suite with the files the site shares
+between processes moved to a temporary directory: the metrics files (METRICS_DIR), the
+file tiers of the caches and the query spool. Otherwise tests would add to the counters
+of a server running from the same checkout, and every cache.clear() would empty its cache.
+"""
+
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+FILE_CACHE_BACKENDS = (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'inventory.cache_backends.FileCache',
+)
+
+
+def _relocate_file_caches(config, directory, name):
+    # Cache backends that wrap others (TieredCache) keep them in OPTIONS.
+    if config.get('BACKEND') in FILE_CACHE_BACKENDS:
+        config['LOCATION'] = os.path.join(directory, 'cache', name)
+    for key, value in config.get('OPTIONS', {}).items():
+        if isinstance(value, dict):
+            _relocate_file_caches(value, directory, f'{name}-{key.lower()}')
+
+
+def isolated_settings(directory):
+    """
+    The settings to override so that nothing the tests write is shared outside directory.
+    """
+    caches = copy.deepcopy(settings.CACHES)
+    for alias, config in caches.items():
+        _relocate_file_caches(config, directory, alias)
+    overrides = {'CACHES': caches}
+    if getattr(settings, 'METRICS_DIR', None):
+        overrides['METRICS_DIR'] = os.path.join(directory, 'metrics')
+    if getattr(settings, 'QUERY_BUFFER_SPOOL', None):
+        overrides['QUERY_BUFFER_SPOOL'] = os.path.join(directory, 'query_spool')
+    return overrides
+
+
+class IsolatedTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.shared_directory = tempfile.mkdtemp(prefix='refurbished_project_tests_')
+        self.shared_settings = override_settings(**isolated_settings(self.shared_directory))
+        self.shared_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.shared_settings.disable()
+        shutil.rmtree(self.shared_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,252 @@
+# inventory/search.py
+
+"""
+Full-text phone search on an SQLite FTS5 index.
+
+inventory_phone_fts holds one row per phone (rowid = phone id) with the phone's name,
+brand name, color and camera quality. SQL triggers keep it in sync with inventory_phone and
+inventory_brand, so bulk_create() and QuerySet.update() are covered as well. On databases
+other than SQLite the same functions fall back to icontains lookups.
+"""
+
+import re
+
+from django.db import connection as default_connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Phone
+
+FTS_TABLE = 'inventory_phone_fts'
+VOCAB_TABLE = 'inventory_phone_fts_vocab'
+
+# bm25() column weights, in table column order: a hit in the name outranks a hit in the color.
+COLUMN_WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+
+# How far a misspelt term may be from a known term to be offered as a suggestion.
+MAX_EDIT_DISTANCE = 2
+# Vocabulary terms inspected per misspelt term.
+SUGGESTION_CANDIDATES = 2000
+
+_PHONE_ROW = (
+    "SELECT {p}.id, {p}.name, (SELECT name FROM inventory_brand WHERE id = {p}.brand_id), "
+    "{p}.color, {p}.camera_quality"
+)
+
+INSTALL_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, brand, color, camera_quality, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, row)",
+    f"CREATE TRIGGER IF NOT EXISTS inventory_phone_fts_insert AFTER INSERT ON inventory_phone BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, brand, color, camera_quality) {_PHONE_ROW.format(p='new')}; "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS inventory_phone_fts_delete AFTER DELETE ON inventory_phone BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS inventory_phone_fts_update "
+    f"AFTER UPDATE OF name, brand_id, color, camera_quality ON inventory_phone BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, brand, color, camera_quality) {_PHONE_ROW.format(p='new')}; "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS inventory_brand_fts_update AFTER UPDATE OF name ON inventory_brand BEGIN "
+    f"UPDATE {FTS_TABLE} SET brand = new.name "
+    "WHERE rowid IN (SELECT id FROM inventory_phone WHERE brand_id = new.id); "
+    "END",
+]
+
+UNINSTALL_SQL = [
+    "DROP TRIGGER IF EXISTS inventory_brand_fts_update",
+    "DROP TRIGGER IF EXISTS inventory_phone_fts_update",
+    "DROP TRIGGER IF EXISTS inventory_phone_fts_delete",
+    "DROP TRIGGER IF EXISTS inventory_phone_fts_insert",
+    f"DROP TABLE IF EXISTS {VOCAB_TABLE}",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def is_available(connection=None):
+    return (connection or default_connection).vendor == 'sqlite'
+
+
+def install(connection=None):
+    """
+    Creates the FTS table and its triggers if they are missing. Safe to call repeatedly;
+    it runs after every migrate because rebuilding inventory_phone drops its triggers.
+    """
+    connection = connection or default_connection
+    if not is_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+
+
+def uninstall(connection=None):
+    connection = connection or default_connection
+    if not is_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for statement in UNINSTALL_SQL:
+            cursor.execute(statement)
+
+
+def drop_triggers(connection=None):
+    """
+    Drops the triggers but keeps the index. Migrations that make SQLite rebuild inventory_phone
+    (adding or altering Phone columns) must call this first: SQLite refuses to rename the
+    rebuilt table while inventory_brand_fts_update still refers to it. install() puts the
+    triggers back, and the index stays valid because phone ids don't change.
+    """
+    connection = connection or default_connection
+    if not is_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for statement in UNINSTALL_SQL:
+            if statement.startswith('DROP TRIGGER'):
+                cursor.execute(statement)
+
+
+def rebuild(connection=None):
+    """
+    Repopulates the index from scratch and merges its b-trees. Returns the number of phones indexed.
+    """
+    connection = connection or default_connection
+    if not is_available(connection):
+        return 0
+    install(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, brand, color, camera_quality) "
+            f"{_PHONE_ROW.format(p='inventory_phone')} FROM inventory_phone"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def match_expression(text):
+    """
+    Turns free text into an FTS5 query: every word must match, each as a prefix.
+    Words are quoted so user input can never be parsed as FTS5 syntax.
+    """
+    terms = tokenize(text)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _icontains(text):
+    condition = Q()
+    for term in tokenize(text):
+        condition &= (
+            Q(name__icontains=term) | Q(brand__name__icontains=term)
+            | Q(color__icontains=term) | Q(camera_quality__icontains=term)
+        )
+    return condition
+
+
+def filter_queryset(queryset, text):
+    """
+    Restricts a Phone queryset to phones matching text with a single indexed subquery.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return queryset
+    if not is_available():
+        return queryset.filter(_icontains(text))
+    return queryset.filter(
+        pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (expression,))
+    )
+
+
+def search(text, limit=24, offset=0):
+    """
+    Returns up to limit phones matching text, best BM25 match first.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    if not is_available():
+        queryset = Phone.objects.filter(_icontains(text)).select_related('brand').order_by('name', 'id')
+        return list(queryset[offset:offset + limit])
+
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    with default_connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s",
+            (expression, limit, offset),
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    phones = Phone.objects.select_related('brand').in_bulk(ids)
+    return [phones[pk] for pk in ids if pk in phones]
+
+
+def edit_distance(a, b, limit=MAX_EDIT_DISTANCE):
+    """
+    Levenshtein distance between a and b, giving up (returning limit + 1) once it exceeds limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _closest_term(cursor, term):
+    # Only terms sharing the first letter are considered, which keeps the vocabulary
+    # lookup an index range scan; typos in the first letter are rare enough to accept that.
+    cursor.execute(
+        f"SELECT term, doc FROM {VOCAB_TABLE} WHERE term >= %s AND term < %s LIMIT %s",
+        (term[0], term[0] + '\uffff', SUGGESTION_CANDIDATES),
+    )
+    best = None
+    for candidate, documents in cursor.fetchall():
+        distance = edit_distance(term, candidate)
+        if distance > MAX_EDIT_DISTANCE:
+            continue
+        score = (distance, -documents)
+        if best is None or score < best[0]:
+            best = (score, candidate)
+    return best[1] if best else None
+
+
+def suggest(text):
+    """
+    Returns a corrected version of text with unknown words replaced by the closest indexed
+    word, or None when every word is already known or nothing close enough exists.
+    """
+    terms = tokenize(text)
+    if not terms or not is_available():
+        return None
+    corrected = []
+    changed = False
+    with default_connection.cursor() as cursor:
+        for term in terms:
+            cursor.execute(
+                f"SELECT 1 FROM {VOCAB_TABLE} WHERE term >= %s AND term < %s LIMIT 1",
+                (term, term + '\uffff'),
+            )
+            if cursor.fetchone() is None:
+                replacement = _closest_term(cursor, term)
+                if replacement:
+                    corrected.append(replacement)
+                    changed = True
+                    continue
+            corrected.append(term)
+    return ' '.join(corrected) if changed else None
@@ -0,0 +1,206 @@
+# inventory/signals.py
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import (
+    analytics, cart, conditions, database, facets, listings, metrics, pagecache, perf, querybuffer, querybudget,
+    ratings, recommendations, search,
+)
+from .models import Brand, Listing, Order, Phone, PhoneRecommendation, Platform, PlatformConditionMapping, Review
+
+
+@receiver(pre_save, sender=Phone)
+def remember_phone_facet_cell(sender, instance, raw=False, **kwargs):
+    """
+    Records which facet cell the phone was in before this save.
+    """
+    instance._facet_cell_before = None
+    if raw or instance.pk is None:
+        return
+    old = Phone.objects.filter(pk=instance.pk).values(*facets.CELL_FIELDS).first()
+    if old is not None:
+        instance._facet_cell_before = facets.cell_key(old)
+
+
+@receiver(post_save, sender=Phone)
+def update_phone_facet_counts(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    facets.move(getattr(instance, '_facet_cell_before', None), facets.phone_cell_key(instance))
+
+
+@receiver(post_delete, sender=Phone)
+def remove_phone_facet_counts(sender, instance, **kwargs):
+    facets.adjust(facets.phone_cell_key(instance), -1)
+
+
+@receiver(post_save, sender=Phone)
+def queue_phone_recommendations(sender, instance, raw=False, **kwargs):
+    if not raw:
+        recommendations.queue([instance.pk])
+
+
+@receiver(pre_delete, sender=Phone)
+def queue_recommendations_of_deleted_phone(sender, instance, **kwargs):
+    # The lists the phone is in lose an entry when its rows cascade; queue them for refilling.
+    listing = PhoneRecommendation.objects.filter(related=instance).values_list('phone_id', flat=True)
+    recommendations.queue([instance.pk, *listing])
+
+
+@receiver(post_delete, sender=Brand)
+def rebuild_facets_for_deleted_brand(sender, instance, **kwargs):
+    # Phones of a deleted brand are moved to "no brand" with a bulk UPDATE that sends no signals.
+    facets.rebuild()
+
+
+@receiver(post_save, sender=Platform)
+def seed_platform_condition_mappings(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        conditions.seed_defaults(instance)
+
+
+@receiver(post_save, sender=PlatformConditionMapping)
+@receiver(post_delete, sender=PlatformConditionMapping)
+@receiver(post_delete, sender=Platform)
+def invalidate_condition_mappings(sender, **kwargs):
+    conditions.invalidate()
+
+
+@receiver(post_save, sender=Platform)
+@receiver(post_delete, sender=Platform)
+def invalidate_potential_listings(sender, **kwargs):
+    listings.bump_platforms_version()
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_phone_potential_listings(sender, instance, **kwargs):
+    listings.bump_phone_version(instance.phone_id)
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    instance._rating_before = None
+    if raw or instance.pk is None:
+        return
+    instance._rating_before = Review.objects.filter(pk=instance.pk).values_list('phone_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_phone_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_rating_before', None)
+    if before == (instance.phone_id, instance.rating):
+        return
+    if before is not None:
+        ratings.adjust(before[0], -before[1], -1)
+    ratings.add(instance)
+
+
+@receiver(post_delete, sender=Review)
+def remove_phone_rating(sender, instance, **kwargs):
+    ratings.remove(instance)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_before(sender, instance, raw=False, **kwargs):
+    instance._order_before = None
+    if raw or instance.pk is None:
+        return
+    instance._order_before = Order.objects.select_related('phone').filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Order)
+def update_order_rollups(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_order_before', None)
+    if before is not None:
+        if (analytics.cell_key(before), before.quantity, before.total_price) == (
+            analytics.cell_key(instance), instance.quantity, instance.total_price
+        ):
+            return
+        analytics.record([before], sign=-1)
+    analytics.record([instance])
+
+
+@receiver(post_save, sender=Order)
+def count_created_order(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: metrics.count_orders([instance]))
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    analytics.record([instance], sign=-1)
+
+
+@receiver(user_logged_in)
+def merge_cookie_cart(sender, request, user, **kwargs):
+    if request is not None:
+        cart.merge(request, user)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_brand_pages(sender, **kwargs):
+    pagecache.bump_tags('brand')
+
+
+@receiver(post_save, sender=Phone)
+@receiver(post_delete, sender=Phone)
+def invalidate_phone_pages(sender, **kwargs):
+    pagecache.bump_tags('phone')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_pages(sender, **kwargs):
+    pagecache.bump_tags('review')
+
+
+@receiver(post_migrate)
+def reinstall_search_triggers(sender, using, **kwargs):
+    # SQLite applies some schema changes by rebuilding inventory_phone, which drops its triggers.
+    if sender.name == 'inventory':
+        from django.db import connections
+        search.install(connections[using])
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    database.configure(connection)
+
+
+@receiver(connection_created)
+def count_queries_for_budget(sender, connection, **kwargs):
+    querybudget.install(connection)
+
+
+@receiver(connection_created)
+def time_queries_for_perf(sender, connection, **kwargs):
+    perf.install(connection)
+
+
+@receiver(setting_changed)
+def reconfigure_query_buffer(sender, setting, **kwargs):
+    if setting.startswith('QUERY_BUFFER_'):
+        querybuffer.reset()
+
+
+@receiver(setting_changed)
+def resize_perf_buffer(sender, setting, **kwargs):
+    if setting == 'PERF_BUFFER_SIZE':
+        perf.reset()
+
+
+@receiver(setting_changed)
+def reopen_metrics_file(sender, setting, **kwargs):
+    if setting == 'METRICS_DIR':
+        metrics.reset()
@@ -0,0 +1,112 @@
+# inventory/staticfiles.py
+
+"""
+Static files storage: content-hashed names plus precompressed copies.
+
+collectstatic copies every static file into STATIC_ROOT under a name containing a hash
+of its content (admin/css/base.css -> admin/css/base.5af66c1b1797.css), rewrites the
+references between CSS files and records the mapping in staticfiles.json; {% static %}
+then gives the hashed URL, which never changes meaning and can be cached for a year.
+
+Text assets (CSS, JS, SVG, ...) also get a gzip copy (.gz) and, when the brotli package
+is installed, a Brotli copy (.br), compressed once at the highest level instead of on
+every response. inventory/fileserver.py picks the best one the client accepts.
+
+Until collectstatic has been run there is no manifest and {% static %} gives the
+unhashed URL, so tests and a fresh checkout work without it. Once a manifest exists, a
+file missing from it is an error, as with Django's ManifestStaticFilesStorage.
+"""
+
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # optional: only .gz copies are made without it
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot',
+)
+# Smaller files gain nothing worth a second file.
+MIN_SIZE = 256
+# A compressed copy is only kept if it is at most this fraction of the original.
+MAX_RATIO = 0.95
+
+
+def encodings():
+    """
+    The precompressed encodings made (and served), best first: [(content coding, suffix), ...].
+    """
+    available = [('gzip', '.gz')]
+    if brotli is not None:
+        available.insert(0, ('br', '.br'))
+    return available
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the output identical across collectstatic runs.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._hashed_names = None
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            if self.hashed_files:
+                raise
+            # Not collected yet: the file is served under its own name.
+            return name
+
+    def is_hashed(self, name):
+        """
+        Whether name is a content-hashed name from the manifest.
+        """
+        if self._hashed_names is None:
+            self._hashed_names = frozenset(self.hashed_files.values())
+        return name in self._hashed_names
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        self._hashed_names = None
+        if dry_run:
+            return
+        names = set()
+        for name in paths:
+            names.add(name)
+            hashed_name = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            if hashed_name:
+                names.add(hashed_name)
+        for name in sorted(names):
+            if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress_file(name)
+
+    def compress_file(self, name):
+        """
+        Writes the compressed copies of one collected file next to it. Returns their names.
+        """
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            data = source.read()
+        written = []
+        for encoding, suffix in encodings():
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+            if len(data) < MIN_SIZE:
+                continue
+            compressed = compress(data, encoding)
+            if len(compressed) > len(data) * MAX_RATIO:
+                continue
+            with open(path + suffix, 'wb') as target:
+                target.write(compressed)
+            written.append(name + suffix)
+        return written
@@ -0,0 +1,189 @@
+# inventory/stock.py
+
+"""
+Concurrency-safe stock changes.
+
+Stock is only ever decremented with a conditional UPDATE ("SET stock = stock - n WHERE
+stock >= n"), so two buyers racing for the last unit can't both win: the database
+serializes the two UPDATEs and the second one matches no row. Carts hold stock through
+StockReservation rows that expire after settings.STOCK_RESERVATION_TTL seconds; the
+sweep_reservations command gives expired holds back.
+
+SQLite allows one writer at a time. Writers that can't get the lock within the connection
+timeout fail with "database is locked"; retry_on_lock() (database.py) retries those with backoff.
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import analytics, metrics, pagecache
+from .database import retry_on_lock
+from .models import CartItem, Order, Phone, StockReservation
+
+DEFAULT_RESERVATION_TTL = 15 * 60
+
+
+class OutOfStock(Exception):
+    """
+    Raised when a phone doesn't have enough stock left for a purchase or reservation.
+    """
+
+    def __init__(self, phone_id, quantity):
+        self.phone_id = phone_id
+        self.quantity = quantity
+        super().__init__(f"Not enough stock of phone {phone_id} for {quantity} unit(s).")
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_RESERVATION_TTL))
+
+
+def _stock_changed():
+    # Queryset updates send no signals, so cached pages showing stock are invalidated here.
+    transaction.on_commit(lambda: pagecache.bump_tags('phone'))
+
+
+def take_stock(phone_id, quantity=1):
+    """
+    Atomically removes quantity units from a phone's stock, or raises OutOfStock.
+    """
+    updated = Phone.objects.filter(pk=phone_id, stock__gte=quantity).update(stock=F('stock') - quantity)
+    if not updated:
+        metrics.STOCK_OUTS.inc()
+        raise OutOfStock(phone_id, quantity)
+    _stock_changed()
+
+
+def return_stock(phone_id, quantity=1):
+    Phone.objects.filter(pk=phone_id).update(stock=F('stock') + quantity)
+    _stock_changed()
+
+
+@retry_on_lock
+@transaction.atomic
+def buy(phone, quantity=1):
+    """
+    Sells quantity units of phone directly, without a cart. Returns the completed Order.
+    """
+    take_stock(phone.pk, quantity)
+    return Order.objects.create(
+        phone=phone,
+        order_type='BUY',
+        quantity=quantity,
+        total_price=phone.base_price * quantity,
+        status='COMPLETED',
+    )
+
+
+@retry_on_lock
+@transaction.atomic
+def sell(phone, quantity=1):
+    """
+    Records a phone bought back from a customer and puts it into stock.
+    """
+    return_stock(phone.pk, quantity)
+    return Order.objects.create(
+        phone=phone,
+        order_type='SELL',
+        quantity=quantity,
+        total_price=phone.base_price * quantity,  # Assuming sell price is base price for now
+        status='COMPLETED',
+    )
+
+
+@retry_on_lock
+@transaction.atomic
+def reserve(cart, phone, quantity=1):
+    """
+    Holds quantity more units of phone for cart and pushes the hold's expiry forward.
+    """
+    take_stock(phone.pk, quantity)
+    expires_at = timezone.now() + reservation_ttl()
+    updated = StockReservation.objects.filter(cart=cart, phone=phone).update(
+        quantity=F('quantity') + quantity, expires_at=expires_at
+    )
+    if not updated:
+        StockReservation.objects.create(cart=cart, phone=phone, quantity=quantity, expires_at=expires_at)
+
+
+@retry_on_lock
+@transaction.atomic
+def release(cart, phone_id):
+    """
+    Gives back whatever stock cart holds for phone_id.
+    """
+    reservation = StockReservation.objects.select_for_update().filter(cart=cart, phone_id=phone_id).first()
+    if reservation is not None:
+        return_stock(phone_id, reservation.quantity)
+        reservation.delete()
+
+
+@retry_on_lock
+@transaction.atomic
+def checkout(cart):
+    """
+    Turns every item in cart into a completed BUY order, all or nothing.
+
+    Units held by a reservation are already out of stock and are simply consumed; that
+    includes holds past their expiry the sweeper hasn't returned yet. Anything not covered
+    is taken from stock now, and if that fails the whole checkout rolls back with OutOfStock.
+    """
+    items = list(CartItem.objects.filter(cart=cart).select_related('phone'))
+    held = dict(
+        StockReservation.objects.select_for_update().filter(cart=cart).values_list('phone_id', 'quantity')
+    )
+    wanted = Counter()
+    for item in items:
+        wanted[item.phone_id] += item.quantity
+    # Settle the difference between what the cart holds and what it buys, phone by phone.
+    # Holds on phones no longer in the cart go back to stock.
+    for phone_id in wanted.keys() | held.keys():
+        difference = wanted[phone_id] - held.get(phone_id, 0)
+        if difference > 0:
+            take_stock(phone_id, difference)
+        elif difference < 0:
+            return_stock(phone_id, -difference)
+
+    orders = [
+        Order(
+            phone=item.phone,
+            order_type='BUY',
+            quantity=item.quantity,
+            total_price=item.phone.base_price * item.quantity,
+            status='COMPLETED',
+        )
+        for item in items
+    ]
+    Order.objects.bulk_create(orders)
+    # bulk_create sends no post_save, so the analytics rollups and metrics are updated here.
+    analytics.record(orders)
+    transaction.on_commit(lambda: metrics.count_orders(orders))
+    StockReservation.objects.filter(cart=cart).delete()
+    CartItem.objects.filter(cart=cart).delete()
+    return orders
+
+
+@retry_on_lock
+@transaction.atomic
+def expire_reservations(now=None, batch_size=500):
+    """
+    Returns stock from up to batch_size expired reservations. Returns how many were expired.
+    """
+    now = now or timezone.now()
+    expired = list(
+        StockReservation.objects.select_for_update().filter(expires_at__lte=now)
+        .order_by('expires_at')
+        .values_list('pk', 'phone_id', 'quantity')[:batch_size]
+    )
+    returned = {}
+    for pk, phone_id, quantity in expired:
+        returned[phone_id] = returned.get(phone_id, 0) + quantity
+    for phone_id, quantity in returned.items():
+        return_stock(phone_id, quantity)
+    StockReservation.objects.filter(pk__in=[pk for pk, phone_id, quantity in expired]).delete()
+    return len(expired)
@@ -0,0 +1,83 @@
+# inventory/tasks.py
+
+"""
+The tasks run_workers can run (see inventory/jobs.py). Imported when the app is ready, so
+every process that queues or runs jobs knows them.
+"""
+
+import time
+
+from . import bulkjobs, feeds, images, jobs, listings
+from .models import BulkJob, Listing, Phone, Platform
+
+
+@jobs.task('noop')
+def noop(job, seconds=0):
+    """
+    Does nothing, or sleeps; for bench_jobs and for checking that workers are running.
+    """
+    if seconds:
+        time.sleep(seconds)
+
+
+@jobs.task('reprice_platform')
+def reprice_platform(job, platform):
+    platform = Platform.objects.get(pk=platform)
+    total = Listing.objects.filter(platform=platform).count()
+    run = listings.reprice_platform(platform, progress=lambda run: jobs.report(job, run.phones, total))
+    return f'{platform.name}: repriced {run}'
+
+
+@jobs.task('list_phones')
+def list_phones(job, platforms=None, phones=None):
+    """
+    Lists the phones with the given ids (default: all) on the platforms with the given ids (default: all).
+    """
+    platform_rows = Platform.objects.all() if platforms is None else Platform.objects.filter(pk__in=platforms)
+    phone_rows = Phone.objects.all() if phones is None else Phone.objects.filter(pk__in=phones)
+    total = phone_rows.count()
+    run = listings.list_phones(
+        platforms=list(platform_rows), phones=phone_rows, progress=lambda run: jobs.report(job, run.phones, total),
+    )
+    return f'Listed {run}'
+
+
+@jobs.task('import_feed', max_attempts=1)
+def import_feed(job, path, fmt=None, key='sku', batch_size=feeds.DEFAULT_BATCH_SIZE, create_brands=False):
+    """
+    Imports a feed file the workers can read. Not retried: a feed that can't be imported
+    (unknown format, missing columns) would fail the same way again.
+    """
+    fmt = feeds.detect_format(path, fmt)
+    with open(path, newline='', encoding='utf-8') as stream:
+        stats = feeds.import_feed(stream, fmt, key=key, batch_size=batch_size, create_brands=create_brands)
+    message = f'Imported: {stats}'
+    if stats.errors:
+        line_number, error = stats.errors[0]
+        message += f'; first rejected row, line {line_number}: {error}'
+    return message
+
+
+@jobs.task('build_image_derivatives')
+def build_image_derivatives(job, sources=None, force=False):
+    """
+    Makes the responsive derivatives of the stored images of sources (keys of
+    images.SOURCES; default: all) that have none, or of all of them with force.
+    """
+    pending = [
+        (images.SOURCES[key], name)
+        for key in sources or sorted(images.SOURCES)
+        for name in sorted(images.pending(images.SOURCES[key], force))
+    ]
+    rows = 0
+    for done, (source, name) in enumerate(pending, 1):
+        rows += images.record(source, name, images.render(name, replace=force))
+        jobs.report(job, done, len(pending))
+    return f'Built derivatives of {len(pending)} files for {rows} rows.'
+
+
+@jobs.task('bulk_job')
+def bulk_job(job, bulk_job):
+    bulk = BulkJob.objects.get(pk=bulk_job)
+    bulkjobs.run(bulk, progress=lambda processed, total: jobs.report(job, processed, total))
+    return f'{bulk.description}: {bulk.processed} rows'
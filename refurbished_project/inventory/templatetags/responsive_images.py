@@ -0,0 +1,42 @@
+# inventory/templatetags/responsive_images.py
+
+"""
+{% picture %}: responsive <picture> markup for images with derivatives (see inventory/images.py).
+"""
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from .. import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image, variants, alt='', sizes='100vw', **attrs):
+    """
+    Renders image as a <picture> offering its AVIF and WebP derivatives, sized by sizes,
+    with the original as the fallback <img>; a plain <img> until derivatives exist. Other
+    keyword arguments become attributes of the <img>:
+
+        {% picture phone.image phone.image_variants alt=phone.name sizes="33vw" class="h-48 w-full" %}
+    """
+    if not image:
+        return ''
+    img_attrs = {'src': image.url, 'alt': alt, 'loading': 'lazy', 'decoding': 'async'}
+    variants = images.current_variants(image, variants)
+    if variants:
+        img_attrs.update(width=variants['width'], height=variants['height'])
+    img_attrs.update(attrs)
+    img = format_html('<img {}>', format_html_join(' ', '{}="{}"', img_attrs.items()))
+    if not variants:
+        return img
+    sources = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (images.MIME_TYPES[fmt], images.srcset(variants, fmt), sizes)
+            for fmt in variants['formats'] if fmt in images.MIME_TYPES
+        ),
+    )
+    return format_html('<picture>{}{}</picture>', sources, img)
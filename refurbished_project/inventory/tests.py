@@ -0,0 +1,1583 @@
+import gzip
+import importlib
+import io
+import json
+import os
+import pstats
+import random
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import Sum
+from django.http import Http404
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    analytics, bulkjobs, cache_backends, cart, conditions, database, datagen, facets, feeds, fileserver, jobs,
+    listings, loadtest, metrics, perf, pricing, querybuffer, ratings, recommendations, runner, search,
+    stock, views,
+)
+from .models import (
+    Brand, BulkJob, Cart, CartItem, Job, Listing, Order, OrderRollup, PendingRecommendation, Phone,
+    PhoneFacetCount, PhoneRecommendation, Platform, PlatformConditionMapping, Query, Review, StockReservation,
+)
+from .catalog import SORT_OPTIONS, CatalogQuery, InvalidCursor, encode_cursor
+from .querybudget import QueryBudgetExceeded
+from .templatetags.responsive_images import picture
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryCountTests(TestCase):
+    """
+    Every storefront page must run the same number of queries however much data it shows.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Acme')
+        cls.other_brand = Brand.objects.create(name='Globex')
+        cls.user = User.objects.create_user('buyer', password='secret')
+        cls.cart = Cart.objects.create(user=cls.user)
+        for name, fee in [('X', '10.00'), ('Y', '8.00'), ('Z', '12.00')]:
+            Platform.objects.create(name=name, fee_percentage=Decimal(fee), fixed_fee=Decimal('1.00'))
+        cls.phone = cls.add_phones(1)[0]
+
+    @classmethod
+    def add_phones(cls, count):
+        phones = []
+        for i in range(count):
+            brand = cls.brand if i % 2 == 0 else cls.other_brand
+            phone = Phone.objects.create(
+                brand=brand, name=f'Phone {Phone.objects.count()}', base_price=Decimal('100.00') + i,
+                condition='Good', stock=5, memory=128, color='Black', camera_quality='12MP',
+            )
+            reviewer = User.objects.create_user(f'reviewer{phone.pk}')
+            Review.objects.create(phone=getattr(cls, 'phone', phone), user=reviewer, rating=4, comment='Nice')
+            CartItem.objects.create(cart=cls.cart, phone=phone, quantity=2)
+            phones.append(phone)
+        return phones
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, url):
+        cache.clear()
+        conditions.invalidate()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, expected):
+        self.assertEqual(self.count_queries(url), expected)
+        self.add_phones(30)
+        self.assertEqual(self.count_queries(url), expected)
+
+    def test_home(self):
+        self.assertConstantQueries(reverse('home'), 1)
+
+    def test_phone_list(self):
+        self.assertConstantQueries(reverse('phone_list'), 8)
+
+    def test_phone_search(self):
+        self.assertConstantQueries(reverse('phone_search') + '?q=phone', 2)
+
+    def test_phone_detail(self):
+        # 3 for the page, 3 more to price the phone on every platform when that isn't cached
+        self.assertConstantQueries(reverse('phone_detail', args=[self.phone.pk]), 6)
+
+    def test_brand_detail(self):
+        self.assertConstantQueries(reverse('brand_detail', args=[self.brand.pk]), 2)
+
+    def test_cart(self):
+        self.client.force_login(self.user)
+        # Session, user and the items with their phones; the header badge reuses the page's count.
+        self.assertConstantQueries(reverse('cart'), 3)
+
+    def test_cart_total_is_one_aggregate_query(self):
+        self.add_phones(3)
+        expected = sum(item.phone.base_price * item.quantity for item in self.cart.items.select_related('phone'))
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.get_total_price(), expected)
+
+    @override_settings(QUERY_BUDGET_DEFAULT=0)
+    def test_budget_exceeded_raises(self):
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('query_list'))
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.samsung = Brand.objects.create(name='Samsung')
+        google = Brand.objects.create(name='Google')
+        cls.galaxy = Phone.objects.create(
+            brand=cls.samsung, name='Galaxy S21', base_price=Decimal('300.00'), condition='Good', color='Black',
+        )
+        cls.pixel = Phone.objects.create(
+            brand=google, name='Pixel 7', base_price=Decimal('250.00'), condition='Good', color='Galaxy Blue',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, text):
+        return [phone.pk for phone in search.search(text)]
+
+    def test_prefixes_match_and_name_hits_rank_first(self):
+        self.assertEqual(self.found('sams'), [self.galaxy.pk])
+        self.assertEqual(list(search.filter_queryset(Phone.objects.all(), 'pix 7')), [self.pixel])
+        self.assertEqual(self.found('galaxy'), [self.galaxy.pk, self.pixel.pk])
+        self.assertEqual(self.found('"OR*'), [])
+
+    def test_triggers_keep_the_index_in_sync(self):
+        phone = Phone.objects.create(brand=self.samsung, name='Nokia 3310', base_price=Decimal('20.00'), condition='Good')
+        self.assertEqual(self.found('3310'), [phone.pk])
+        Phone.objects.filter(pk=phone.pk).update(name='Banana')
+        self.assertEqual((self.found('3310'), self.found('banana')), ([], [phone.pk]))
+        Brand.objects.filter(pk=self.samsung.pk).update(name='Acme')
+        self.assertEqual(self.found('sams'), [])
+        self.assertEqual(sorted(self.found('acme')), sorted([self.galaxy.pk, phone.pk]))
+        phone.delete()
+        self.assertEqual(self.found('banana'), [])
+
+    def test_suggestions_correct_typos(self):
+        self.assertEqual(search.suggest('galxy'), 'galaxy')
+        self.assertEqual(search.suggest('pixle 7'), 'pixel 7')
+        self.assertIsNone(search.suggest('galaxy'))
+        response = self.client.get(reverse('phone_search'), {'q': 'galxy', 'format': 'json'})
+        self.assertEqual((response.json()['results'], response.json()['suggestion']), ([], 'galaxy'))
+
+    def test_rebuild_command_repopulates_the_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        self.assertEqual(self.found('galaxy'), [])
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 2 phones.', out.getvalue())
+        self.assertEqual(self.found('galaxy'), [self.galaxy.pk, self.pixel.pk])
+
+    def test_admin_search_uses_the_index(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = self.client.get(reverse('admin:inventory_phone_changelist'), {'q': 'sams'})
+        self.assertContains(response, 'Galaxy S21')
+        self.assertNotContains(response, 'Pixel 7')
+
+    def test_pages_past_the_deepest_offset_are_not_found(self):
+        url = reverse('phone_search')
+        self.assertContains(self.client.get(url, {'q': 'gal', 'page': '1'}), 'Galaxy S21')
+        self.assertEqual(self.client.get(url, {'q': 'gal', 'page': '2'}).status_code, 200)
+        for page in ('99999999999999999999999', '100000'):
+            self.assertEqual(self.client.get(url, {'q': 'gal', 'page': page}).status_code, 404)
+            self.assertEqual(self.client.get(url, {'q': 'gal', 'page': page, 'format': 'json'}).status_code, 404)
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Acme')
+        # Repeated prices and names, so pages have to be tie-broken by id.
+        for index in range(11):
+            Phone.objects.create(
+                brand=cls.brand, name=f'Phone {index % 4}', base_price=Decimal('100.00') + index % 3,
+                condition='Good', stock=1,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, sort):
+        catalog = CatalogQuery({'sort': sort}, page_size=4)
+        seen, cursor = [], None
+        while True:
+            page = catalog.page(cursor)
+            seen += [phone.pk for phone in page]
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_phone_once_in_order(self):
+        for sort in SORT_OPTIONS:
+            expected = list(CatalogQuery({'sort': sort}).queryset().values_list('pk', flat=True))
+            self.assertEqual(self.walk(sort), expected, sort)
+            self.assertEqual(len(expected), 11)
+
+    def test_bad_cursors_fall_back_to_the_first_page(self):
+        first = [phone.pk for phone in CatalogQuery({}, page_size=4).page()]
+        for sort, values in [
+            ('price_asc', ['abc', '1']), ('price_asc', ['NaN', '1']), ('price_asc', ['100', 'x']),
+            ('newest', ['zz']), ('newest', ['1', '2']), ('rating', ['inf', '1']),
+        ]:
+            catalog = CatalogQuery({'sort': sort}, page_size=4)
+            with self.assertRaises(InvalidCursor):
+                catalog.seek(Phone.objects.all(), encode_cursor(values))
+            self.assertEqual(len(catalog.page(encode_cursor(values))), 4)
+        self.assertEqual([phone.pk for phone in CatalogQuery({}, page_size=4).page('not base64!')], first)
+        for url in (reverse('phone_list'), reverse('brand_detail', args=[self.brand.pk])):
+            for cursor in (encode_cursor(['abc', '1']), encode_cursor(['zz'])):
+                self.assertEqual(self.client.get(url, {'cursor': cursor, 'sort': 'newest'}).status_code, 200)
+                self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 200)
+
+
+    def test_out_of_range_filters_are_ignored(self):
+        everything = [phone.pk for phone in CatalogQuery({}, page_size=4).page()]
+        for params in (
+            {'min_price': 'NaN'}, {'min_price': 'sNaN'}, {'max_price': 'Infinity'}, {'max_price': '1e20'},
+            {'brand': '99999999999999999999'}, {'memory': '-99999999999999999999'}, {'min_rating': 'nan'},
+        ):
+            self.assertEqual([phone.pk for phone in CatalogQuery(params, page_size=4).page()], everything, params)
+            self.assertEqual(self.client.get(reverse('phone_list'), params).status_code, 200, params)
+        self.assertEqual(len(CatalogQuery({'brand': self.brand.pk, 'max_price': '100.00'}).filter()), 4)
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.brand = Brand.objects.create(name='Acme')
+
+    def add_phone(self, **fields):
+        fields = {'brand': self.brand, 'name': 'Phone', 'base_price': Decimal('150.00'), 'condition': 'Good', **fields}
+        return Phone.objects.create(**fields)
+
+    def cells(self):
+        return sorted(PhoneFacetCount.objects.filter(count__gt=0).values_list(
+            'brand_id', 'condition', 'memory', 'color', 'camera_quality', 'price_bucket', 'count',
+        ))
+
+    def test_signals_keep_counts_equal_to_a_rebuild(self):
+        phones = [self.add_phone(), self.add_phone(), self.add_phone(base_price=Decimal('800.00'), color='Black')]
+        phones[0].condition = 'New'
+        phones[0].save()
+        phones[1].delete()
+        counted = self.cells()
+        facets.rebuild()
+        self.assertEqual(counted, self.cells())
+        self.assertEqual(sum(cell[-1] for cell in counted), 2)
+
+    def test_negative_adjustment_never_creates_or_underflows_a_cell(self):
+        phone = self.add_phone()
+        key = facets.phone_cell_key(phone)
+        missing = {**key, 'condition': 'Fair'}
+        facets.adjust(missing, -1)
+        self.assertFalse(PhoneFacetCount.objects.filter(**missing).exists())
+        facets.adjust(key, -2)
+        self.assertEqual(PhoneFacetCount.objects.get(**key).count, 1)
+        phone.delete()
+        self.assertEqual(PhoneFacetCount.objects.get(**key).count, 0)
+        self.assertFalse(PhoneFacetCount.objects.filter(count__lt=0).exists())
+
+    def test_migration_backfills_existing_phones(self):
+        for price in ('50.00', '150.00', '150.00', '2000.00'):
+            self.add_phone(base_price=Decimal(price))
+        facets.rebuild()
+        rebuilt = self.cells()
+        PhoneFacetCount.objects.all().delete()
+        migration = importlib.import_module('inventory.migrations.0011_phonefacetcount')
+        migration.backfill_facet_counts(django_apps, None)
+        self.assertEqual(self.cells(), rebuilt)
+
+
+class StockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phone = Phone.objects.create(name='Pixel', base_price=Decimal('300.00'), condition='Good', stock=2)
+        cls.cart = Cart.objects.create(user=User.objects.create_user('buyer'))
+
+    def stock_left(self):
+        return Phone.objects.get(pk=self.phone.pk).stock
+
+    def test_buy_never_goes_below_zero(self):
+        stock.buy(self.phone)
+        stock.buy(self.phone)
+        with self.assertRaises(stock.OutOfStock):
+            stock.buy(self.phone)
+        self.assertEqual(self.stock_left(), 0)
+        self.assertEqual(Order.objects.filter(order_type='BUY').count(), 2)
+
+    def test_checkout_consumes_reservation(self):
+        stock.reserve(self.cart, self.phone)
+        CartItem.objects.create(cart=self.cart, phone=self.phone)
+        self.assertEqual(self.stock_left(), 1)
+        orders = stock.checkout(self.cart)
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(self.stock_left(), 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_checkout_fails_atomically_when_stock_runs_out(self):
+        CartItem.objects.create(cart=self.cart, phone=self.phone, quantity=3)
+        with self.assertRaises(stock.OutOfStock):
+            stock.checkout(self.cart)
+        self.assertEqual(self.stock_left(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_expired_reservations_return_stock(self):
+        stock.reserve(self.cart, self.phone, quantity=2)
+        self.assertEqual(self.stock_left(), 0)
+        self.assertEqual(stock.expire_reservations(now=timezone.now() + timedelta(hours=1)), 1)
+        self.assertEqual(self.stock_left(), 2)
+
+    def test_buy_button_places_buy_order(self):
+        self.client.post(reverse('create_order', args=[self.phone.pk]), {'order_type': 'BUY'})
+        self.assertEqual(self.stock_left(), 1)
+
+
+
+class ListingEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.x = Platform.objects.create(name='X', fee_percentage=Decimal('10.00'), fixed_fee=Decimal('1.00'))
+        cls.y = Platform.objects.create(name='Y', fee_percentage=Decimal('8.00'), fixed_fee=Decimal('2.00'))
+        for i, condition in enumerate(['New', 'Good', 'Scrap']):
+            Phone.objects.create(name=f'Phone {i}', base_price=Decimal('100.00') + i, condition=condition, stock=1)
+
+    def setUp(self):
+        cache.clear()
+        conditions.invalidate()
+
+    def test_bulk_prices_match_per_listing_calculation(self):
+        run = listings.list_phones(batch_size=2)
+        self.assertEqual(run.listings, 6)
+        for listing in Listing.objects.select_related('phone', 'platform'):
+            self.assertEqual(listing.platform_price, listing.calculate_platform_price().quantize(Decimal('0.01')))
+            self.assertEqual(listing.platform_condition_category, listing.map_condition_to_platform())
+            self.assertTrue(listing.is_listed)
+
+    def test_potential_listings_are_cached_until_a_listing_changes(self):
+        phone = Phone.objects.get(name='Phone 1')
+        items = listings.potential_listings(phone)
+        self.assertEqual([item['platform'].name for item in items], ['X', 'Y'])
+        self.assertTrue(all(item['can_list'] and item['is_profitable'] for item in items))
+        self.assertEqual(items[0]['listing'].platform_condition_category, 'Good')
+        with self.assertNumQueries(0):
+            listings.potential_listings(phone)
+
+        Listing.objects.create(phone=phone, platform=self.x, platform_price=Decimal('120.00'), is_listed=True)
+        items = listings.potential_listings(phone)
+        self.assertTrue(items[0]['listing'].is_listed)
+
+    def test_potential_listings_follow_phone_changes(self):
+        phone = Phone.objects.get(name='Phone 1')
+        listings.potential_listings(phone)
+        phone.stock = 0
+        phone.save()
+        self.assertFalse(any(item['can_list'] for item in listings.potential_listings(phone)))
+
+    def test_reprice_after_fee_change(self):
+        listings.list_phones()
+        Listing.objects.filter(platform=self.x).update(is_listed=False)
+        Platform.objects.filter(pk=self.x.pk).update(fee_percentage=Decimal('20.00'))
+        x = Platform.objects.get(pk=self.x.pk)
+        run = listings.reprice_platform(x)
+        self.assertEqual(run.listings, 3)
+        listing = Listing.objects.select_related('phone', 'platform').filter(platform=x).first()
+        self.assertEqual(listing.platform_price, listing.calculate_platform_price().quantize(Decimal('0.01')))
+        self.assertFalse(Listing.objects.filter(platform=x, is_listed=True).exists())
+
+
+    def test_listings_that_cant_be_priced_are_delisted(self):
+        listings.list_phones()
+        phone = Phone.objects.get(name='Phone 0')
+        Phone.objects.filter(pk=phone.pk).update(base_price=Decimal('0.00'))
+        run = listings.reprice_platform(self.x)
+        self.assertEqual((run.listings, run.skipped, run.delisted), (2, 1, 1))
+        self.assertIn('1 skipped, 1 delisted', str(run))
+        self.assertFalse(Listing.objects.get(phone=phone, platform=self.x).is_listed)
+        self.assertTrue(Listing.objects.get(phone=phone, platform=self.y).is_listed)
+        run = listings.list_phones()
+        self.assertEqual((run.skipped, run.delisted), (2, 1))
+        self.assertFalse(Listing.objects.filter(phone=phone, is_listed=True).exists())
+        self.assertEqual(Listing.objects.filter(is_listed=True).count(), 4)
+
+class ConditionMappingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.y = Platform.objects.create(name='Y', fee_percentage=Decimal('8.00'), fixed_fee=Decimal('2.00'))
+        cls.phone = Phone.objects.create(name='Pixel', base_price=Decimal('300.00'), condition='Good', stock=1)
+
+    def setUp(self):
+        # Rolling back a test's transaction doesn't send the signals that invalidate the cache.
+        conditions.invalidate()
+
+    def test_new_platform_is_seeded_and_unmapped_platform_is_unknown(self):
+        other = Platform.objects.create(name='W', fee_percentage=Decimal('5.00'))
+        self.assertEqual(conditions.platform_category(self.y.pk, 'New'), '3 stars (Excellent)')
+        self.assertEqual(conditions.platform_category(other.pk, 'New'), conditions.UNKNOWN)
+
+    def test_bulk_mapping_runs_no_queries(self):
+        rows = [Listing(phone=self.phone, platform=self.y, platform_price=1) for _ in range(1000)]
+        conditions.mappings()
+        with self.assertNumQueries(0):
+            conditions.map_listings(rows)
+        self.assertEqual({listing.platform_condition_category for listing in rows}, {'2 stars (Good)'})
+
+    def test_admin_edit_invalidates_cache(self):
+        conditions.mappings()
+        mapping = PlatformConditionMapping.objects.get(platform=self.y, general_condition='Good')
+        mapping.platform_category = '2 stars (Very Good)'
+        mapping.save()
+        self.assertEqual(conditions.platform_category(self.y.pk, 'Good'), '2 stars (Very Good)')
+
+
+    def test_mapping_change_refreshes_cached_detail_pages(self):
+        cache.clear()
+        url = reverse('phone_detail', args=[self.phone.pk])
+        self.assertContains(self.client.get(url), '2 stars (Good)')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'hit')
+        mapping = PlatformConditionMapping.objects.get(platform=self.y, general_condition='Good')
+        mapping.platform_category = '2 stars (Very Good)'
+        mapping.save()
+        self.assertContains(self.client.get(url), '2 stars (Very Good)')
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Acme')
+        Phone.objects.create(brand=cls.brand, name='Rocket', base_price=Decimal('99.00'), condition='Good', stock=3)
+
+    def setUp(self):
+        cache.clear()
+        cache_backends.reset_stats()
+
+    def test_anonymous_page_is_served_from_cache_until_a_tag_is_bumped(self):
+        first = self.client.get(reverse('home'))
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('home'))
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertNotIn(b'__csrf_token__', second.content)
+        self.assertIn(b'csrfmiddlewaretoken', second.content)
+
+        Brand.objects.create(name='Globex')
+        third = self.client.get(reverse('home'))
+        self.assertEqual(third['X-Page-Cache'], 'miss')
+        self.assertContains(third, 'Globex')
+
+    def test_logged_in_users_are_not_served_cached_pages(self):
+        self.client.get(reverse('phone_list'))
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.assertFalse(self.client.get(reverse('phone_list')).has_header('X-Page-Cache'))
+
+    def test_stats_are_kept_per_key_family(self):
+        self.client.get(reverse('phone_list'))
+        self.client.get(reverse('phone_list'))
+        families = cache_backends.stats()
+        self.assertEqual(families['page']['misses'], 1)
+        self.assertEqual(families['page']['local_hits'], 1)
+        self.assertEqual(families['fragment:phone_card']['misses'], 1)
+
+
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phone = Phone.objects.create(name='Pixel', base_price=Decimal('300.00'), condition='Good', stock=1)
+        cls.other = Phone.objects.create(name='Galaxy', base_price=Decimal('200.00'), condition='Good', stock=1)
+        cls.user = User.objects.create_user('reviewer', password='secret')
+
+    def aggregates(self, phone):
+        phone = Phone.objects.get(pk=phone.pk)
+        return phone.rating_sum, phone.rating_count, phone.rating_average
+
+    def test_add_review_view_updates_aggregates(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_review', args=[self.phone.pk]), {'rating': 5, 'comment': 'Great'})
+        self.client.post(reverse('add_review', args=[self.phone.pk]), {'rating': 2, 'comment': 'Meh'})
+        self.assertEqual(self.aggregates(self.phone), (7, 2, 3.5))
+
+    def test_edit_and_delete_adjust_aggregates(self):
+        review = Review.objects.create(phone=self.phone, user=self.user, rating=4, comment='Good')
+        review.rating = 1
+        review.save()
+        self.assertEqual(self.aggregates(self.phone), (1, 1, 1.0))
+        Review.objects.filter(pk=review.pk).delete()
+        self.assertEqual(self.aggregates(self.phone), (0, 0, 0.0))
+
+    def test_reconcile_repairs_drift(self):
+        Review.objects.create(phone=self.phone, user=self.user, rating=3, comment='Ok')
+        Phone.objects.filter(pk=self.phone.pk).update(rating_sum=40, rating_count=9, rating_average=4.4)
+        self.assertEqual(ratings.reconcile(dry_run=True), 1)
+        self.assertEqual(ratings.reconcile(), 1)
+        self.assertEqual(self.aggregates(self.phone), (3, 1, 3.0))
+        self.assertEqual(ratings.reconcile(), 0)
+
+    def test_sort_and_filter_by_rating_use_the_index(self):
+        Review.objects.create(phone=self.other, user=self.user, rating=5, comment='Love it')
+        Review.objects.create(phone=self.phone, user=self.user, rating=3, comment='Ok')
+        catalog = CatalogQuery({'sort': 'rating', 'min_rating': '4'})
+        self.assertEqual([phone.name for phone in catalog.page().items], ['Galaxy'])
+        self.assertIn('phone_rating_id_idx', catalog.queryset().explain())
+
+
+class FeedTests(TestCase):
+    FEED = (
+        'sku,brand,name,base_price,condition,stock,memory,color,camera_quality\n'
+        'A1,Acme,Rocket,199.99,Good,4,128,Black,12MP\n'
+        'A2,acme,Comet,99.00,New,1,64,,\n'
+        'A3,Nope,Ghost,10.00,Good,1,64,,\n'
+        'A4,Acme,Cheap,-1,Mint,1,64,,\n'
+        'A1,Acme,Rocket 2,249.99,Good,6,256,Black,12MP\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Acme')
+
+    def test_import_upserts_valid_rows_and_reports_bad_ones(self):
+        stats = feeds.import_feed(io.StringIO(self.FEED), 'csv', batch_size=2)
+        self.assertEqual((stats.read, stats.rejected), (5, 2))
+        self.assertEqual([line for line, error in stats.errors], [4, 5])
+        self.assertEqual(Phone.objects.count(), 2)
+        rocket = Phone.objects.get(sku='A1')
+        self.assertEqual((rocket.name, rocket.stock, rocket.brand_id), ('Rocket 2', 6, self.brand.pk))
+
+    def test_partial_feed_only_updates_its_columns(self):
+        feeds.import_feed(io.StringIO(self.FEED), 'csv')
+        feeds.import_feed(io.StringIO('sku,name,base_price,condition\nA2,Comet,89.00,New\n'), 'csv')
+        comet = Phone.objects.get(sku='A2')
+        self.assertEqual((comet.base_price, comet.stock, comet.memory), (Decimal('89.00'), 1, 64))
+
+    def test_blank_or_missing_values_leave_existing_ones_alone(self):
+        feeds.import_feed(io.StringIO(self.FEED), 'csv')
+        feeds.import_feed(io.StringIO(
+            'sku,brand,name,base_price,condition,stock,memory\nA2,,Comet,89.00,New,,\nA5,,Nova,50.00,New,,\n'
+        ), 'csv')
+        feeds.import_feed(io.StringIO(
+            '{"sku": "A1", "name": "Rocket", "base_price": "199.00", "condition": "Good", "stock": 2, "memory": 64}\n'
+            '{"sku": "A2", "name": "Comet", "base_price": "79.00", "condition": "New"}\n'
+        ), 'jsonl')
+        comet, rocket = Phone.objects.get(sku='A2'), Phone.objects.get(sku='A1')
+        self.assertEqual((comet.base_price, comet.stock, comet.memory, comet.brand_id), (Decimal('79.00'), 1, 64, self.brand.pk))
+        self.assertEqual((rocket.stock, rocket.memory, rocket.color), (2, 64, 'Black'))
+        self.assertEqual(Phone.objects.get(sku='A5').stock, Phone._meta.get_field('stock').default)
+
+    def test_export_round_trips_through_import(self):
+        feeds.import_feed(io.StringIO(self.FEED), 'csv')
+        exported = io.StringIO()
+        self.assertEqual(feeds.write_feed(exported, 'jsonl', feeds.export_rows()), 2)
+        Phone.objects.update(stock=0)
+        exported.seek(0)
+        stats = feeds.import_feed(exported, 'jsonl', key='id')
+        self.assertEqual((stats.written, stats.rejected), (2, 0))
+        self.assertEqual(Phone.objects.get(sku='A1').stock, 6)
+
+    def test_missing_key_column_is_refused(self):
+        with self.assertRaises(feeds.FeedError):
+            feeds.import_feed(io.StringIO('name,base_price,condition\nX,1,Good\n'), 'csv')
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name, IMAGE_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        self.phone = Phone.objects.create(name='Rocket', base_price=Decimal('199.00'), condition='Good', stock=1)
+
+    def png(self, name, size=(400, 300)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 40, 40)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_upload_makes_derivatives_for_the_picture_tag(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        form = {'name': 'Rocket', 'base_price': '199.00', 'condition': 'Good', 'stock': 1, 'memory': 128, 'image': self.png('rocket.png')}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('phone_edit', args=[self.phone.pk]), form)
+        self.phone.refresh_from_db()
+        variants = self.phone.image_variants
+        self.assertEqual((variants['source'], variants['width']), (self.phone.image.name, 400))
+        self.assertEqual([width for width, name in variants['formats']['avif']], [160, 320, 400])
+        for width, name in variants['formats']['webp']:
+            with Image.open(default_storage.open(name)) as derivative:
+                self.assertEqual((derivative.format, derivative.width), ('WEBP', width))
+
+        html = self.client.get(reverse('phone_detail', args=[self.phone.pk])).content.decode()
+        self.assertIn('<source type="image/avif" srcset="/media/derivatives/phone_images/rocket', html)
+        self.assertIn(' 160w, ', html)
+
+    def test_backfill_skips_current_files_and_tag_ignores_stale_variants(self):
+        self.phone.image = default_storage.save('phone_images/old.png', self.png('old.png'))
+        self.phone.save()
+        Phone.objects.create(name='Twin', base_price=Decimal('99.00'), condition='New', image=self.phone.image.name)
+        out = io.StringIO()
+        call_command('build_image_derivatives', source=['phone'], stdout=out)
+        self.assertIn('1 files for 2 rows', out.getvalue())
+        call_command('build_image_derivatives', source=['phone'], stdout=out)
+        self.assertIn('inventory.Phone.image: 0 files to process', out.getvalue())
+
+        phone = Phone.objects.get(pk=self.phone.pk)
+        self.assertIn('<picture>', picture(phone.image, phone.image_variants, alt='Rocket'))
+        phone.image = 'phone_images/new.png'
+        html = picture(phone.image, phone.image_variants, alt='Rocket')
+        self.assertTrue(html.startswith('<img src="/media/phone_images/new.png"'), html)
+
+
+class FileServerTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        os.makedirs(os.path.join(self.root, 'phone_images'))
+        self.data = bytes(range(256)) * 40
+        with open(os.path.join(self.root, 'phone_images', 'x.jpg'), 'wb') as file:
+            file.write(self.data)
+        self.factory = RequestFactory()
+
+    def get(self, path, **headers):
+        request = self.factory.get('/media/' + path, headers=headers)
+        response = fileserver.serve(request, path, self.root, fileserver.media_cache_control)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_etag_and_conditional_requests(self):
+        response, body = self.get('phone_images/x.jpg')
+        self.assertEqual((response.status_code, body), (200, self.data))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+        response, body = self.get('phone_images/x.jpg', if_none_match=response['ETag'])
+        self.assertEqual((response.status_code, body), (304, b''))
+        with self.assertRaises(Http404):
+            self.get('../x.jpg')
+
+    def test_byte_ranges(self):
+        response, body = self.get('phone_images/x.jpg', range='bytes=100-199')
+        self.assertEqual((response.status_code, body), (206, self.data[100:200]))
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(self.get('phone_images/x.jpg', range='bytes=-10')[1], self.data[-10:])
+        self.assertEqual(self.get('phone_images/x.jpg', range='bytes=10000-')[1], self.data[10000:])
+        self.assertEqual(self.get('phone_images/x.jpg', range='bytes=20000-')[0].status_code, 416)
+        # A stale If-Range validator gets the whole file.
+        response, body = self.get('phone_images/x.jpg', range='bytes=0-9', if_range='"stale"')
+        self.assertEqual((response.status_code, len(body)), (200, len(self.data)))
+
+    def test_collectstatic_hashes_and_precompresses(self):
+        with tempfile.TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            hashed = staticfiles_storage.stored_name('admin/css/base.css')
+            self.assertRegex(hashed, r'^admin/css/base\.[0-9a-f]{12}\.css$')
+            self.assertTrue(os.path.exists(os.path.join(static_root, hashed + '.gz')))
+            self.assertEqual(fileserver.static_cache_control(hashed), fileserver.IMMUTABLE)
+
+            request = self.factory.get('/static/' + hashed, headers={'accept_encoding': 'gzip, deflate'})
+            response = fileserver.serve(request, hashed, static_root, precompressed=True)
+            body = b''.join(response.streaming_content)
+            response.close()
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            with open(os.path.join(static_root, hashed), 'rb') as original:
+                self.assertEqual(gzip.decompress(body), original.read())
+
+
+class DatabaseTests(TestCase):
+    def test_connections_are_tuned(self):
+        self.assertEqual(database.pragma(connection, 'synchronous'), 1)
+        self.assertEqual(database.pragma(connection, 'busy_timeout'), 5000)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory.name, 'db.sqlite3'), PRAGMAS={'query_only': 'ON'})
+        replica = type(connections['default'])(settings_dict, alias='scratch_replica')
+        self.addCleanup(replica.close)
+        self.assertEqual(database.pragma(replica, 'journal_mode'), 'wal')
+        with self.assertRaises(OperationalError), replica.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (id integer)')
+
+    def route(self, method, view_func):
+        router = database.ReadReplicaRouter()
+        request = RequestFactory().generic(method, '/')
+
+        def get_response(request):
+            middleware.process_view(request, view_func, (), {})
+            return router.db_for_read(Phone)
+
+        middleware = database.ReadReplicaMiddleware(get_response)
+        # TestCase keeps a transaction open, which pins reads to 'default'.
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            return middleware(request)
+
+    def test_list_and_detail_reads_go_to_the_replica(self):
+        self.assertEqual(self.route('GET', views.PhoneListView.as_view()), 'replica')
+        self.assertEqual(self.route('HEAD', views.PhoneDetailView.as_view()), 'replica')
+        self.assertIsNone(self.route('GET', views.HomeView.as_view()))
+        self.assertIsNone(self.route('POST', views.QueryDeleteView.as_view()))
+        self.assertIsNone(self.route('GET', views.view_cart))
+        self.assertEqual(database.ReadReplicaRouter().db_for_write(Phone), 'default')
+        self.assertIsNone(database.ReadReplicaRouter().db_for_read(Phone))
+
+
+@override_settings(QUERY_BUFFER_FLUSH_INTERVAL=None, QUERY_BUFFER_SPOOL=None)
+class QueryBufferTests(TestCase):
+    def setUp(self):
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.spool = spool.name
+
+    def test_queries_are_written_in_one_batch_with_their_submission_time(self):
+        buffer = querybuffer.QueryBuffer(flush_interval=None, spool=self.spool)
+        submitted = timezone.now() - timedelta(minutes=5)
+        for name in ('A', 'B', 'C'):
+            buffer.submit(Query(name=name, email='a@example.com', message='Hi', created_at=submitted))
+        self.assertEqual((len(buffer), Query.objects.count()), (3, 0))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(set(Query.objects.values_list('created_at', flat=True)), {submitted})
+        self.assertEqual((len(buffer), os.listdir(self.spool)), (0, []))
+
+    @override_settings(QUERY_BUFFER_SIZE=1)
+    def test_full_buffer_answers_503(self):
+        form = {'name': 'A', 'email': 'a@example.com', 'message': 'Hi'}
+        self.assertEqual(self.client.post(reverse('submit_query'), form).json(), {'success': True})
+        response = self.client.post(reverse('submit_query'), form)
+        self.assertEqual((response.status_code, response['Retry-After']), (503, str(querybuffer.RETRY_AFTER)))
+        self.assertFalse(response.json()['success'])
+        self.assertEqual(self.client.post(reverse('sell_new_model'), {'name': 'B', 'email': 'b@example.com'}).status_code, 503)
+        self.assertEqual(querybuffer.flush(), 1)
+        self.assertEqual(self.client.post(reverse('sell_new_model'), {'name': 'B', 'email': 'b@example.com'}).status_code, 302)
+
+    def test_spooled_queries_survive_a_crash(self):
+        crashed = querybuffer.QueryBuffer(flush_interval=None, spool=self.spool)
+        crashed.submit(Query(name='A', email='a@example.com', message='Hi'))
+        crashed.submit(Query(name='B', email='b@example.com', message='Hello'))
+        # The process dies before the writer thread gets to the queries.
+        crashed._file.close()
+        with open(os.path.join(self.spool, f'{os.getpid()}.jsonl'), 'a') as spool:
+            spool.write('{"name": "C", "ema')
+        with self.assertLogs('inventory.querybuffer', 'WARNING'):
+            call_command('drain_query_spool', spool=self.spool, stdout=io.StringIO())
+        self.assertEqual(sorted(Query.objects.values_list('name', flat=True)), ['A', 'B'])
+        self.assertEqual(os.listdir(self.spool), [])
+
+
+    def test_invalid_queries_are_refused_at_submission(self):
+        buffer = querybuffer.QueryBuffer(flush_interval=None)
+        with self.assertRaises(ValidationError):
+            buffer.submit(Query(name='A' * 101, email='a@example.com', message='Hi'))
+        self.assertEqual(len(buffer), 0)
+        response = self.client.post(reverse('submit_query'), {'name': 'A', 'email': 'not an address', 'message': 'Hi'})
+        self.assertEqual(response.json(), {'success': False, 'error': 'Enter a valid email address.'})
+        response = self.client.post(reverse('sell_new_model'), {'name': 'B' * 101, 'email': 'b@example.com'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(querybuffer.flush(), 0)
+
+    def test_a_bad_row_is_dropped_instead_of_blocking_its_batch(self):
+        created_at = timezone.now().isoformat()
+        with open(os.path.join(self.spool, f'{os.getpid()}.jsonl'), 'w') as spool:
+            for name in ('A', None, 'C'):
+                spool.write(json.dumps({'name': name, 'email': 'a@example.com', 'message': 'Hi', 'created_at': created_at}))
+                spool.write('\n')
+        buffer = querybuffer.QueryBuffer(flush_interval=None, spool=self.spool)
+        with self.assertLogs('inventory.querybuffer', 'ERROR'):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual((len(buffer), buffer.dropped, os.listdir(self.spool)), (0, 1, []))
+        self.assertEqual(sorted(Query.objects.values_list('name', flat=True)), ['A', 'C'])
+
+class DataGenerationTests(TestCase):
+    COUNTS = dict(users=5, brands=3, platforms=2, phones=40, listings=60, orders=50, reviews=30, carts=3)
+
+    def setUp(self):
+        conditions.invalidate()
+
+    def test_generates_requested_rows_with_consistent_derived_data(self):
+        counts = datagen.Generator(seed=7, batch_size=16).run(**self.COUNTS)
+        self.assertEqual((counts['phone'], counts['listing'], counts['order'], counts['review']), (40, 60, 50, 30))
+        self.assertEqual(ratings.reconcile(dry_run=True), 0)
+        self.assertFalse(Listing.objects.filter(platform_condition_category=conditions.UNKNOWN).exists())
+        user = User.objects.filter(username__startswith=datagen.USERNAME_PREFIX).first()
+        self.assertTrue(user.check_password(datagen.USER_PASSWORD))
+
+    def test_same_seed_generates_same_data(self):
+        def catalog():
+            return list(Phone.objects.order_by('pk').values_list('name', 'base_price', 'condition', 'stock', 'color'))
+
+        datagen.Generator(seed=3).run(phones=25)
+        datagen.Generator(seed=3).run(phones=25)
+        phones = catalog()
+        self.assertEqual(phones[25:], phones[:25])
+
+    def test_load_test_requests_every_scenario(self):
+        datagen.Generator(seed=1).run(**self.COUNTS)
+        users = list(User.objects.filter(username__startswith=datagen.USERNAME_PREFIX)[:2])
+        test = loadtest.LoadTest(seed=1, users=users)
+        counter = loadtest.QueryCounter()
+        rng = random.Random(0)
+        with connection.execute_wrapper(counter):
+            results = [test.request(scenario, rng, counter) for scenario in loadtest.DEFAULT_MIX]
+        self.assertTrue(all(result.status < 400 for result in results), [(r.scenario, r.status) for r in results])
+        self.assertTrue(all(result.queries for result in results if result.scenario != 'home'))
+        report = loadtest.Report(results, 1.0, 1)
+        self.assertEqual(report.errors, 0)
+        self.assertIn('p99', str(report))
+
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('list=3, detail=1'), {'list': 3, 'detail': 1})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('checkout=1')
+
+
+@override_settings(
+    ROOT_URLCONF='refurbished_project.urls_asgi',
+    QUERY_BUDGET_RAISE=True,
+    QUERY_BUFFER_FLUSH_INTERVAL=None,
+    QUERY_BUFFER_SPOOL=None,
+)
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Acme')
+        cls.phone = Phone.objects.create(brand=brand, name='Rocket', base_price=Decimal('199.00'), condition='Good', stock=3)
+        Phone.objects.create(brand=brand, name='Comet', base_price=Decimal('99.00'), condition='New', stock=1)
+        Platform.objects.create(name='X', fee_percentage=Decimal('10.00'), fixed_fee=Decimal('2.00'))
+        recommendations.rebuild()
+
+    def setUp(self):
+        cache.clear()
+        conditions.invalidate()
+
+    def test_asgi_urlconf_routes_to_async_views(self):
+        self.assertIs(resolve('/phones/').func.view_class, views.AsyncPhoneListView)
+        self.assertIs(resolve('/submit_query/').func, views.async_submit_query)
+        self.assertEqual(reverse('phone_detail', args=[1]), '/phones/1/')
+
+    async def test_storefront_pages(self):
+        for url in (reverse('home'), reverse('phone_list') + '?sort=rating', reverse('phone_detail', args=[self.phone.pk])):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+        response = await self.async_client.get(reverse('phone_detail', args=[self.phone.pk]))
+        self.assertContains(response, 'Comet')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual((await self.async_client.get(reverse('phone_detail', args=[999]))).status_code, 404)
+
+    async def test_forms_save_queries(self):
+        response = await self.async_client.post(reverse('submit_query'), {'name': 'A', 'email': 'a@example.com', 'message': 'Hi'})
+        self.assertEqual(response.json(), {'success': True})
+        response = await self.async_client.post(reverse('sell_new_model'), {'name': 'B', 'email': 'b@example.com', 'phone_name': 'Z1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(await Query.objects.acount(), 0)
+        self.assertEqual(await sync_to_async(querybuffer.flush)(), 2)
+        self.assertEqual(await Query.objects.acount(), 2)
+        self.assertEqual((await self.async_client.get(reverse('sell_new_model'))).status_code, 200)
+
+    async def test_budget_counts_async_orm_queries(self):
+        url = reverse('phone_detail', args=[self.phone.pk])
+        with mock.patch.object(resolve(url).func, 'query_budget', 0), self.assertRaises(QueryBudgetExceeded):
+            await self.async_client.get(url)
+
+
+class AnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Acme')
+        cls.phone = Phone.objects.create(
+            name='Rocket', brand=cls.brand, base_price=Decimal('100.00'), condition='Good', stock=10,
+        )
+
+    def rollup_rows(self):
+        return sorted(OrderRollup.objects.values_list(
+            'period', 'day', 'brand_id', 'condition', 'order_type', 'orders', 'units', 'revenue',
+        ))
+
+    def test_orders_update_rollups_incrementally(self):
+        stock.buy(self.phone, quantity=2)
+        stock.sell(self.phone)
+        cart = Cart.objects.create(user=User.objects.create_user('buyer'))
+        CartItem.objects.create(cart=cart, phone=self.phone, quantity=3)
+        stock.checkout(cart)
+        pending = Order.objects.create(phone=self.phone, order_type='BUY', quantity=1, total_price=Decimal('100.00'))
+
+        today = timezone.localdate()
+        report = analytics.report(today, today, 'brand')
+        self.assertEqual(len(report['rows']), 1)
+        row = report['rows'][0]
+        self.assertEqual((row['label'], row['orders'], row['units'], row['revenue']), ('Acme', 2, 5, Decimal('500.00')))
+        self.assertEqual((row['buyback_units'], row['buyback_spend']), (1, Decimal('100.00')))
+        # 5 sold, 6 left in stock.
+        self.assertEqual(row['sell_through'], round(5 / 11, 4))
+
+        pending.status = 'COMPLETED'
+        pending.save()
+        Order.objects.filter(quantity=2).get().delete()
+        self.assertEqual(analytics.report(today, today)['totals']['units'], 4)
+        incremental = self.rollup_rows()
+        analytics.rebuild()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_reports_across_months_match_raw_orders(self):
+        days = [date(2026, 1, 30), date(2026, 2, 1), date(2026, 2, 14), date(2026, 3, 1), date(2026, 3, 31), date(2026, 4, 2)]
+        for index, day in enumerate(days, 1):
+            order = stock.buy(self.phone, quantity=1)
+            Order.objects.filter(pk=order.pk).update(
+                created_at=analytics.day_start(day) + timedelta(hours=12), total_price=Decimal(index),
+            )
+        self.assertEqual(call_command('rebuild_order_rollups', stdout=io.StringIO()), None)
+
+        start, end = date(2026, 1, 31), date(2026, 4, 1)
+        expected = Order.objects.filter(
+            created_at__gte=analytics.day_start(start), created_at__lt=analytics.day_start(end + timedelta(days=1)),
+        ).aggregate(revenue=Sum('total_price'))['revenue']
+        # Whole February and March from month rows; 31 January and 1 April from day rows.
+        for group_by in analytics.GROUPINGS:
+            self.assertEqual(analytics.report(start, end, group_by)['totals']['revenue'], expected, group_by)
+        daily = analytics.report(start, end, 'day')['rows']
+        self.assertEqual(len(daily), 61)
+        self.assertEqual([row['label'] for row in daily if row['units']], ['2026-02-01', '2026-02-14', '2026-03-01', '2026-03-31'])
+
+    def test_dashboard_and_api(self):
+        stock.buy(self.phone)
+        self.assertEqual(self.client.get(reverse('analytics_api')).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        data = self.client.get(reverse('analytics_api'), {'group_by': 'condition'}).json()
+        self.assertEqual(data['rows'][0]['key'], 'Good')
+        self.assertEqual(data['totals']['revenue'], '100.00')
+        response = self.client.get(reverse('analytics_api'), {'start': '2026-02-01', 'end': '2026-01-01'})
+        self.assertEqual(response.status_code, 400)
+        for params in ({'end': '0001-01-05'}, {'end': '9999-12-31', 'group_by': 'brand'}, {'start': '0001-01-01'}):
+            response = self.client.get(reverse('analytics_api'), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['error'], 'Dates must be between 1900-01-01 and 9998-12-31.')
+        self.assertEqual(self.client.get(reverse('analytics_api'), {'end': '9998-12-31', 'group_by': 'brand'}).status_code, 200)
+        self.assertEqual(self.client.get(reverse('analytics_api'), {'start': '1900-01-01', 'end': '1900-01-31'}).status_code, 200)
+        self.assertContains(self.client.get(reverse('analytics_dashboard'), {'group_by': 'brand'}), 'Acme')
+
+
+class PricingSimulatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Acme')
+        cls.ebay = Platform.objects.create(name='eBay', fee_percentage=Decimal('12.90'), fixed_fee=Decimal('0.30'))
+        cls.flat = Platform.objects.create(name='Flat', fee_percentage=Decimal('100.00'), fixed_fee=Decimal('0'))
+        prices = ['0.00', '0.01', '99.99', '100.00', '123.45', '1499.99']
+        for index, price in enumerate(prices):
+            Phone.objects.create(name=f'Phone {index}', brand=brand, base_price=Decimal(price), stock=index)
+
+    def test_prices_match_decimal_arithmetic(self):
+        rng = random.Random(0)
+        base = pricing.np.array([[rng.randint(-100, 200_000)] for _ in range(2000)] + [[0], [1], [12345]])
+        fees = [Decimal(rng.randint(0, 10_000)) / 100 for _ in range(8)] + [Decimal('12.50'), Decimal('100.00')]
+        fixed = [Decimal(rng.randint(0, 500)) / 100 for _ in fees]
+        for margin in (Decimal(0), Decimal('7.33')):
+            prices = pricing.selling_prices(
+                base, pricing.np.array([[pricing.hundredths(fee) for fee in fees]]),
+                pricing.np.array([[pricing.cents(amount) for amount in fixed]]), pricing.hundredths(margin),
+            )
+            for (phone_cents,), row in zip(base.tolist(), prices.tolist()):
+                for fee, fixed_fee, price in zip(fees, fixed, row):
+                    expected = pricing.reference_price(Decimal(phone_cents) / 100, fee, fixed_fee, margin)
+                    self.assertEqual(Decimal(price) / 100, expected, (phone_cents, fee, fixed_fee, margin))
+
+    def test_current_fees_reproduce_listing_prices(self):
+        simulation = pricing.simulate(verify=10)
+        self.assertTrue(simulation.verified)
+        self.assertEqual((simulation.phones, simulation.cells, simulation.checked), (6, 12, 12))
+        ebay, flat = sorted(simulation.platforms, key=lambda row: row['name'] != 'eBay')
+        phones = Phone.objects.filter(base_price__gt=0)
+        expected = [Decimal(Listing(phone=phone, platform=self.ebay).calculate_platform_price()) for phone in phones]
+        self.assertEqual(ebay['priced'], 5)
+        self.assertEqual(ebay['current_mean_price'], (sum(expected) / 5).quantize(Decimal('0.01'), 'ROUND_DOWN'))
+        self.assertEqual(ebay['current_mean_price'], ebay['scenario_mean_price'])
+        self.assertFalse(ebay['changed'])
+        # A 100% fee leaves the base price, which loses the whole fee.
+        self.assertEqual(flat['current_losing'], 5)
+
+    def test_fee_rise_without_repricing_loses_money(self):
+        current = [pricing.Terms.of(self.ebay)]
+        scenario, margin = pricing.parse_scenario({f'fee_{self.ebay.pk}': '15', 'margin': '10'}, current)
+        simulation = pricing.simulate(scenario, margin, current=current)
+        row = simulation.platforms[0]
+        self.assertTrue(row['changed'])
+        # The $0.01 phone still breaks even once its fee is rounded to the cent.
+        self.assertEqual(row['current_losing'], 4)
+        self.assertLess(row['current_stock_profit'], 0)
+        self.assertEqual(row['scenario_losing'], 0)
+        self.assertGreater(row['scenario_stock_profit'], 0)
+        self.assertGreater(row['mean_price_change'], 0)
+        for params in (
+            {f'fee_{self.ebay.pk}': '101'}, {f'fixed_{self.ebay.pk}': 'x'}, {'margin': '100'},
+            {f'fee_{self.ebay.pk}': 'NaN'}, {f'fixed_{self.ebay.pk}': 'sNaN'}, {'margin': 'Infinity'}, {'margin': 'nan'},
+        ):
+            with self.assertRaises(ValueError):
+                pricing.parse_scenario(params, current)
+
+    def test_simulator_page_and_command(self):
+        url = reverse('pricing_simulator')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(url, {f'fee_{self.ebay.pk}': '20', 'margin': '5'})
+        self.assertContains(response, 'eBay')
+        self.assertContains(response, '12 sampled prices checked')
+        self.assertContains(self.client.get(url, {'margin': 'lots'}), 'The target margin must be a number')
+        self.assertContains(self.client.get(url, {'margin': 'NaN'}), 'The target margin must be a number')
+
+        out = io.StringIO()
+        call_command('simulate_pricing', '--fee', 'ebay=15:0.50', '--target-margin', '10', stdout=out)
+        self.assertIn('12 sampled prices match', out.getvalue())
+        out = io.StringIO()
+        call_command('simulate_pricing', '--synthetic', '5000', '--synthetic-platforms', '3', '--chunk-size', '999', stdout=out)
+        self.assertIn('15,000 prices', out.getvalue())
+
+
+class CartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Acme')
+        cls.phone = Phone.objects.create(name='Rocket', brand=brand, base_price=Decimal('100.00'), stock=3)
+        cls.other = Phone.objects.create(name='Comet', brand=brand, base_price=Decimal('50.00'), stock=1)
+        cls.user = User.objects.create_user('buyer', password='secret')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_cart_lives_in_a_signed_cookie(self):
+        self.client.post(reverse('add_to_cart', args=[self.phone.pk]))
+        self.client.post(reverse('add_to_cart', args=[self.phone.pk]))
+        self.client.post(reverse('add_to_cart', args=[self.other.pk]))
+        response = self.client.post(reverse('add_to_cart', args=[self.other.pk]))
+        self.assertRedirects(response, reverse('phone_detail', args=[self.other.pk]), fetch_redirect_response=False)
+        request = RequestFactory().get('/')
+        request.COOKIES = {cart.COOKIE_NAME: self.client.cookies[cart.COOKIE_NAME].value}
+        self.assertEqual(cart.cookie_cart(request).quantities, {self.phone.pk: 2, self.other.pk: 1})
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(Phone.objects.get(pk=self.phone.pk).stock, 3)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('cart'))
+        self.assertContains(response, 'Total: $250.00')
+        self.assertContains(response, 'data-cart-count>3</span>')
+
+        self.client.cookies[cart.COOKIE_NAME] = 'tampered'
+        self.assertContains(self.client.get(reverse('cart')), 'Your cart is empty.')
+
+    def test_badge_on_cached_pages_is_per_visitor(self):
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(reverse('home')), 'data-cart-count>0</span>')
+        self.client.post(reverse('add_to_cart', args=[self.phone.pk]))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'data-cart-count>1</span>')
+
+    def test_cart_is_merged_on_login(self):
+        user_cart = Cart.objects.create(user=self.user)
+        cart.add(user_cart, self.phone)
+        self.client.post(reverse('add_to_cart', args=[self.phone.pk]))
+        self.client.post(reverse('add_to_cart', args=[self.other.pk]))
+        Phone.objects.filter(pk=self.other.pk).update(stock=0)
+
+        response = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'secret'})
+        self.assertEqual(response.cookies[cart.COOKIE_NAME].value, '')
+        self.assertEqual(list(user_cart.items.values_list('phone_id', 'quantity')), [(self.phone.pk, 2)])
+        self.assertEqual(user_cart.reservations.get().quantity, 2)
+        self.assertEqual(Phone.objects.get(pk=self.phone.pk).stock, 1)
+        self.assertEqual(user_cart.totals(), {'count': 2, 'total': Decimal('200.00')})
+
+        # The badge is counted once and then kept in the session.
+        response = self.client.get(reverse('features'))
+        self.assertContains(response, 'data-cart-count>2</span>')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('features'))
+        self.assertFalse(any('inventory_cartitem' in query['sql'] for query in queries.captured_queries))
+
+        self.client.post(reverse('remove_from_cart', args=[self.phone.pk]))
+        self.assertContains(self.client.get(reverse('features')), 'data-cart-count>0</span>')
+        self.assertEqual(Phone.objects.get(pk=self.phone.pk).stock, 3)
+
+
+    def test_cart_changes_need_a_post_with_a_csrf_token(self):
+        self.assertEqual(self.client.get(reverse('add_to_cart', args=[self.phone.pk])).status_code, 405)
+        self.assertEqual(self.client.get(reverse('remove_from_cart', args=[self.phone.pk])).status_code, 405)
+        client = Client(enforce_csrf_checks=True)
+        self.assertEqual(client.post(reverse('add_to_cart', args=[self.phone.pk])).status_code, 403)
+        response = client.get(reverse('phone_detail', args=[self.phone.pk]))
+        self.assertContains(response, f'<form method="post" action="{reverse("add_to_cart", args=[self.phone.pk])}"')
+        token = client.cookies['csrftoken'].value
+        response = client.post(reverse('add_to_cart', args=[self.phone.pk]), {'csrfmiddlewaretoken': token})
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        self.assertContains(client.get(reverse('cart')), f'action="{reverse("remove_from_cart", args=[self.phone.pk])}"')
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.acme = Brand.objects.create(name='Acme')
+        cls.globex = Brand.objects.create(name='Globex')
+        rng = random.Random(1)
+        cls.phones = [
+            Phone.objects.create(
+                name=f'Phone {index}', brand=rng.choice([cls.acme, cls.globex]),
+                base_price=Decimal(rng.randint(5000, 90000)) / 100, condition=rng.choice(['New', 'Good', 'Usable']),
+                memory=rng.choice([64, 128, 256]), camera_quality=rng.choice(['12MP', '48MP', '']),
+                color=rng.choice(['Black', 'Blue']), stock=3,
+            )
+            for index in range(30)
+        ]
+
+    def lists(self):
+        return sorted(PhoneRecommendation.objects.values_list('phone_id', 'rank', 'related_id'))
+
+    def test_rebuild_and_detail_page(self):
+        self.assertEqual(PendingRecommendation.objects.count(), 30)
+        call_command('rebuild_recommendations', stdout=io.StringIO())
+        self.assertFalse(PendingRecommendation.objects.exists())
+        phone = self.phones[0]
+        with self.assertNumQueries(1):
+            related = list(recommendations.related_phones(phone.pk))
+        self.assertEqual(len(related), 4)
+        self.assertNotIn(phone, related)
+        scores = list(phone.recommendations.order_by('rank').values_list('score', flat=True))
+        self.assertEqual(scores, sorted(scores))
+        # An identical phone is the nearest one.
+        twin = Phone.objects.create(
+            name='Twin', brand=phone.brand, base_price=phone.base_price, condition=phone.condition,
+            memory=phone.memory, camera_quality=phone.camera_quality, color=phone.color,
+        )
+        recommendations.update()
+        self.assertEqual(recommendations.related_phones(phone.pk)[0], twin)
+        self.assertContains(self.client.get(reverse('phone_detail', args=[phone.pk])), 'Twin')
+
+    def test_incremental_updates_match_a_full_rebuild(self):
+        recommendations.rebuild()
+        moved, deleted = self.phones[3], self.phones[7]
+        moved.base_price = self.phones[20].base_price
+        moved.brand = self.phones[20].brand
+        moved.save()
+        queued = [moved.pk, deleted.pk]
+        deleted.delete()
+        self.assertEqual(PendingRecommendation.objects.filter(phone_id__in=queued).count(), 2)
+        recommendations.update()
+        incremental = self.lists()
+        recommendations.rebuild()
+        self.assertEqual(self.lists(), incremental)
+
+    def test_co_purchases_and_sales_pull_phones_together(self):
+        cheap = min(self.phones, key=lambda phone: phone.base_price)
+        dear = max(self.phones, key=lambda phone: phone.base_price)
+        for index in range(3):
+            user_cart = Cart.objects.create(user=User.objects.create_user(f'buyer{index}'))
+            CartItem.objects.create(cart=user_cart, phone=cheap)
+            CartItem.objects.create(cart=user_cart, phone=dear)
+        with override_settings(RECOMMENDATION_WINDOW=2):
+            recommendations.rebuild()
+        self.assertIn(dear, recommendations.related_phones(cheap.pk))
+        self.assertIn(cheap, recommendations.related_phones(dear.pk))
+
+
+class PerfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Acme')
+        cls.phone = Phone.objects.create(name='Rocket', brand=brand, base_price=Decimal('100.00'), stock=3)
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        perf.reset()
+
+    def test_records_queries_sql_and_template_time_per_view(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+        queries = len(captured)
+        self.client.get(reverse('phone_list'))
+        self.client.get('/no-such-page/')
+        detail, listing, missing = perf.recent()
+        self.assertEqual((detail.view, detail.method, detail.status), ('phone_detail', 'GET', 200))
+        self.assertEqual(detail.queries, queries)
+        self.assertGreater(detail.sql_seconds, 0)
+        self.assertGreater(detail.template_seconds, 0)
+        self.assertAlmostEqual(
+            detail.sql_seconds + detail.template_seconds + detail.python_seconds, detail.seconds, places=6,
+        )
+        self.assertEqual((listing.view, missing.view, missing.status), ('phone_list', '', 404))
+        rows = {row['view']: row for row in perf.summary()}
+        self.assertEqual(rows['phone_detail']['requests'], 1)
+        self.assertEqual(rows['phone_detail']['queries_max'], queries)
+        self.assertLessEqual(rows['phone_detail']['p50_ms'], rows['phone_detail']['p99_ms'])
+
+    @override_settings(PERF_BUFFER_SIZE=2)
+    def test_ring_buffer_keeps_the_latest_requests(self):
+        for _ in range(2):
+            self.client.get(reverse('phone_list'))
+        self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+        self.assertEqual([entry.view for entry in perf.recent()], ['phone_list', 'phone_detail'])
+
+    def test_dashboard_is_staff_only(self):
+        url = reverse('perf_dashboard')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertContains(response, 'phone_detail')
+        self.assertContains(response, 'Profiling is off')
+
+    def test_profiles_requests_over_the_threshold(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PERF_PROFILE_SAMPLE_RATE=1, PERF_PROFILE_THRESHOLD=0, PERF_PROFILE_DIR=directory,
+                                   PERF_PROFILE_KEEP=2):
+                for _ in range(3):
+                    self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+                profiles = perf.saved_profiles()
+            self.assertEqual(len(profiles), 2)
+            self.assertIn('-phone_detail-', profiles[0]['name'])
+            stats = pstats.Stats(os.path.join(directory, profiles[0]['name']))
+            self.assertTrue(any(filename.endswith('pagecache.py') for filename, _, _ in stats.stats))
+            with override_settings(PERF_PROFILE_SAMPLE_RATE=1, PERF_PROFILE_THRESHOLD=60, PERF_PROFILE_DIR=directory):
+                self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+                self.assertEqual(len(perf.saved_profiles()), 2)
+
+
+@override_settings(QUERY_BUFFER_FLUSH_INTERVAL=None, QUERY_BUFFER_SPOOL=None)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Acme')
+        cls.phone = Phone.objects.create(name='Rocket', brand=brand, base_price=Decimal('100.00'), stock=1)
+        platform = Platform.objects.create(name='X', fee_percentage=Decimal('10.00'), fixed_fee=Decimal('1.00'))
+        Listing.objects.create(
+            phone=cls.phone, platform=platform, platform_price=Decimal('112.22'), platform_condition_category='Good',
+            is_listed=True,
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(METRICS_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+    def scrape(self, **headers):
+        response = self.client.get('/metrics', headers=headers)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_value_file_grows_and_is_carried_on(self):
+        path = os.path.join(self.directory, 'values.db')
+        values = metrics.ValueFile(path)
+        keys = [f'key {index}' * 40 for index in range(300)]
+        values.add([(key, index) for index, key in enumerate(keys)])
+        values.add([(keys[0], 0.5)])
+        values.close()
+        self.assertGreater(os.path.getsize(path), metrics.INITIAL_FILE_SIZE)
+        values = metrics.ValueFile(path)
+        values.add([(keys[1], 1)])
+        values.close()
+        with open(path, 'rb') as f:
+            found = {key: value for key, _, value in metrics.read_entries(f.read())}
+        self.assertEqual(len(found), 300)
+        self.assertEqual((found[keys[0]], found[keys[1]], found[keys[299]]), (0.5, 2, 299))
+
+    def test_counters_add_up_over_processes(self):
+        metrics.STOCK_OUTS.inc()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                metrics.STOCK_OUTS.inc(amount=2)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertIn('inventory_stock_outs_total 3.0\n', self.scrape())
+
+    def test_requests_and_business_events(self):
+        self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.buy(self.phone)
+        with self.assertRaises(stock.OutOfStock):
+            stock.buy(self.phone)
+        self.client.post(reverse('submit_query'), {'name': 'A', 'email': 'a@example.com', 'message': 'Hi'})
+        self.assertEqual(querybuffer.flush(), 1)
+        text = self.scrape()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="phone_detail",method="GET",le="+Inf"} 1.0', text)
+        self.assertIn('http_request_duration_seconds_count{view="phone_detail",method="GET"} 1.0', text)
+        self.assertIn('http_requests_total{view="phone_detail",method="GET",status="200"} 1.0', text)
+        self.assertRegex(text, r'inventory_db_queries_total\{view="phone_detail"\} [1-9]')
+        self.assertRegex(text, r'inventory_cache_lookups_total\{family="page",outcome="misses"\} [1-9]')
+        self.assertRegex(text, r'inventory_cache_hit_ratio\{family="page"\} ')
+        self.assertIn('inventory_orders_created_total{type="BUY",status="COMPLETED"} 1.0', text)
+        self.assertIn('inventory_stock_outs_total 1.0', text)
+        self.assertIn('inventory_query_submissions_total{outcome="accepted"} 1.0', text)
+        self.assertIn('inventory_listings{platform="X",listed="true"} 1.0', text)
+        self.assertIn('inventory_phones_out_of_stock 1.0', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.REQUEST_LATENCY
+        for seconds in (0.001, 0.02, 0.02, 30):
+            histogram.observe(seconds, 'test_view', 'GET')
+        lines = [line for line in self.scrape().splitlines() if 'view="test_view"' in line]
+        self.assertIn('http_request_duration_seconds_bucket{view="test_view",method="GET",le="0.005"} 1.0', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="test_view",method="GET",le="0.025"} 3.0', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="test_view",method="GET",le="10.0"} 3.0', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="test_view",method="GET",le="+Inf"} 4.0', lines)
+        self.assertIn('http_request_duration_seconds_sum{view="test_view",method="GET"} 30.041', lines)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer nope'}).status_code, 401)
+        self.assertIn('# TYPE inventory_listings gauge', self.scrape(Authorization='Bearer s3cret'))
+
+
+class TestRunnerTests(TestCase):
+    def test_suite_keeps_away_from_the_servers_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            isolated = runner.isolated_settings(directory)
+            self.assertEqual(isolated['METRICS_DIR'], os.path.join(directory, 'metrics'))
+            self.assertEqual(isolated['QUERY_BUFFER_SPOOL'], os.path.join(directory, 'query_spool'))
+            shared = isolated['CACHES']['default']['OPTIONS']['SHARED']
+            self.assertEqual(shared['LOCATION'], os.path.join(directory, 'cache', 'default-shared'))
+        # manage.py test runs under inventory.runner, so these are already temporary.
+        directory = os.path.dirname(metrics.metrics_dir())
+        self.assertTrue(os.path.basename(directory).startswith('refurbished_project_tests_'))
+        self.assertEqual(cache.shared._dir, os.path.join(directory, 'cache', 'default-shared'))
+
+
+@override_settings(BULK_JOB_CHUNK_SIZE=2)
+class AdminBulkJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Acme')
+        cls.phones = [
+            Phone.objects.create(name=f'Phone {stock}', brand=cls.brand, base_price=Decimal('100.00'), stock=stock)
+            for stock in range(1, 8)
+        ]
+        cls.platform = Platform.objects.create(name='X', fee_percentage=Decimal('10.00'), fixed_fee=Decimal('1.00'))
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def run_jobs(self):
+        call_command('run_workers', '--burst', '--workers', '1', stdout=io.StringIO())
+
+    def test_estimated_count(self):
+        self.assertEqual(database.estimated_count(Phone.objects.all()), 7)
+        self.assertEqual(database.estimated_count(Phone.objects.all(), exact_below=0), 7)
+        self.phones[3].delete()
+        # The rowid span still counts the deleted row until the estimate gets small enough to count.
+        self.assertEqual(database.estimated_count(Phone.objects.all(), exact_below=0), 7)
+        self.assertEqual(database.estimated_count(Phone.objects.all()), 6)
+        self.assertIsNone(database.estimated_count(Phone.objects.filter(stock=1)))
+
+    def test_changelists(self):
+        for model in ('phone', 'listing', 'order', 'review', 'cart', 'query', 'homepageimage', 'bulkjob'):
+            response = self.client.get(reverse(f'admin:inventory_{model}_changelist'))
+            self.assertEqual(response.status_code, 200, model)
+        response = self.client.get(reverse('admin:inventory_phone_changelist'), {'stock_range': '1-5'})
+        self.assertEqual(response.context['cl'].result_count, 5)
+        self.assertNotIn('delete_selected', dict(response.context['action_form'].fields['action'].choices))
+
+    def test_set_stock_of_selected_phones(self):
+        url = reverse('admin:inventory_phone_changelist')
+        selected = [phone.pk for phone in self.phones[:5]]
+        data = {'action': 'set_stock', '_selected_action': selected, 'index': 0}
+        response = self.client.post(url, data)
+        self.assertTemplateUsed(response, 'admin/inventory/phone/set_stock.html')
+        self.assertFalse(BulkJob.objects.exists())
+        response = self.client.post(url, {'action': 'set_stock', '_selected_action': selected, 'apply': 1, 'stock': 0})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        job = BulkJob.objects.get()
+        self.assertEqual(
+            (job.status, job.params, job.description), ('queued', {'stock': 0}, 'Set stock of phones to 0 (5 selected)'),
+        )
+        self.assertEqual(job.selection, {'pks': selected})
+        self.assertEqual(Phone.objects.filter(stock=0).count(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total, job.processed), ('done', 5, 5))
+        self.assertEqual(sorted(Phone.objects.filter(stock=0).values_list('pk', flat=True)), selected)
+
+    def test_delete_everything_matching_the_filter(self):
+        url = reverse('admin:inventory_phone_changelist') + '?stock_range=1-5'
+        self.client.post(url, {
+            'action': 'delete_in_background', '_selected_action': [self.phones[0].pk], 'index': 0, 'select_across': 1,
+        })
+        self.assertEqual(Phone.objects.count(), 7)
+        self.run_jobs()
+        self.assertEqual(sorted(Phone.objects.values_list('stock', flat=True)), [6, 7])
+        job = BulkJob.objects.get()
+        self.assertEqual((job.selection, job.processed), ({'changelist': 'stock_range=1-5'}, 5))
+
+    def test_select_across_a_search(self):
+        url = reverse('admin:inventory_phone_changelist') + '?q=phone+7&p=0'
+        self.client.post(url, {
+            'action': 'set_stock', '_selected_action': [self.phones[6].pk], 'index': 0, 'select_across': 1,
+            'apply': 1, 'stock': 0,
+        })
+        job = BulkJob.objects.get()
+        self.assertEqual(job.selection, {'changelist': 'q=phone+7'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_jobs()
+        self.assertEqual(list(Phone.objects.filter(stock=0).values_list('pk', flat=True)), [self.phones[6].pk])
+        BulkJob.objects.filter(pk=job.pk).update(selection={}, status=BulkJob.QUEUED)
+        job.refresh_from_db()
+        with self.assertRaisesMessage(ValueError, 'The job has no selection'):
+            bulkjobs.run(job)
+        self.assertEqual(job.status, BulkJob.FAILED)
+
+    def test_interrupted_job_carries_on_from_its_cursor(self):
+        job = bulkjobs.queue(Phone.objects.all(), 'relist', 'Relist phones')
+        job.status = BulkJob.RUNNING
+        self.assertTrue(bulkjobs.run_chunk(job))
+        self.assertEqual((job.cursor, job.processed, Listing.objects.count()), (self.phones[1].pk, 2, 2))
+        job.save()
+        with mock.patch.object(listings, 'list_phones', wraps=listings.list_phones) as list_phones:
+            self.run_jobs()
+        self.assertEqual(list_phones.call_count, 3)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, Listing.objects.count()), ('done', 7, 7))
+
+    def test_failed_job(self):
+        bulkjobs.queue(Listing.objects.all(), 'relist', 'Relist listings')
+        bulk_job = bulkjobs.queue(Phone.objects.all(), 'set_stock', 'Set stock', {})
+        with self.assertLogs('inventory.jobs', 'ERROR'):
+            self.run_jobs()
+        bulk_job.refresh_from_db()
+        self.assertEqual((bulk_job.status, bulk_job.processed, bulk_job.error), ('failed', 0, "KeyError: 'stock'"))
+        job = Job.objects.get(task='bulk_job', args={'bulk_job': bulk_job.pk})
+        self.assertEqual((job.status, job.attempts, job.error), ('queued', 1, "KeyError: 'stock'"))
+        with self.assertRaises(ValueError):
+            bulkjobs.queue(Listing.objects.all(), 'set_stock', 'Set stock', {'stock': 1})
+
+
+@override_settings(JOB_RETRY_DELAY=60)
+class JobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Acme')
+        cls.phones = [
+            Phone.objects.create(name=f'Phone {index}', brand=brand, base_price=Decimal('100.00'), condition='Good')
+            for index in range(3)
+        ]
+        cls.platform = Platform.objects.create(name='X', fee_percentage=Decimal('10.00'), fixed_fee=Decimal('1.00'))
+
+    def setUp(self):
+        self.calls = []
+        tasks = mock.patch.dict(jobs.TASKS, {'flaky': (self.flaky, None)})
+        tasks.start()
+        self.addCleanup(tasks.stop)
+
+    def flaky(self, job, fail=True):
+        self.calls.append(job.attempts)
+        if fail:
+            raise RuntimeError('try again')
+        return 'fine'
+
+    def run_workers(self):
+        out = io.StringIO()
+        call_command('run_workers', '--burst', '--workers', '1', stdout=out)
+        return out.getvalue()
+
+    def test_claims_oldest_ready_job_once(self):
+        first = jobs.enqueue('noop')
+        second = jobs.enqueue('noop')
+        Job.objects.filter(pk=first.pk).update(run_after=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(jobs.claim('a').pk, first.pk)
+        claimed = jobs.claim('b')
+        self.assertEqual((claimed.pk, claimed.status, claimed.worker, claimed.attempts), (second.pk, 'running', 'b', 1))
+        self.assertIsNone(jobs.claim('c'))
+        with self.assertRaises(ValueError):
+            jobs.enqueue('no_such_task')
+
+    def test_reprice_from_the_admin(self):
+        listings.list_phones()
+        Platform.objects.filter(pk=self.platform.pk).update(fee_percentage=Decimal('20.00'))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = self.client.post(reverse('admin:inventory_platform_changelist'), {
+            'action': 'reprice_listings', '_selected_action': [self.platform.pk], 'index': 0,
+        }, follow=True)
+        job = Job.objects.get()
+        self.assertContains(response, reverse('admin:inventory_job_change', args=[job.pk]))
+        self.assertEqual(set(Listing.objects.values_list('platform_price', flat=True)), {Decimal('112.22')})
+        self.assertIn('Ran 1 jobs', self.run_workers())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.total), ('done', 3, 3))
+        self.assertTrue(job.message.startswith('X: repriced 3 listings'))
+        self.assertNotEqual(set(Listing.objects.values_list('platform_price', flat=True)), {Decimal('112.22')})
+        self.assertEqual(self.client.get(reverse('admin:inventory_job_changelist')).status_code, 200)
+
+    def test_relist_endpoint_queues_jobs(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret', is_staff=True))
+        response = self.client.post(reverse('bulk_relist'))
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Listing.objects.exists())
+        job = Job.objects.get()
+        self.assertEqual(response.json()['jobs'], [
+            {'id': job.pk, 'task': 'list_phones', 'url': reverse('admin:inventory_job_change', args=[job.pk])},
+        ])
+        self.run_workers()
+        self.assertEqual(Listing.objects.filter(is_listed=True).count(), 3)
+        response = self.client.post(reverse('bulk_relist'), {'reprice': '1', 'platform': [self.platform.pk]})
+        self.assertEqual([job['task'] for job in response.json()['jobs']], ['reprice_platform'])
+        self.assertEqual(Job.objects.get(pk=response.json()['jobs'][0]['id']).args, {'platform': self.platform.pk})
+
+    def test_relist_endpoint_rejects_bad_platform_ids(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret', is_staff=True))
+        for platform in ('x', '', '-1', str(2 ** 63)):
+            response = self.client.post(reverse('bulk_relist'), {'platform': [self.platform.pk, platform]})
+            self.assertEqual(response.status_code, 400, platform)
+            self.assertEqual(response.json(), {'success': False, 'error': 'platform must be a platform id.'})
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_jobs_are_retried_later_then_failed(self):
+        job = jobs.enqueue('flaky', max_attempts=2)
+        with self.assertLogs('inventory.jobs', 'ERROR'):
+            self.run_workers()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), ('queued', 1, 'RuntimeError: try again'))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=50))
+        self.assertIn('Ran 0 jobs', self.run_workers())
+        Job.objects.update(run_after=timezone.now())
+        with self.assertLogs('inventory.jobs', 'ERROR'):
+            self.run_workers()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, self.calls), ('failed', 2, [1, 2]))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_jobs_of_dead_workers_are_requeued(self):
+        alive = jobs.enqueue('flaky', {'fail': False})
+        dead = jobs.enqueue('flaky', {'fail': False})
+        spent = jobs.enqueue('flaky', {'fail': False}, max_attempts=1)
+        for job in (alive, dead, spent):
+            jobs.claim('gone')
+        Job.objects.exclude(pk=alive.pk).update(heartbeat=timezone.now() - timedelta(seconds=jobs.timeout() + 1))
+        self.run_workers()
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual((statuses[alive.pk], statuses[dead.pk], statuses[spent.pk]), ('running', 'done', 'failed'))
+        self.assertEqual(Job.objects.get(pk=dead.pk).attempts, 2)
+
+    def test_thumbnails_and_feeds(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'feed.csv')
+        with open(path, 'w') as f:
+            f.write('sku,name,base_price,condition\nA1,Comet,89.00,New\nA2,Nova,,New\n')
+        call_command('import_inventory', path, '--queue', stdout=io.StringIO())
+        call_command('build_image_derivatives', '--queue', '--source', 'phone', stdout=io.StringIO())
+        self.run_workers()
+        feed, thumbnails = Job.objects.order_by('pk')
+        self.assertEqual((feed.status, feed.max_attempts), ('done', 1))
+        self.assertIn('1 upserted, 1 rejected', feed.message)
+        self.assertIn('line 3', feed.message)
+        self.assertTrue(Phone.objects.filter(sku='A1', name='Comet').exists())
+        self.assertEqual((thumbnails.status, thumbnails.message), ('done', 'Built derivatives of 0 files for 0 rows.'))
@@ -14,6 +14,7 @@ urlpatterns = [
     path('features/', views.FeatureView.as_view(), name='features'),
     # Phone URLs
     path('phones/', views.PhoneListView.as_view(), name='phone_list'),
+    path('phones/search/', views.PhoneSearchView.as_view(), name='phone_search'),
     path('phones/<int:pk>/', views.PhoneDetailView.as_view(), name='phone_detail'),
     path('phones/add/', views.PhoneCreateView.as_view(), name='phone_add'),
     path('phones/<int:pk>/edit/', views.PhoneUpdateView.as_view(), name='phone_edit'),
@@ -27,6 +28,20 @@ urlpatterns = [
     # Listing URLs
     path('phones/<int:phone_pk>/list/', views.create_or_update_listing, name='create_or_update_listing'),
     path('listings/<int:listing_pk>/delist/', views.delist_phone, name='delist_phone'),
+    path('listings/relist/', views.bulk_relist, name='bulk_relist'),
+
+    # Cache metrics
+    path('cache/metrics/', views.cache_metrics, name='cache_metrics'),
+    # Request timings
+    path('ops/perf/', views.perf_dashboard, name='perf_dashboard'),
+    # Prometheus metrics
+    path('metrics', views.prometheus_metrics, name='metrics'),
+
+    # Order analytics
+    path('analytics/', views.analytics_dashboard, name='analytics_dashboard'),
+    path('analytics/api/', views.analytics_api, name='analytics_api'),
+    # Pricing simulator
+    path('pricing/simulator/', views.pricing_simulator, name='pricing_simulator'),
 
     # Order URLs
     path('phones/<int:phone_pk>/order/', views.create_order, name='create_order'),
@@ -48,4 +63,5 @@ urlpatterns = [
     path('cart/', views.view_cart, name='cart'),
     path('cart/add/<int:pk>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:pk>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/checkout/', views.checkout, name='checkout'),
 ]
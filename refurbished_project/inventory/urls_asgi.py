@@ -0,0 +1,26 @@
+# inventory/urls_asgi.py
+
+"""
+inventory.urls with the async variants of the storefront and form views swapped in.
+Used for requests served over ASGI (see inventory/asgi.py); names and routes are the
+same as in inventory.urls, so reverse() gives the same URLs.
+"""
+
+from django.urls import URLPattern
+
+from . import views
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'home': views.AsyncHomeView.as_view(),
+    'phone_list': views.AsyncPhoneListView.as_view(),
+    'phone_detail': views.AsyncPhoneDetailView.as_view(),
+    'submit_query': views.async_submit_query,
+    'sell_new_model': views.async_sell_new_model,
+}
+
+urlpatterns = [
+    URLPattern(pattern.pattern, ASYNC_VIEWS[pattern.name], pattern.default_args, pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
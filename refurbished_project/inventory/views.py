@@ -1,10 +1,22 @@
-from django.http import JsonResponse
-from django.shortcuts import render, get_object_or_404, redirect
+from decimal import Decimal
+from django.http import Http404, HttpResponse, JsonResponse
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.template.response import TemplateResponse
 from django.urls import reverse_lazy, reverse
 from django.db.models import Count
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
-from .models import Phone, Listing, Platform, Brand, Query, Order, Review
+from .models import Phone, Listing, Platform, Brand, Query, Cart, CartItem
 from .forms import ReviewForm
+from .catalog import CatalogQuery, DEFAULT_PAGE_SIZE, MAX_INT, SORT_OPTIONS
+from .facets import FacetEngine
+from . import analytics, cart, jobs, listings, metrics, perf, pricing, querybuffer, recommendations, search, stock
+from .querybudget import query_budget
+from .pagecache import cache_page_for_anonymous
+from .cache_backends import stats as cache_stats
+from .images import UploadedImagesMixin
+from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_POST
@@ -14,76 +26,165 @@ def is_staff(user):
     return user.is_staff
 
 @method_decorator(user_passes_test(is_staff), name='dispatch')
-class BrandCreateView(CreateView):
+class BrandCreateView(UploadedImagesMixin, CreateView):
     model = Brand
     template_name = 'inventory/add_brand.html'
     fields = ['name', 'logo']
+    image_fields = ('logo',)
     success_url = reverse_lazy('home')
 
+@method_decorator(query_budget(4), name='dispatch')
+@method_decorator(cache_page_for_anonymous(tags=('brand', 'phone')), name='dispatch')
 class BrandDetailView(DetailView):
     model = Brand
     template_name = 'inventory/brand_detail.html'
     context_object_name = 'brand'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # One keyset page of the brand's models instead of every row of brand.phone_set
+        catalog = CatalogQuery({'brand': self.object.pk, 'sort': 'name'})
+        page = catalog.page(self.request.GET.get('cursor'), fields=('id', 'name', 'image', 'image_variants'))
+        context['phones'] = page.items
+        context['next_cursor'] = page.next_cursor
+        return context
+
+@method_decorator(cache_page_for_anonymous(), name='dispatch')
 class FeatureView(TemplateView):
     template_name = 'inventory/features.html'
 
+@method_decorator(query_budget(3), name='dispatch')
+@method_decorator(cache_page_for_anonymous(tags=('brand', 'phone')), name='dispatch')
 class HomeView(TemplateView):
     template_name = 'inventory/home.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['brands'] = Brand.objects.annotate(phone_count=Count('phone'))
+        context.setdefault('brands', self.get_brands())
         return context
 
+    def get_brands(self):
+        return Brand.objects.annotate(phone_count=Count('phone'))
+
+@method_decorator(query_budget(10), name='dispatch')
+@method_decorator(cache_page_for_anonymous(tags=('brand', 'phone', 'review')), name='dispatch')
 class PhoneListView(ListView):
     model = Phone
     template_name = 'inventory/phone_list.html'
     context_object_name = 'phones'
+    page_size = DEFAULT_PAGE_SIZE
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        
-        memory = self.request.GET.get('memory')
-        if memory:
-            queryset = queryset.filter(memory=memory)
-            
-        min_price = self.request.GET.get('min_price')
-        if min_price:
-            queryset = queryset.filter(base_price__gte=min_price)
-            
-        max_price = self.request.GET.get('max_price')
-        if max_price:
-            queryset = queryset.filter(base_price__lte=max_price)
-            
-        condition = self.request.GET.get('condition')
-        if condition:
-            queryset = queryset.filter(condition=condition)
-            
-        color = self.request.GET.get('color')
-        if color:
-            queryset = queryset.filter(color__icontains=color)
-            
-        return queryset
+        # Filtering, sorting and keyset pagination live in inventory/catalog.py
+        self.catalog = CatalogQuery(self.request.GET, page_size=self.page_size)
+        self.page = self.catalog.page(self.request.GET.get('cursor'))
+        return self.page.items
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['sort_options'] = [(key, option[0]) for key, option in SORT_OPTIONS.items()]
+        context['current_sort'] = self.catalog.sort
+        if 'facets' not in context:
+            context['facets'] = FacetEngine(self.request.GET, catalog=self.catalog).facets()
+        context['is_first_page'] = not self.request.GET.get('cursor')
+
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        context['first_page_query'] = params.urlencode()
+        if self.page.has_next:
+            params['cursor'] = self.page.next_cursor
+            context['next_page_query'] = params.urlencode()
+        return context
 
+@method_decorator(query_budget(6), name='dispatch')
+class PhoneSearchView(TemplateView):
+    template_name = 'inventory/phone_search.html'
+    page_size = DEFAULT_PAGE_SIZE
+    # Ranked results are paged only this deep; the page number becomes an OFFSET in SQLite.
+    max_results = 10000
+
+    def get_page_number(self):
+        try:
+            page = max(1, int(self.request.GET.get('page', 1)))
+        except ValueError:
+            return 1
+        if (page - 1) * self.page_size >= self.max_results:
+            raise Http404('No such page of search results.')
+        return page
+
+    def get_results(self):
+        """
+        Returns (phones, has_next) for the requested page, ranked by BM25.
+        """
+        query = self.request.GET.get('q', '')
+        page = self.get_page_number()
+        phones = search.search(query, limit=self.page_size + 1, offset=(page - 1) * self.page_size)
+        return phones[:self.page_size], len(phones) > self.page_size
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'json':
+            phones, has_next = self.get_results()
+            return JsonResponse({
+                'results': [
+                    {
+                        'id': phone.pk,
+                        'name': phone.name,
+                        'brand': phone.brand.name if phone.brand else None,
+                        'price': str(phone.base_price),
+                        'url': reverse('phone_detail', kwargs={'pk': phone.pk}),
+                    }
+                    for phone in phones
+                ],
+                'has_next': has_next,
+                'suggestion': None if phones else search.suggest(request.GET.get('q', '')),
+            })
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '')
+        phones, has_next = self.get_results()
+        page = self.get_page_number()
+        context['query'] = query
+        context['phones'] = phones
+        context['page_number'] = page
+        context['has_next'] = has_next
+        # Only spend the vocabulary lookups when the query found nothing.
+        context['suggestion'] = search.suggest(query) if not phones and page == 1 else None
+        return context
+
+@method_decorator(query_budget(8), name='dispatch')
+@method_decorator(cache_page_for_anonymous(tags=('brand', 'phone', 'review', 'listing')), name='dispatch')
 class PhoneDetailView(DetailView):
     model = Phone
     template_name = 'inventory/phone_details.html'
     context_object_name = 'phone'
+    queryset = Phone.objects.select_related('brand')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['reviews'] = self.object.reviews.all().order_by('-created_at')
         context['review_form'] = ReviewForm()
-        # Get related products (other phones from the same brand)
-        context['related_phones'] = Phone.objects.filter(brand=self.object.brand).exclude(pk=self.object.pk)[:4]
+        # AsyncPhoneDetailView passes these in, already fetched.
+        if 'reviews' not in context:
+            context['reviews'] = self.get_reviews()
+            context['related_phones'] = self.get_related_phones()
+            # Fees, mapped condition and price on every platform, cached per phone (inventory/listings.py)
+            context['potential_listings'] = listings.potential_listings(self.object)
         return context
 
+    def get_reviews(self):
+        return self.object.reviews.select_related('user').order_by('-created_at')
+
+    def get_related_phones(self):
+        # Nearest neighbours precomputed by rebuild_recommendations (inventory/recommendations.py)
+        return recommendations.related_phones(self.object.pk)
+
 @method_decorator(user_passes_test(is_staff), name='dispatch')
-class PhoneCreateView(CreateView):
+class PhoneCreateView(UploadedImagesMixin, CreateView):
     model = Phone
     template_name = 'inventory/phone_form.html'
     fields = ['name', 'base_price', 'condition', 'stock', 'memory', 'image']
+    image_fields = ('image',)
 
     def form_valid(self, form):
         form.instance.brand = get_object_or_404(Brand, pk=self.kwargs['brand_pk'])
@@ -93,10 +194,11 @@ class PhoneCreateView(CreateView):
         return reverse('brand_detail', kwargs={'pk': self.kwargs['brand_pk']})
 
 @method_decorator(user_passes_test(is_staff), name='dispatch')
-class PhoneUpdateView(UpdateView):
+class PhoneUpdateView(UploadedImagesMixin, UpdateView):
     model = Phone
     template_name = 'inventory/phone_form.html'
     fields = ['name', 'base_price', 'condition', 'stock', 'memory', 'image']
+    image_fields = ('image',)
     success_url = reverse_lazy('phone_list')
 
 @method_decorator(user_passes_test(is_staff), name='dispatch')
@@ -110,52 +212,168 @@ def create_or_update_listing(request, phone_pk):
     platform_id = request.POST.get('platform')
     if platform_id:
         platform = get_object_or_404(Platform, pk=platform_id)
-        listing, created = Listing.objects.get_or_create(phone=phone, platform=platform)
-        
-        listing.platform_price = listing.calculate_platform_price()
-        listing.platform_condition_category = listing.map_condition_to_platform()
-        listing.is_listed = True
-        listing.save()
+        # Price from the phone and platform already in hand rather than lazy-loading them again
+        priced = Listing(phone=phone, platform=platform)
+        Listing.objects.update_or_create(
+            phone=phone,
+            platform=platform,
+            defaults={
+                'platform_price': priced.calculate_platform_price(),
+                'platform_condition_category': priced.map_condition_to_platform(),
+                'is_listed': True,
+            },
+        )
     return redirect('phone_detail', pk=phone_pk)
 
 def delist_phone(request, listing_pk):
     listing = get_object_or_404(Listing, pk=listing_pk)
-    phone_pk = listing.phone.pk
+    phone_pk = listing.phone_id
     listing.is_listed = False
-    listing.save()
+    listing.save(update_fields=['is_listed'])
     return redirect('phone_detail', pk=phone_pk)
 
+@user_passes_test(is_staff)
+def cache_metrics(request):
+    """
+    Cache hits and misses per key family in this process (inventory/cache_backends.py).
+    """
+    return JsonResponse({'families': cache_stats()})
+
+def analytics_report(request):
+    """
+    The analytics report for the request's start, end and group_by, or raises ValueError.
+    """
+    group_by = request.GET.get('group_by') or 'day'
+    if group_by not in analytics.GROUPINGS:
+        raise ValueError(f"group_by must be one of {', '.join(analytics.GROUPINGS)}.")
+    start, end = analytics.parse_range(request.GET)
+    return analytics.report(start, end, group_by)
+
+@user_passes_test(is_staff)
+@query_budget(8)
+def analytics_dashboard(request):
+    """
+    Revenue, units, buy-backs and sell-through from the daily order rollups.
+    """
+    try:
+        report, error = analytics_report(request), None
+    except ValueError as exc:
+        report, error = analytics.report(*analytics.parse_range({})), str(exc)
+    return render(request, 'inventory/analytics.html', {
+        'report': report,
+        'error': error,
+        'groupings': list(analytics.GROUPINGS),
+        'max_revenue': max((row['revenue'] for row in report['rows']), default=0),
+    })
+
+@user_passes_test(is_staff)
+@query_budget(8)
+def analytics_api(request):
+    """
+    JSON version of the analytics dashboard: ?start=YYYY-MM-DD&end=YYYY-MM-DD&group_by=day|brand|condition.
+    """
+    try:
+        return JsonResponse(analytics_report(request))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+@user_passes_test(is_staff)
+@query_budget(6)
+def pricing_simulator(request):
+    """
+    What-if pricing: every phone on every platform under hypothetical fees and a target margin.
+    """
+    current = [pricing.Terms.of(platform) for platform in Platform.objects.order_by('name')]
+    try:
+        scenario, margin = pricing.parse_scenario(request.GET, current)
+        error = None
+    except ValueError as exc:
+        scenario, margin, error = current, 0, str(exc)
+    simulation = pricing.simulate(scenario, margin, current=current)
+    return render(request, 'inventory/pricing_simulator.html', {
+        'simulation': simulation,
+        'rows': [
+            {'terms': terms, **platform} for terms, platform in zip(scenario, simulation.platforms)
+        ],
+        'error': error,
+    })
+
+@user_passes_test(is_staff)
+@query_budget(4)
+def perf_dashboard(request):
+    """
+    Latency percentiles, queries and SQL/template time per URL name for the recent requests
+    served by this process (inventory/perf.py), with the slowest requests and saved profiles.
+    """
+    return render(request, 'inventory/perf.html', {
+        'rows': perf.summary(),
+        'slowest': perf.slowest(),
+        'profiles': perf.saved_profiles()[:20],
+        'buffer_size': perf.buffer_size(),
+        'sample_rate': perf.sample_rate(),
+        'threshold': perf.profile_threshold(),
+    })
+
+@query_budget(2)
+def prometheus_metrics(request):
+    """
+    Counters, histograms and gauges for Prometheus to scrape (inventory/metrics.py).
+    """
+    if not metrics.authorized(request):
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@require_POST
+@user_passes_test(is_staff)
+def bulk_relist(request):
+    """
+    Queues a job listing every phone on the chosen platforms (all by default), or with
+    reprice=1 one job per platform only refreshing prices of existing listings, e.g. after
+    a fee change. Answers 202 with the jobs, for following in the admin, as the Platform
+    admin actions do; run_workers does the work.
+    """
+    try:
+        platform_ids = [int(pk) for pk in request.POST.getlist('platform')]
+    except ValueError:
+        platform_ids = [0]
+    if not all(0 < pk <= MAX_INT for pk in platform_ids):
+        return JsonResponse({'success': False, 'error': 'platform must be a platform id.'}, status=400)
+    platforms = Platform.objects.all()
+    if platform_ids:
+        platforms = platforms.filter(pk__in=platform_ids)
+    if request.POST.get('reprice'):
+        queued = [
+            jobs.enqueue('reprice_platform', {'platform': platform.pk}, user=request.user) for platform in platforms
+        ]
+    else:
+        platform_args = [platform.pk for platform in platforms] if platform_ids else None
+        queued = [jobs.enqueue('list_phones', {'platforms': platform_args}, user=request.user)]
+    return JsonResponse({'success': True, 'jobs': [
+        {'id': job.pk, 'task': job.task, 'url': reverse('admin:inventory_job_change', args=[job.pk])} for job in queued
+    ]}, status=202)
+
 def create_order(request, phone_pk):
     phone = get_object_or_404(Phone, pk=phone_pk)
     if request.method == 'POST':
         order_type = request.POST.get('order_type')
-        camera_quality = request.POST.get('camera_quality')
-        color = request.POST.get('color')
-        memory = request.POST.get('memory')
 
         if order_type == 'BUY':
-            if phone.stock > 0:
-                phone.stock -= 1
-                phone.save()
-                Order.objects.create(
-                    phone=phone,
-                    order_type='BUY',
-                    quantity=1,
-                    total_price=phone.base_price,
-                    status='COMPLETED'
-                )
+            try:
+                stock.buy(phone)
+            except stock.OutOfStock:
+                messages.error(request, f"Sorry, {phone.name} is out of stock.")
         elif order_type == 'SELL':
-            phone.stock += 1
-            phone.save()
-            Order.objects.create(
-                phone=phone,
-                order_type='SELL',
-                quantity=1,
-                total_price=phone.base_price, # Assuming sell price is base price for now
-                status='COMPLETED'
-            )
+            stock.sell(phone)
     return redirect('phone_detail', pk=phone_pk)
 
+def query_buffer_full_response():
+    """
+    Back-pressure answer for the chatbot when the query buffer is full.
+    """
+    return JsonResponse(
+        {'success': False, 'error': querybuffer.BUSY_MESSAGE}, status=503, headers={'Retry-After': str(querybuffer.RETRY_AFTER)}
+    )
+
 @csrf_exempt
 @require_POST
 def submit_query(request):
@@ -167,12 +385,12 @@ def submit_query(request):
         if not all([name, email, message]):
             return JsonResponse({'success': False, 'error': 'All fields are required.'})
 
-        Query.objects.create(
-            name=name,
-            email=email,
-            message=message
-        )
+        querybuffer.submit(Query(name=name, email=email, message=message))
         return JsonResponse({'success': True})
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': ' '.join(e.messages)})
+    except querybuffer.BufferFull:
+        return query_buffer_full_response()
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
@@ -202,46 +420,162 @@ def add_review(request, pk):
         return redirect('phone_detail', pk=pk)
     return redirect('phone_detail', pk=pk)
 
+def new_model_query(post):
+    """
+    Unsaved Query for a sell-new-model form submission.
+    """
+    message = f"New phone submission:\n\n" \
+              f"Phone Name: {post.get('phone_name')}\n" \
+              f"Brand: {post.get('brand')}\n" \
+              f"Condition: {post.get('condition')}\n" \
+              f"Comments: {post.get('comments')}"
+    return Query(name=post.get('name'), email=post.get('email'), message=message)
+
 def sell_new_model(request):
     if request.method == 'POST':
-        name = request.POST.get('name')
-        email = request.POST.get('email')
-        phone_name = request.POST.get('phone_name')
-        brand = request.POST.get('brand')
-        condition = request.POST.get('condition')
-        comments = request.POST.get('comments')
-
-        message = f"New phone submission:\n\n" \
-                  f"Phone Name: {phone_name}\n" \
-                  f"Brand: {brand}\n" \
-                  f"Condition: {condition}\n" \
-                  f"Comments: {comments}"
-
-        Query.objects.create(
-            name=name,
-            email=email,
-            message=message
-        )
+        try:
+            querybuffer.submit(new_model_query(request.POST))
+        except ValidationError as e:
+            for error in e.messages:
+                messages.error(request, error)
+            return render(request, 'inventory/sell_new_model.html', status=400)
+        except querybuffer.BufferFull:
+            messages.error(request, querybuffer.BUSY_MESSAGE)
+            response = render(request, 'inventory/sell_new_model.html', status=503)
+            response['Retry-After'] = str(querybuffer.RETRY_AFTER)
+            return response
         return redirect('home') # Or a 'thank you' page
     return render(request, 'inventory/sell_new_model.html')
 
-@login_required
+@require_POST
 def add_to_cart(request, pk):
     phone = get_object_or_404(Phone, pk=pk)
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, phone=phone)
-    if not created:
-        cart_item.quantity += 1
-    cart_item.save()
+    if not request.user.is_authenticated:
+        # Anonymous carts live in a cookie and hold no stock until login (see inventory/cart.py)
+        cookie_cart = cart.cookie_cart(request)
+        if phone.stock < cookie_cart.quantities.get(phone.pk, 0) + 1:
+            messages.error(request, f"Sorry, {phone.name} is out of stock.")
+            return redirect('phone_detail', pk=pk)
+        try:
+            cookie_cart.add(phone.pk)
+        except cart.CartFull:
+            messages.error(request, f"Your cart is full. Log in to add more than {cart.MAX_LINES} different phones.")
+        return redirect('cart')
+    user_cart, created = Cart.objects.get_or_create(user=request.user)
+    # Hold the unit for the cart so it can't be sold to someone else before checkout
+    try:
+        cart.add(user_cart, phone)
+    except stock.OutOfStock:
+        messages.error(request, f"Sorry, {phone.name} is out of stock.")
+        return redirect('phone_detail', pk=pk)
+    cart.forget_count(request)
     return redirect('cart')
 
-@login_required
+@query_budget(5)
 def view_cart(request):
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    return render(request, 'inventory/cart.html', {'cart': cart})
+    if request.user.is_authenticated:
+        items = list(CartItem.objects.filter(cart__user=request.user).select_related('phone__brand').order_by('pk'))
+    else:
+        items = cart.cookie_cart(request).items()
+    return render(request, 'inventory/cart.html', {
+        'items': items,
+        'total': sum((item.phone.base_price * item.quantity for item in items), Decimal('0.00')),
+        # The page has just counted the cart, so the header badge needs no query of its own.
+        'cart_count': sum(item.quantity for item in items),
+    })
 
-@login_required
+@require_POST
 def remove_from_cart(request, pk):
-    cart_item = get_object_or_404(CartItem, pk=pk, cart__user=request.user)
+    """
+    Takes a phone (by phone id) out of the visitor's cart.
+    """
+    if not request.user.is_authenticated:
+        cart.cookie_cart(request).remove(pk)
+        return redirect('cart')
+    cart_item = get_object_or_404(CartItem, phone_id=pk, cart__user=request.user)
+    stock.release(cart_item.cart_id, cart_item.phone_id)
     cart_item.delete()
+    cart.forget_count(request)
     return redirect('cart')
+
+@require_POST
+@login_required
+def checkout(request):
+    user_cart = get_object_or_404(Cart, user=request.user)
+    try:
+        orders = stock.checkout(user_cart)
+    except stock.OutOfStock as exc:
+        phone = Phone.objects.filter(pk=exc.phone_id).only('name').first()
+        messages.error(request, f"Sorry, there isn't enough stock of {phone.name if phone else 'an item'} left.")
+        return redirect('cart')
+    cart.forget_count(request)
+    if orders:
+        messages.success(request, f"Thank you! {len(orders)} order(s) placed.")
+    return redirect('cart')
+
+# Async variants of the busiest storefront views and of the chatbot/sell forms. They are
+# routed in place of the views above only when the site is served over ASGI (see
+# inventory/asgi.py and refurbished_project/urls_asgi.py), so a request waiting on the
+# database doesn't hold a worker thread; under WSGI the sync views stay in place.
+
+class AsyncHomeView(HomeView):
+    async def get(self, request, *args, **kwargs):
+        brands = [brand async for brand in self.get_brands()]
+        return self.render_to_response(self.get_context_data(brands=brands, **kwargs))
+
+class AsyncPhoneListView(PhoneListView):
+    async def get(self, request, *args, **kwargs):
+        self.catalog = CatalogQuery(request.GET, page_size=self.page_size)
+        self.page = await self.catalog.apage(request.GET.get('cursor'))
+        self.object_list = self.page.items
+        # Facet counts come from the cache or the raw SQL in inventory/facets.py.
+        facets = await sync_to_async(FacetEngine(request.GET, catalog=self.catalog).facets)()
+        return self.render_to_response(self.get_context_data(facets=facets))
+
+class AsyncPhoneDetailView(PhoneDetailView):
+    async def get(self, request, *args, **kwargs):
+        self.object = await aget_object_or_404(self.get_queryset(), pk=kwargs['pk'])
+        context = self.get_context_data(
+            object=self.object,
+            reviews=[review async for review in self.get_reviews()],
+            related_phones=[phone async for phone in self.get_related_phones()],
+            potential_listings=await sync_to_async(listings.potential_listings)(self.object),
+        )
+        return self.render_to_response(context)
+
+@csrf_exempt
+@require_POST
+async def async_submit_query(request):
+    try:
+        name = request.POST.get('name')
+        email = request.POST.get('email')
+        message = request.POST.get('message')
+
+        if not all([name, email, message]):
+            return JsonResponse({'success': False, 'error': 'All fields are required.'})
+
+        querybuffer.submit(Query(name=name, email=email, message=message))
+        return JsonResponse({'success': True})
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'error': ' '.join(e.messages)})
+    except querybuffer.BufferFull:
+        return query_buffer_full_response()
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+async def async_sell_new_model(request):
+    if request.method == 'POST':
+        try:
+            querybuffer.submit(new_model_query(request.POST))
+        except ValidationError as e:
+            for error in e.messages:
+                messages.error(request, error)
+            return TemplateResponse(request, 'inventory/sell_new_model.html', status=400)
+        except querybuffer.BufferFull:
+            messages.error(request, querybuffer.BUSY_MESSAGE)
+            return TemplateResponse(
+                request, 'inventory/sell_new_model.html', status=503, headers={'Retry-After': str(querybuffer.RETRY_AFTER)}
+            )
+        return redirect('home')
+    # Rendered by Django in a thread: the context processors read the session and user.
+    return TemplateResponse(request, 'inventory/sell_new_model.html')
@@ -1,6 +1,7 @@
 # refurbished_phones/settings.py
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.perf.PerfMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -38,13 +40,110 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'inventory.cart.CartCookieMiddleware',
+    'inventory.pagecache.AnonymousPageCacheMiddleware',
+    'inventory.querybudget.QueryBudgetMiddleware',
+    'inventory.database.ReadReplicaMiddleware',
 ]
 
+# Per-request SQL query budgets (see inventory/querybudget.py). Views without their own
+# @query_budget get the default; going over logs a warning unless QUERY_BUDGET_RAISE is set.
+QUERY_BUDGET_DEFAULT = 30
+QUERY_BUDGET_RAISE = False
+
+# Per-request timings (inventory/perf.py): queries, SQL, template and total time of the last
+# PERF_BUFFER_SIZE requests in each process, shown per URL name at /ops/perf/ (0 turns it off).
+# Set PERF_PROFILE_SAMPLE_RATE above 0 to run that fraction of requests under PERF_PROFILER
+# ('cprofile' or 'pyinstrument') and keep the profiles of those slower than PERF_PROFILE_THRESHOLD
+# seconds in PERF_PROFILE_DIR (the newest PERF_PROFILE_KEEP).
+PERF_BUFFER_SIZE = 5000
+PERF_PROFILE_SAMPLE_RATE = 0
+PERF_PROFILER = 'cprofile'
+PERF_PROFILE_THRESHOLD = 0.5
+PERF_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PERF_PROFILE_KEEP = 100
+
+# Prometheus metrics at /metrics (inventory/metrics.py). Every process adds to its own
+# memory-mapped file in METRICS_DIR, which must be shared by all the workers of a server;
+# None turns metrics off. Set METRICS_TOKEN to require "Authorization: Bearer <token>".
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'refurbished_project_metrics')
+METRICS_TOKEN = None
+
+# Write-behind buffer for chatbot and sell-form queries (see inventory/querybuffer.py).
+# Submissions are written in batches by a background thread; once QUERY_BUFFER_SIZE are
+# waiting, new ones get a 503. Set QUERY_BUFFER_SPOOL to None to keep them in memory only.
+QUERY_BUFFER_SIZE = 1000
+QUERY_BUFFER_BATCH_SIZE = 100
+QUERY_BUFFER_FLUSH_INTERVAL = 0.5
+QUERY_BUFFER_SPOOL = os.path.join(BASE_DIR, 'query_spool')
+
+# Responsive images (inventory/images.py): AVIF and WebP copies of uploaded phone images and
+# brand logos at these widths, encoded by IMAGE_WORKERS background threads (0: in the request).
+IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640, 960)
+IMAGE_DERIVATIVE_FORMATS = {'avif': 50, 'webp': 80}  # format -> quality
+IMAGE_WORKERS = 2
+
+# Seconds a cart holds stock before sweep_reservations returns it (see inventory/stock.py).
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Background jobs (inventory/jobs.py), run by run_workers. A failed job is tried again
+# JOB_RETRY_DELAY seconds later, doubling each time, up to JOB_MAX_ATTEMPTS attempts in all.
+# Running jobs whose worker hasn't reported for JOB_TIMEOUT seconds are queued again.
+# Idle workers look for new jobs every JOB_POLL_INTERVAL seconds.
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+JOB_TIMEOUT = 15 * 60
+JOB_POLL_INTERVAL = 1.0
+
+# Bulk actions queued from the admin changelists (inventory/bulkjobs.py) are done this
+# many rows per transaction.
+BULK_JOB_CHUNK_SIZE = 500
+
+# Related phones on the detail page (inventory/recommendations.py): how many are kept per
+# phone, and how many phones either side of it in price order are compared with it.
+RELATED_PHONES = 4
+RECOMMENDATION_WINDOW = 1000
+
+# Carts of visitors who aren't logged in are kept in a signed cookie for this many seconds
+# and merged into their Cart when they log in (see inventory/cart.py).
+CART_COOKIE_AGE = 30 * 24 * 60 * 60
+
+# Two-tier cache (inventory/cache_backends.py): a per-process LRU in front of a file cache
+# shared by all processes. Local copies expire after LOCAL_TIMEOUT seconds.
+CACHES = {
+    'default': {
+        'BACKEND': 'inventory.cache_backends.TieredCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'LOCAL': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'OPTIONS': {'MAX_ENTRIES': 5000},
+            },
+            'SHARED': {
+                'BACKEND': 'inventory.cache_backends.FileCache',
+                'LOCATION': os.path.join(tempfile.gettempdir(), 'refurbished_project_cache'),
+                'OPTIONS': {'MAX_ENTRIES': 50000},
+            },
+            'LOCAL_TIMEOUT': 5,
+        },
+    }
+}
+
+# Tests run with METRICS_DIR, the file cache tier and QUERY_BUFFER_SPOOL moved to a
+# temporary directory (inventory/runner.py), away from those of a running server.
+TEST_RUNNER = 'inventory.runner.IsolatedTestRunner'
+
+# Anonymous storefront pages (inventory/pagecache.py)
+PAGE_CACHE_TIMEOUT = 10 * 60
+
 ROOT_URLCONF = 'refurbished_project.urls'
+# Used for requests served over ASGI (inventory/asgi.py): the same site with the async storefront views.
+ASGI_URLCONF = 'refurbished_project.urls_asgi'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for inventory/perf.py.
+        'BACKEND': 'inventory.perf.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')], # Add templates directory
         'APP_DIRS': True,
         'OPTIONS': {
@@ -53,6 +152,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'inventory.pagecache.cache_tags',
+                'inventory.cart.cart_count',
             ],
         },
     },
@@ -64,11 +165,36 @@ WSGI_APPLICATION = 'refurbished_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Connections are kept for CONN_MAX_AGE seconds and checked before reuse. 'replica' serves
+# the reads of list and detail pages (inventory/database.py); for SQLite it is a read-only
+# set of connections to the same file. Remove it to send everything to 'default'.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 300,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 300,
+        'CONN_HEALTH_CHECKS': True,
+        'PRAGMAS': {'query_only': 'ON'},
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['inventory.database.ReadReplicaRouter']
+
+# Run on every new SQLite connection (inventory/database.py). A value of None keeps SQLite's default.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # milliseconds
+    'cache_size': -32000,  # negative: KiB, i.e. 32MB per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
 
 
@@ -107,10 +233,28 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+# collectstatic copies static files here with content-hashed names and gzip/brotli copies.
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'inventory.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Serve STATIC_ROOT and MEDIA_ROOT from the site itself, with ETags, byte ranges and
+# Cache-Control (inventory/fileserver.py). Content-hashed files are cached for a year;
+# the others for these many seconds.
+SERVE_FILES = True
+STATIC_MAX_AGE = 60
+MEDIA_MAX_AGE = 24 * 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -5,11 +5,15 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from inventory import fileserver
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('inventory/', include('inventory.urls')), # Include our app's URLs
     path('', include('inventory.urls')), # Make inventory the default page
 ]
 
-if settings.DEBUG:
+if getattr(settings, 'SERVE_FILES', False):
+    urlpatterns += fileserver.urlpatterns()
+elif settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,20 @@
+# refurbished_phones/urls_asgi.py
+
+from django.contrib import admin
+from django.urls import path, include
+from django.conf import settings
+from django.conf.urls.static import static
+
+from inventory import fileserver
+
+# Same as urls.py, with the async storefront views; used when serving over ASGI.
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('inventory/', include('inventory.urls_asgi')),
+    path('', include('inventory.urls_asgi')),
+]
+
+if getattr(settings, 'SERVE_FILES', False):
+    urlpatterns += fileserver.urlpatterns()
+elif settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)